@@ -0,0 +1,91 @@
+import random
+import timeit
+from decimal import Decimal, getcontext
+from src.crypto.market.book import DepthBook, ticks_to_price
+from src.crypto.market.calculations import calculate_orderbook_depth, calculate_orderbook_spread, calculate_real_fair_price, subtract_orderbooks
+from src.model import OrderBook, OrderLevel, FAIR_PRICE_LEVELS
+
+LEVELS = 500
+UPDATES = 20_000
+MID_TICK = 1_000
+
+
+def random_level(side: str) -> tuple[int, int]:
+    # mostly near the top of the book, sometimes removing a level so the best prices and the mid move
+    distance = int(random.expovariate(1 / 15))
+    tick = MID_TICK + 1 + distance if side == 'ask' else MID_TICK - 1 - distance
+    size = 0 if random.random() < 0.3 else random.randint(1, 10_000_000) * 10 ** 6
+    return tick, size
+
+
+def make_updates() -> list[tuple[list[tuple[int, int]], list[tuple[int, int]]]]:
+    return [([random_level('ask') for _ in range(random.randint(0, 3))], [random_level('bid') for _ in range(random.randint(0, 3))]) for _ in range(UPDATES)]
+
+
+def make_own_orders(book: DepthBook) -> OrderBook:
+    # five orders per side on consecutive ticks from the top, sometimes larger than the level they sit on
+    asks = [OrderLevel(id=f'a{i}', price=ticks_to_price(book.best_ask + i), size=Decimal(random.randint(0, 200_000))) for i in range(5)]
+    bids = [OrderLevel(id=f'b{i}', price=ticks_to_price(book.best_bid - i), size=Decimal(random.randint(0, 200_000))) for i in range(5)]
+    return OrderBook(asks=asks, bids=bids)
+
+
+def make_book() -> DepthBook:
+    book = DepthBook()
+    asks = [(MID_TICK + 1 + i, random.randint(1, 10_000_000) * 10 ** 6) for i in range(LEVELS)]
+    bids = [(MID_TICK - 1 - i, random.randint(1, 10_000_000) * 10 ** 6) for i in range(LEVELS)]
+    book.load_snapshot(0, asks, bids)
+    return book
+
+
+def main():
+    getcontext().prec = 18
+    random.seed(1)
+    updates = make_updates()
+
+    # the values are checked against calculations.py in tests/test_book_analytics.py, this only times them
+    book = make_book()
+
+    def rescan():
+        for version, (asks, bids) in enumerate(updates, start=book.version + 1):
+            book.apply_diff(version, version, asks, bids)
+            orderbook = book.to_orderbook()
+            calculate_orderbook_depth(orderbook=orderbook, percent=Decimal('2'))
+            calculate_orderbook_depth(orderbook=orderbook, percent=Decimal('2'))
+            calculate_orderbook_spread(orderbook=orderbook)
+            calculate_real_fair_price(book.to_orderbook(depth=FAIR_PRICE_LEVELS))
+
+    def incremental():
+        for version, (asks, bids) in enumerate(updates, start=book.version + 1):
+            book.apply_diff(version, version, asks, bids)
+            book.analytics.market_depth(Decimal('2'))
+            book.analytics.market_depth(Decimal('2'))
+            book.analytics.spread
+            book.analytics.real_fair_price()
+
+    def apply_only():
+        for version, (asks, bids) in enumerate(updates, start=book.version + 1):
+            book.apply_diff(version, version, asks, bids)
+
+    for name, function in [('rescan per update', rescan), ('BookAnalytics per update', incremental), ('apply_diff alone', apply_only)]:
+        number = 1 if function is rescan else 5
+        seconds = min(timeit.repeat(function, number=1, repeat=number))
+        print(f'{name:<34} {seconds / UPDATES * 1_000_000:10.2f} us per update')
+
+    own_orders = make_own_orders(book)
+    top_of_book = book.to_orderbook(depth=FAIR_PRICE_LEVELS)
+    full_book = book.to_orderbook()
+
+    for name, function in [
+        ('subtract_orderbooks fair price', lambda: calculate_real_fair_price(subtract_orderbooks(book.to_orderbook(depth=FAIR_PRICE_LEVELS), own_orders))),
+        ('ExternalBook fair price', lambda: book.without(own_orders).real_fair_price()),
+        ('subtract_orderbooks full depth', lambda: subtract_orderbooks(full_book, own_orders)),
+        ('ExternalBook full depth', lambda: sum(1 for _ in book.without(own_orders).asks()) + sum(1 for _ in book.without(own_orders).bids()))
+    ]:
+        number = 100 if 'full' in name else 2_000
+        seconds = min(timeit.repeat(function, number=number, repeat=5))
+        print(f'{name:<34} {seconds / number * 1_000_000:10.2f} us per call')
+    print(f'({len(top_of_book.asks)} top levels, {len(full_book.asks) + len(full_book.bids)} levels in the full book)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import random
+import timeit
+from decimal import Decimal
+from google.protobuf.json_format import MessageToDict
+from src.crypto.mexc.decode import parse_message, decode_depth, decode_private_order, decode_private_account
+from src.crypto.mexc.websocket_proto import PushDataV3ApiWrapper_pb2
+
+FRAMES = 3_000
+
+
+def make_frames() -> list[bytes]:
+    random.seed(1)
+    frames = []
+
+    for i in range(FRAMES):
+        wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper(channel='spot@public.aggre.depth.v3.api.pb@100ms@RMVUSDT', symbol='RMVUSDT', sendTime=1_700_000_000_000 + i)
+        kind = random.random()
+
+        if kind < 0.8:
+            depth = wrapper.publicAggreDepths
+            depth.fromVersion, depth.toVersion = str(i * 2), str(i * 2 + 1)
+            for _ in range(random.randint(1, 10)):
+                level = depth.asks.add()
+                level.price, level.quantity = f'0.00{random.randint(100, 120)}', f'{random.randint(0, 200_000)}.{random.randint(0, 99):02d}'
+            for _ in range(random.randint(1, 10)):
+                level = depth.bids.add()
+                level.price, level.quantity = f'0.000{random.randint(80, 99)}', f'{random.randint(0, 200_000)}.{random.randint(0, 99):02d}'
+        elif kind < 0.9:
+            order = wrapper.privateOrders
+            order.id, order.price, order.quantity, order.remainQuantity, order.cumulativeQuantity = f'C02__{i}', '0.00101', '3000', '1000', '2000'
+            order.tradeType, order.status = random.choice([1, 2]), random.choice([1, 2, 3, 4])
+        else:
+            account = wrapper.privateAccount
+            account.vcoinName, account.balanceAmount, account.frozenAmount = random.choice(['RMV', 'USDT']), '123456.789', '1000'
+
+        frames.append(wrapper.SerializeToString())
+
+    return frames
+
+
+def message_to_dict_path(frames: list[bytes]):
+    for message in frames:
+        result = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper()
+        result.ParseFromString(message)
+        data = MessageToDict(result)
+
+        if 'publicAggreDepths' in data:
+            [(Decimal(str(ask['price'])), Decimal(str(ask['quantity']))) for ask in data['publicAggreDepths'].get('asks', [])]
+            [(Decimal(str(bid['price'])), Decimal(str(bid['quantity']))) for bid in data['publicAggreDepths'].get('bids', [])]
+        elif 'privateOrders' in data:
+            order = data['privateOrders']
+            order['status'], order['id'], Decimal(str(order['price'])), Decimal(str(order['quantity'])), Decimal(str(order['remainQuantity'])), Decimal(str(order['cumulativeQuantity']))
+        elif 'privateAccount' in data:
+            account = data['privateAccount']
+            account['vcoinName'], Decimal(str(account['balanceAmount'])), Decimal(str(account['frozenAmount']))
+
+
+def direct_path(frames: list[bytes]):
+    for message in frames:
+        wrapper = parse_message(message)
+        body = wrapper.WhichOneof('body')
+
+        if body == 'publicAggreDepths':
+            decode_depth(wrapper)
+        elif body == 'privateOrders':
+            decode_private_order(wrapper)
+        elif body == 'privateAccount':
+            decode_private_account(wrapper)
+
+
+def main():
+    frames = make_frames()
+
+    for name, function in [('MessageToDict', message_to_dict_path), ('direct field access', direct_path)]:
+        seconds = min(timeit.repeat(lambda: function(frames), number=1, repeat=5))
+        print(f'{name:<20} {seconds / len(frames) * 1_000_000:8.2f} us per frame')
+
+
+if __name__ == '__main__':
+    main()
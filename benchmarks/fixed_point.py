@@ -0,0 +1,69 @@
+import asyncio
+import random
+import sys
+import tempfile
+from decimal import Decimal, getcontext
+from loguru import logger
+from src.crypto.kucoin.client import KUCOIN_TICK_SIZE
+from src.crypto.market.book import SIZE_SCALE
+from src.database.archive import ArchiveWriter
+from src.mock.exchange import MockExchange
+from src.model import MockExchangeConfig, MEXC_TICK_SIZE
+from src.replay.engine import ReplayEngine, percentile
+
+MINUTES = 10
+KUCOIN_TICKS_PER_MEXC_TICK = int(MEXC_TICK_SIZE / KUCOIN_TICK_SIZE)
+
+
+def make_archive(directory: str, minutes: int = MINUTES):
+    # the mock exchange's random walk at 10 depth messages per second, KuCoin every second
+    exchange = MockExchange(MockExchangeConfig(mid_price_ticks=1_000, mid_moves_per_second=0.2, seed=5))
+    mexc = ArchiveWriter(directory=directory, stream='mexc', tick_size=MEXC_TICK_SIZE, size_scale=SIZE_SCALE)
+    kucoin = ArchiveWriter(directory=directory, stream='kucoin', tick_size=KUCOIN_TICK_SIZE, size_scale=SIZE_SCALE)
+    rng = random.Random(1)
+
+    timestamp_ns = 1_700_000_000_000_000_000
+    mexc.record_snapshot(timestamp_ns, [(tick, size * SIZE_SCALE) for tick, size in sorted(exchange.asks.items())], [(tick, size * SIZE_SCALE) for tick, size in sorted(exchange.bids.items())])
+    for i in range(minutes * 600):
+        timestamp_ns += 100_000_000
+        asks, bids, _ = exchange.step()
+        mexc.record_diff(timestamp_ns, [(tick, size * SIZE_SCALE) for tick, size in asks.items()], [(tick, size * SIZE_SCALE) for tick, size in bids.items()])
+        if i % 10 == 0:
+            mid = exchange.mid * KUCOIN_TICKS_PER_MEXC_TICK + rng.randint(-200, 200)
+            kucoin.record_snapshot(timestamp_ns, [(mid + 50 + j * 30, rng.randint(1_000, 100_000) * SIZE_SCALE) for j in range(50)], [(mid - 50 - j * 30, rng.randint(1_000, 100_000) * SIZE_SCALE) for j in range(50)])
+
+    mexc.close()
+    kucoin.close()
+
+
+async def replay(directory: str, fixed_point: bool) -> tuple[dict, list, list]:
+    balance = {'RMV': {'free': Decimal('500000'), 'locked': Decimal('0')}, 'USDT': {'free': Decimal('5000'), 'locked': Decimal('0')}}
+    engine = ReplayEngine(archive_dir=directory, balance=balance, fixed_point=fixed_point, seed=1)
+    try:
+        report = await engine.run()
+    finally:
+        engine.close()
+    return report, engine.decision_latencies, engine.mexc_client.sent_orders
+
+
+def main():
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+    getcontext().prec = 18
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_archive(directory)
+        results = {fixed_point: asyncio.run(replay(directory, fixed_point)) for fixed_point in (False, True)}
+
+    # that both modes send the same orders is tested in tests/test_fixed_point.py
+    print(f'replay of {MINUTES} minutes: {len(results[False][2])} orders with Decimal, {len(results[True][2])} with fixed point')
+
+    for fixed_point, (report, latencies, _) in results.items():
+        name = 'fixed point' if fixed_point else 'Decimal'
+        print(f'{name:<12} per tick: mean {sum(latencies) / len(latencies) * 1_000_000:7.1f} us  p50 {percentile(latencies, 50) * 1_000_000:7.1f} us  '
+              f'p99 {percentile(latencies, 99) * 1_000_000:7.1f} us  ({report["ticks"]} ticks, replay {report["wall_seconds"]:.2f} s)')
+
+
+if __name__ == '__main__':
+    main()
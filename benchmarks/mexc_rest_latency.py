@@ -0,0 +1,74 @@
+import asyncio
+import statistics
+import time
+from decimal import Decimal
+from typing import Optional
+import aiohttp
+from aiohttp import web
+from src.crypto.mexc.client import MexcClient
+from src.monitoring.metrics import RequestMetrics
+
+REQUESTS = 500
+
+
+async def handle_order(request: web.Request):
+    return web.json_response({'orderId': 'C02__1'})
+
+
+async def start_stub_server():
+    app = web.Application()
+    app.router.add_post('/api/v3/order', handle_order)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+class SessionPerRequestClient(MexcClient):
+    async def signed_request(self, method: str, path: str, params: dict, retries: int = 0, metrics: Optional[RequestMetrics] = None):
+        self.session = aiohttp.ClientSession()
+        try:
+            return await super().signed_request(method=method, path=path, params=params, retries=retries, metrics=metrics)
+        finally:
+            await self.session.close()
+
+
+async def measure(client: MexcClient) -> list[float]:
+    latencies = []
+
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        await client.place_limit_order(side='buy', order_type='limit', size=Decimal('1000'), price=Decimal('0.00123'))
+        latencies.append((time.perf_counter() - start) * 1_000_000)
+
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f'{name:<22} mean: {statistics.mean(latencies):8.1f} us  p50: {p50:8.1f} us  p99: {p99:8.1f} us')
+
+
+async def main():
+    runner, base_url = await start_stub_server()
+
+    try:
+        for name, client_class in [('session per request', SessionPerRequestClient), ('pooled session', MexcClient)]:
+            client = client_class(api_key='key', api_secret='secret', database_client=None)
+            client.rest_base_url = base_url
+
+            await measure(client)
+            report(name, await measure(client))
+            await client.close()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
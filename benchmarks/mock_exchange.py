@@ -0,0 +1,77 @@
+import asyncio
+import sys
+from decimal import getcontext
+from loguru import logger
+from src.crypto.kucoin.client import KucoinClient
+from src.crypto.market.tracking import process_tick
+from src.crypto.mexc.client import MexcClient
+from src.dispatcher import EventDispatcher
+from src.mock.exchange import MockExchange
+from src.model import MockExchangeConfig
+from src.monitoring.loop_lag import LoopLagMonitor
+from src.replay.clients import ReplayDatabaseClient
+
+SECONDS = 10
+REAL_DEPTH_RATE = 10
+
+
+async def decide(dispatcher: EventDispatcher, mexc_client: MexcClient, kucoin_client: KucoinClient, database_client: ReplayDatabaseClient):
+    while True:
+        tick = await dispatcher.next_tick()
+        if not tick.filled_orders and tick.mexc_update is None and tick.kucoin_update is None:
+            continue
+
+        try:
+            await process_tick(tick=tick, mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client)
+        except Exception as e:
+            logger.error(f'error: {e}')
+        dispatcher.record_decision(tick)
+
+
+async def run(multiplier: int) -> dict:
+    exchange = MockExchange(MockExchangeConfig(depth_rate=REAL_DEPTH_RATE * multiplier, kucoin_rate=REAL_DEPTH_RATE * multiplier, seed=1))
+    address = await exchange.start()
+
+    dispatcher = EventDispatcher(queue=asyncio.Queue())
+    database_client = ReplayDatabaseClient()
+    mexc_client = MexcClient(api_key='key', api_secret='secret', database_client=database_client, add_to_event_queue=dispatcher.put, ws_base_url=f'ws://{address}/ws', rest_base_url=f'http://{address}')
+    kucoin_client = KucoinClient(api_key='key', api_secret='secret', api_passphrase='passphrase', database_client=database_client, add_to_event_queue=dispatcher.put, rest_base_url=f'http://{address}')
+    loop_lag_monitor = LoopLagMonitor(threshold_ms=1000)
+
+    listen_key = await mexc_client.create_listen_key()
+    tasks = [
+        asyncio.create_task(loop_lag_monitor.run()),
+        asyncio.create_task(mexc_client.track_private(listen_key=listen_key)),
+        asyncio.create_task(mexc_client.update_orderbook()),
+        asyncio.create_task(kucoin_client.update_orderbook()),
+        asyncio.create_task(decide(dispatcher=dispatcher, mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client))
+    ]
+
+    await asyncio.sleep(SECONDS)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await mexc_client.close()
+    await kucoin_client.close()
+    await exchange.stop()
+
+    return {'exchange': exchange.get_stats(), 'dispatcher': dispatcher.get_stats(), 'loop_lag': loop_lag_monitor.get_stats(), 'quote_gate': mexc_client.quote_gate.get_stats()}
+
+
+async def main():
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+    getcontext().prec = 18
+
+    for multiplier in (1, 10, 100):
+        stats = await run(multiplier)
+        exchange, dispatcher, loop_lag, quote_gate = stats['exchange'], stats['dispatcher'], stats['loop_lag'], stats['quote_gate']
+        print(f'{multiplier:>3}x ({REAL_DEPTH_RATE * multiplier:>4} depth msg/s): '
+              f'events {dispatcher["events_received"] / SECONDS:7.1f}/s  ticks {dispatcher["ticks"] / SECONDS:7.1f}/s  merged {dispatcher["events_merged"]:6d}  '
+              f'latency avg {dispatcher["avg_latency_ms"]:6.2f} ms max {dispatcher["max_latency_ms"]:7.2f} ms  '
+              f'loop lag max {loop_lag["max_lag_ms"]:7.2f} ms  gate hits {quote_gate["hit_rate"]:6.1%}  orders placed {exchange["orders_placed"]} cancelled {exchange["orders_cancelled"]} filled {exchange["orders_filled"]}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
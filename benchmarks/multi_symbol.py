@@ -0,0 +1,68 @@
+import asyncio
+import sys
+from decimal import getcontext
+from loguru import logger
+from src.crypto.kucoin.client import KucoinClient
+from src.crypto.market.registry import SymbolRegistry
+from src.crypto.mexc.client import MexcClient
+from src.mock.exchange import MockExchange
+from src.model import MockExchangeConfig, Symbol, DEFAULT_SYMBOL
+from src.monitoring.loop_lag import LoopLagMonitor
+from src.replay.clients import ReplayDatabaseClient
+
+SECONDS = 10
+REAL_DEPTH_RATE = 10
+SYMBOL_COUNTS = (1, 10, 30, 60)
+
+
+async def run(count: int) -> dict:
+    # every symbol gets the mock's book, so each one sees the real depth rate and quotes on its own,
+    # and USDT is shared so it grows with the number of symbols
+    exchange = MockExchange(MockExchangeConfig(depth_rate=REAL_DEPTH_RATE, kucoin_rate=REAL_DEPTH_RATE, usdt_balance=MockExchangeConfig.usdt_balance * count, seed=1))
+    address = await exchange.start()
+
+    database_client = ReplayDatabaseClient()
+    mexc_client = MexcClient(api_key='key', api_secret='secret', database_client=database_client, ws_base_url=f'ws://{address}/ws', rest_base_url=f'http://{address}')
+    kucoin_client = KucoinClient(api_key='key', api_secret='secret', api_passphrase='passphrase', database_client=database_client, rest_base_url=f'http://{address}')
+    registry = SymbolRegistry(mexc_client=mexc_client, kucoin_client=kucoin_client)
+    for symbol in [DEFAULT_SYMBOL] + [Symbol(base=f'T{i}', quote='USDT') for i in range(1, count)]:
+        registry.add(symbol=symbol)
+    loop_lag_monitor = LoopLagMonitor(threshold_ms=1000)
+
+    listen_key = await mexc_client.create_listen_key()
+    tasks = [
+        asyncio.create_task(loop_lag_monitor.run()),
+        asyncio.create_task(mexc_client.track_private(listen_key=listen_key))
+    ] + registry.start(database_client=database_client)
+
+    await asyncio.sleep(SECONDS)
+    connections = len(exchange.sockets)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await mexc_client.close()
+    await kucoin_client.close()
+    await exchange.stop()
+
+    return {'connections': connections, 'exchange': exchange.get_stats(), 'dispatchers': registry.get_stats(), 'loop_lag': loop_lag_monitor.get_stats()}
+
+
+async def main():
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+    getcontext().prec = 18
+
+    for count in SYMBOL_COUNTS:
+        stats = await run(count)
+        dispatchers = stats['dispatchers'].values()
+        events = sum(dispatcher['events_received'] for dispatcher in dispatchers)
+        ticks = sum(dispatcher['ticks'] for dispatcher in dispatchers)
+        quoting = sum(1 for dispatcher in dispatchers if dispatcher['ticks'])
+        print(f'{count:>3} symbols: websockets {stats["connections"]:3d}  quoting {quoting:3d}  events {events / SECONDS:8.1f}/s  ticks {ticks / SECONDS:8.1f}/s  '
+              f'latency max {max(dispatcher["max_latency_ms"] for dispatcher in dispatchers):7.2f} ms  loop lag max {stats["loop_lag"]["max_lag_ms"]:7.2f} ms  '
+              f'orders placed {stats["exchange"]["orders_placed"]}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
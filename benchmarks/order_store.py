@@ -0,0 +1,107 @@
+import random
+import timeit
+from decimal import Decimal
+from src.crypto.market.book import ticks_to_price
+from src.crypto.market.orders import ActiveOrderStore
+from src.model import OrderBook, OrderLevel
+
+OPERATIONS = 20_000
+ORDERS_PER_SIDE = (5, 50, 500)
+MID_TICK = 1_000
+
+
+class ListOrders:
+    # the lists of OrderLevel the clients kept before, with their linear scans and sorts
+    def __init__(self):
+        self.orders = OrderBook(asks=[], bids=[])
+
+    def add(self, side: str, order_id: str, price: Decimal, size: Decimal) -> bool:
+        orders = self.orders.bids if side == 'buy' else self.orders.asks
+        if any(order_id == order.id for order in orders):
+            return False
+        orders.append(OrderLevel(id=order_id, price=price, size=size))
+        orders.sort(key=lambda order: order.price, reverse=side == 'buy')
+        return True
+
+    def remove(self, side: str, order_id: str):
+        orders = self.orders.bids if side == 'buy' else self.orders.asks
+        for i in range(len(orders) - 1, -1, -1):
+            if orders[i].id == order_id:
+                del orders[i]
+                break
+
+    def resize(self, side: str, order_id: str, size: Decimal):
+        orders = self.orders.bids if side == 'buy' else self.orders.asks
+        for i in range(len(orders) - 1, -1, -1):
+            if orders[i].id == order_id:
+                orders[i].size = size
+
+
+def make_operations(orders_per_side: int) -> list[tuple]:
+    # keeps about orders_per_side orders on each side, prices repeat so that orders share levels
+    operations = []
+    open_orders = {'sell': [], 'buy': []}
+    for i in range(OPERATIONS):
+        side = random.choice(('sell', 'buy'))
+        orders = open_orders[side]
+        action = random.random()
+        if len(orders) < orders_per_side or action < 0.4:
+            distance = random.randint(1, orders_per_side)
+            price = ticks_to_price(MID_TICK + distance if side == 'sell' else MID_TICK - distance)
+            order_id = str(i)
+            orders.append(order_id)
+            operations.append(('add', side, order_id, price, Decimal(random.randint(1, 5_000))))
+        elif action < 0.8:
+            operations.append(('remove', side, orders.pop(random.randrange(len(orders)))))
+        else:
+            operations.append(('resize', side, random.choice(orders), Decimal(random.randint(1, 5_000))))
+    return operations
+
+
+def apply_lists(operations: list[tuple]) -> ListOrders:
+    orders = ListOrders()
+    for operation in operations:
+        if operation[0] == 'add':
+            orders.add(*operation[1:])
+        elif operation[0] == 'remove':
+            orders.remove(*operation[1:])
+        else:
+            orders.resize(*operation[1:])
+    return orders
+
+
+def apply_store(operations: list[tuple]) -> ActiveOrderStore:
+    store = ActiveOrderStore()
+    for operation in operations:
+        if operation[0] == 'add':
+            store.add(side=operation[1], order_id=operation[2], price=operation[3], size=operation[4])
+        elif operation[0] == 'remove':
+            store.remove(order_id=operation[2])
+        else:
+            store.resize(order_id=operation[2], size=operation[3])
+    return store
+
+
+def main():
+    random.seed(1)
+
+    for orders_per_side in ORDERS_PER_SIDE:
+        operations = make_operations(orders_per_side)
+        store = apply_store(operations)
+        lookups = [operation[2] for operation in operations if operation[0] == 'add']
+        lists = apply_lists(operations).orders
+
+        results = {
+            'lists': min(timeit.repeat(lambda: apply_lists(operations), number=1, repeat=3)),
+            'ActiveOrderStore': min(timeit.repeat(lambda: apply_store(operations), number=1, repeat=3)),
+            'lists lookup': min(timeit.repeat(lambda: [any(order_id == order.id for order in lists.asks + lists.bids) for order_id in lookups[:1_000]], number=1, repeat=3)) / 1_000 * OPERATIONS,
+            'ActiveOrderStore lookup': min(timeit.repeat(lambda: [order_id in store for order_id in lookups[:1_000]], number=1, repeat=3)) / 1_000 * OPERATIONS
+        }
+        # that both hold the same orders in the same order is tested in tests/test_order_store.py
+        print(f'{orders_per_side} orders per side:')
+        for name, seconds in results.items():
+            print(f'  {name:<24} {seconds / OPERATIONS * 1_000_000:8.2f} us per operation')
+
+
+if __name__ == '__main__':
+    main()
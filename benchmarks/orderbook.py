@@ -0,0 +1,61 @@
+import random
+import timeit
+from decimal import Decimal
+from src.crypto.market.book import DepthBook, price_to_ticks, size_to_units
+from src.model import OrderBook, OrderLevel
+
+LEVELS = 500
+CHANGED_LEVELS = 3
+NUMBER = 2_000
+
+
+def make_levels(start: int, step: int) -> list[tuple[Decimal, Decimal]]:
+    return [(Decimal(start + step * i) * Decimal('0.00001'), Decimal(random.randint(1_000, 100_000))) for i in range(LEVELS)]
+
+
+def main():
+    random.seed(1)
+    asks = make_levels(1_000, 1)
+    bids = make_levels(999, -1)
+
+    diffs = []
+    for _ in range(NUMBER):
+        ask_changes = [asks[random.randrange(20)] for _ in range(CHANGED_LEVELS)]
+        diffs.append([(price, Decimal(random.randint(0, 100_000))) for price, _ in ask_changes])
+
+    list_book = OrderBook(asks=[OrderLevel(id="", price=price, size=size) for price, size in asks], bids=[OrderLevel(id="", price=price, size=size) for price, size in bids])
+
+    def list_rebuild():
+        for diff in diffs:
+            sizes = {level.price: level.size for level in list_book.asks}
+            sizes.update(diff)
+            list_book.asks = [OrderLevel(id="", price=price, size=size) for price, size in sorted(sizes.items()) if size > 0]
+
+    depth_book = DepthBook()
+    depth_book.load_snapshot(0, [(price_to_ticks(price), size_to_units(size)) for price, size in asks], [(price_to_ticks(price), size_to_units(size)) for price, size in bids])
+    tick_diffs = [[(price_to_ticks(price), size_to_units(size)) for price, size in diff] for diff in diffs]
+
+    def depth_book_apply():
+        for version, diff in enumerate(tick_diffs, start=depth_book.version + 1):
+            depth_book.apply_diff(version, version, diff, [])
+
+    def list_best():
+        for _ in range(NUMBER):
+            list_book.asks[0].price, list_book.bids[0].price
+
+    def depth_book_best():
+        for _ in range(NUMBER):
+            depth_book.best_ask, depth_book.best_bid
+
+    def depth_book_view():
+        for _ in range(NUMBER // 100):
+            depth_book.update_id += 1
+            depth_book.asks
+
+    for name, function, count in [('list rebuild per update', list_rebuild, NUMBER), ('DepthBook apply_diff', depth_book_apply, NUMBER), ('list best bid/ask', list_best, NUMBER), ('DepthBook best bid/ask', depth_book_best, NUMBER), ('DepthBook OrderBook view', depth_book_view, NUMBER // 100)]:
+        seconds = min(timeit.repeat(function, number=1, repeat=5))
+        print(f'{name:<26} {seconds / count * 1_000_000:10.2f} us per operation')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+from decimal import getcontext
+from loguru import logger
+from src.crypto.kucoin.client import KucoinClient
+from src.crypto.market.registry import SymbolRegistry
+from src.crypto.mexc.client import MexcClient
+from src.mock.exchange import MockExchange
+from src.model import MockExchangeConfig, Symbol, WorkerConfig, DEFAULT_SYMBOL
+from src.monitoring.loop_lag import LoopLagMonitor
+from src.replay.clients import ReplayDatabaseClient
+from src.supervisor import Supervisor
+
+SECONDS = 15
+SYMBOLS = 30
+WORKERS = (1, 2, 4)
+REAL_DEPTH_RATE = 10
+
+
+def run_exchange(port: int, symbols: int):
+    # in its own process so that the bot under test does not share a core with the exchange
+    logger.remove()
+
+    async def main():
+        exchange = MockExchange(MockExchangeConfig(depth_rate=REAL_DEPTH_RATE, kucoin_rate=REAL_DEPTH_RATE, usdt_balance=MockExchangeConfig.usdt_balance * symbols, seed=1))
+        await exchange.start(port=port)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def run_single(config: WorkerConfig, symbols: list[Symbol]) -> dict:
+    database_client = ReplayDatabaseClient()
+    mexc_client = MexcClient(api_key='key', api_secret='secret', database_client=database_client, ws_base_url=config.mexc_ws_url, rest_base_url=config.mexc_rest_url)
+    kucoin_client = KucoinClient(api_key='key', api_secret='secret', api_passphrase='passphrase', database_client=database_client, rest_base_url=config.kucoin_rest_url)
+    registry = SymbolRegistry(mexc_client=mexc_client, kucoin_client=kucoin_client)
+    for symbol in symbols:
+        registry.add(symbol=symbol)
+    loop_lag_monitor = LoopLagMonitor(threshold_ms=1000)
+
+    listen_key = await mexc_client.create_listen_key()
+    tasks = [
+        asyncio.create_task(loop_lag_monitor.run()),
+        asyncio.create_task(mexc_client.track_private(listen_key=listen_key))
+    ] + registry.start(database_client=database_client)
+
+    started = time.perf_counter()
+    await asyncio.sleep(SECONDS)
+    seconds = time.perf_counter() - started
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await mexc_client.close()
+    await kucoin_client.close()
+
+    dispatchers = registry.get_stats().values()
+    return {
+        'events': sum(stats['events_received'] for stats in dispatchers) / seconds,
+        'ticks': sum(stats['ticks'] for stats in dispatchers) / seconds,
+        'max_latency_ms': max(stats['max_latency_ms'] for stats in dispatchers),
+        'max_loop_lag_ms': loop_lag_monitor.get_stats()['max_lag_ms'],
+        'rows': database_client.records / seconds,
+        'ipc_bytes': 0
+    }
+
+
+async def run_sharded(config: WorkerConfig, symbols: list[Symbol], workers: int) -> dict:
+    database_client = ReplayDatabaseClient()
+    supervisor = Supervisor(symbols=symbols, workers=workers, config=config, database_client=database_client)
+    await supervisor.start()
+
+    # the counters are taken from the health reports, so the run is measured between two of them
+    await asyncio.sleep(3)
+    while not all(worker.health for worker in supervisor.workers):
+        await asyncio.sleep(0.1)
+    first = {worker.index: dict(worker.health) for worker in supervisor.workers}
+    first_rows = database_client.records
+    started = time.perf_counter()
+    await asyncio.sleep(SECONDS)
+    seconds = time.perf_counter() - started
+    last = {worker.index: dict(worker.health) for worker in supervisor.workers}
+    rows = database_client.records - first_rows
+
+    await supervisor.stop()
+
+    return {
+        'events': sum(last[i]['events_received'] - first[i]['events_received'] for i in last) / seconds,
+        'ticks': sum(last[i]['ticks'] - first[i]['ticks'] for i in last) / seconds,
+        'max_latency_ms': max(health['max_latency_ms'] for health in last.values()),
+        'max_loop_lag_ms': max(health['loop_lag']['max_lag_ms'] for health in last.values()),
+        'rows': rows / seconds,
+        'ipc_bytes': sum(last[i]['channel']['bytes_sent'] - first[i]['channel']['bytes_sent'] for i in last) / seconds
+    }
+
+
+async def main():
+    logger.remove()
+    logger.add(sys.stderr, level='CRITICAL')
+    getcontext().prec = 18
+
+    symbols = [DEFAULT_SYMBOL] + [Symbol(base=f'T{i}', quote='USDT') for i in range(1, SYMBOLS)]
+    print(f'{SYMBOLS} symbols at {REAL_DEPTH_RATE} depth msg/s each, {multiprocessing.cpu_count()} CPUs')
+
+    cases = [('one process', None)] + [(f'{workers} workers', workers) for workers in WORKERS]
+    for name, workers in cases:
+        port = free_port()
+        exchange = multiprocessing.get_context('spawn').Process(target=run_exchange, args=(port, SYMBOLS), daemon=True)
+        exchange.start()
+        await asyncio.sleep(2)
+
+        address = f'127.0.0.1:{port}'
+        config = WorkerConfig(mexc_ws_url=f'ws://{address}/ws', mexc_rest_url=f'http://{address}', kucoin_rest_url=f'http://{address}', api_key_mexc='key', api_secret_mexc='secret', log_level='CRITICAL')
+        try:
+            stats = await run_single(config, symbols) if workers is None else await run_sharded(config, symbols, workers)
+        finally:
+            exchange.terminate()
+            exchange.join()
+
+        print(f'{name:<12} events {stats["events"]:7.1f}/s  ticks {stats["ticks"]:7.1f}/s  latency max {stats["max_latency_ms"]:8.2f} ms  '
+              f'loop lag max {stats["max_loop_lag_ms"]:7.2f} ms  db rows {stats["rows"]:6.1f}/s  ipc {stats["ipc_bytes"] / 1024:7.1f} KiB/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import sys
+import tempfile
+import time
+import timeit
+from decimal import Decimal, getcontext
+import msgspec
+from loguru import logger
+from benchmarks.fixed_point import make_archive
+from src.monitoring.latency import LatencyHistogram, StageTimers, HALF_BUCKETS, PERCENTILES, stage_timers
+from src.replay.engine import ReplayEngine
+
+SAMPLES = 200_000
+RECORDS = 1_000_000
+REPEATS = 5
+
+
+def exact_percentile(values: list[int], percent: float) -> int:
+    return values[max(1, round(len(values) * percent / 100)) - 1]
+
+
+def check_accuracy() -> float:
+    # latencies from a few hundred ns to seconds, every percentile is the upper bound of the bucket of the exact one
+    values = [int(random.lognormvariate(11, 2)) for _ in range(SAMPLES)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    values.sort()
+
+    worst = 0.0
+    for percent in PERCENTILES:
+        exact, reported = exact_percentile(values, percent), histogram.percentile(percent)
+        assert exact <= reported <= exact + exact / HALF_BUCKETS + 1, (percent, exact, reported)
+        worst = max(worst, (reported - exact) / exact if exact else 0.0)
+    return worst
+
+
+def check_merge():
+    # the histograms of several workers sent through the health pipe add up to the histogram of all their values
+    encoder, decoder = msgspec.msgpack.Encoder(), msgspec.msgpack.Decoder()
+    merged, single = StageTimers(), StageTimers()
+    for _ in range(4):
+        worker = StageTimers()
+        for _ in range(SAMPLES // 4):
+            value = int(random.expovariate(1 / 50_000))
+            worker.record('decode', value)
+            single.record('decode', value)
+        merged.merge(decoder.decode(encoder.encode(worker.export())))
+        assert not worker.histograms
+    assert merged.get_stats() == single.get_stats()
+
+
+def record_cost() -> tuple[float, float]:
+    # one stage as it is timed in the code: two clock reads and a record, against the two clock reads alone
+    timers = StageTimers()
+    clock = time.perf_counter_ns
+
+    def timed():
+        for _ in range(RECORDS):
+            started = clock()
+            timers.record('decode', clock() - started)
+
+    def untimed():
+        for _ in range(RECORDS):
+            started = clock()
+            clock() - started
+
+    with_record = min(timeit.repeat(timed, number=1, repeat=REPEATS)) / RECORDS
+    clock_only = min(timeit.repeat(untimed, number=1, repeat=REPEATS)) / RECORDS
+    return with_record * 1e9, clock_only * 1e9
+
+
+async def replay(directory: str) -> tuple[float, dict]:
+    balance = {'RMV': {'free': Decimal('500000'), 'locked': Decimal('0')}, 'USDT': {'free': Decimal('5000'), 'locked': Decimal('0')}}
+    engine = ReplayEngine(archive_dir=directory, balance=balance, fixed_point=True, seed=1)
+    try:
+        started = time.process_time()
+        report = await engine.run()
+        return time.process_time() - started, report
+    finally:
+        engine.close()
+
+
+def main():
+    logger.remove()
+    logger.add(sys.stderr, level='ERROR')
+    getcontext().prec = 18
+    random.seed(1)
+
+    print(f'percentiles within {check_accuracy():.2%} of the exact ones on {SAMPLES} lognormal latencies')
+    check_merge()
+    print('histograms merged from 4 exports through msgpack equal the histogram of all values')
+
+    with_record, clock_only = record_cost()
+    print(f'timing one stage: {with_record:6.1f} ns with the record, {clock_only:6.1f} ns for the two clock reads alone')
+
+    # a replay without coalescing is a tick per event, the most records per event the stages make, the cost of the
+    # timers is their number times the cost of one, a replay with and without them differs by less than its own noise
+    with tempfile.TemporaryDirectory() as directory:
+        make_archive(directory)
+        cpu_seconds, report = min((asyncio.run(replay(directory)) for _ in range(REPEATS)), key=lambda result: result[0])
+
+    events = report['events']
+    records = sum(stats['count'] for stats in report['stages'].values()) / events
+    print(f'replay of {events} events: {records:.1f} stage records per event, {records * with_record / 1000:.2f} us of '
+          f'{cpu_seconds / events * 1e6:.1f} us CPU per event ({records * with_record / 1e3 / (cpu_seconds / events * 1e6):.1%})')
+    for stage, stats in report['stages'].items():
+        print(f'{stage:<20} {stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import random
+import timeit
+from decimal import Decimal, getcontext
+from src.crypto.market.book import DepthBook
+from src.crypto.mexc.client import MexcClient
+from src.model import FAIR_PRICE_LEVELS
+
+UPDATES = 20_000
+LEVELS = (500, 5_000)
+PERCENT = Decimal('2')
+MID_TICK = 10_000
+
+
+def random_level(side: str) -> tuple[int, int]:
+    distance = int(random.expovariate(1 / 15))
+    tick = MID_TICK + 1 + distance if side == 'ask' else MID_TICK - 1 - distance
+    size = 0 if random.random() < 0.3 else random.randint(1, 10_000_000) * 10 ** 6
+    return tick, size
+
+
+def make_updates() -> list[tuple[list[tuple[int, int]], list[tuple[int, int]]]]:
+    return [([random_level('ask') for _ in range(random.randint(0, 3))], [random_level('bid') for _ in range(random.randint(0, 3))]) for _ in range(UPDATES)]
+
+
+def load(book: DepthBook, levels: int):
+    book.load_snapshot(0, [(MID_TICK + 1 + i, random.randint(1, 10_000_000) * 10 ** 6) for i in range(levels)], [(MID_TICK - 1 - i, random.randint(1, 10_000_000) * 10 ** 6) for i in range(levels)])
+
+
+def describe(book: DepthBook) -> tuple:
+    return book.to_orderbook(), book.analytics.market_depth(PERCENT), book.analytics.mid_price, book.analytics.real_fair_price(FAIR_PRICE_LEVELS)
+
+
+def check(updates) -> int:
+    # a state taken before a few more updates of the book, the balance and our orders reads as it did when it was taken
+    client = MexcClient(api_key='', api_secret='', database_client=None)
+    load(client.orderbook, 500)
+    client.balance = {'RMV': {'free': Decimal('500000'), 'locked': Decimal('0')}, 'USDT': {'free': Decimal('500'), 'locked': Decimal('0')}}
+    checks = 0
+
+    held = []
+    for version, (asks, bids) in enumerate(updates, start=1):
+        if version % 10 == 0:
+            state = client.get_state()
+            held.append((state, describe(state.book), dict(state.balance), state.active_orders.asks[:], dict(state.own_asks)))
+            assert client.get_state() is state, version
+
+        client.orderbook.apply_diff(version, version, asks, bids)
+        if version % 7 == 0:
+            client.handle_account_update(('RMV', Decimal(random.randint(0, 500_000)), Decimal('0')))
+        if version % 5 == 0:
+            tick = MID_TICK + 1 + random.randint(0, 10)
+            client.active_orders.add(side='sell', order_id=str(version), price=tick * client.symbol.tick_size, size=Decimal(random.randint(2_000, 4_000)))
+        if version % 11 == 0 and len(client.active_orders):
+            client.active_orders.remove(order_id=client.active_orders.snapshot().asks[0].id)
+
+        if len(held) == 20 or version == len(updates):
+            for state, book, balance, asks, own_asks in held:
+                assert describe(state.book) == book and state.balance == balance and state.active_orders.asks == asks and state.own_asks == own_asks, state.sequence
+                checks += 1
+            held = []
+
+    assert client.get_state().sequence > 1
+    return checks
+
+
+def main():
+    getcontext().prec = 18
+    random.seed(1)
+    updates = make_updates()
+
+    print(f'{check(updates)} held states unchanged by the updates that followed them')
+
+    # a decision reads the market depth of the live book as before, or of the state the client hands out
+    for levels in LEVELS:
+        for every in (1, 10):
+            for name, read in (('live book', lambda client: client.orderbook), ('state', lambda client: client.get_state().book)):
+                client = MexcClient(api_key='', api_secret='', database_client=None)
+                load(client.orderbook, levels)
+                client.balance = {'RMV': {'free': Decimal('500000'), 'locked': Decimal('0')}, 'USDT': {'free': Decimal('500'), 'locked': Decimal('0')}}
+
+                def run():
+                    for version, (asks, bids) in enumerate(updates, start=client.orderbook.version + 1):
+                        client.orderbook.apply_diff(version, version, asks, bids)
+                        if version % every == 0:
+                            read(client).analytics.market_notional(PERCENT)
+
+                seconds = min(timeit.repeat(run, number=1, repeat=3))
+                print(f'{levels:>5} levels, read every {every:>2} updates, {name:<9} {seconds / UPDATES * 1e6:7.2f} us per update')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+import argparse
+import itertools
+import os
+import time
+from typing import Optional
+import numpy as np
+from loguru import logger
+from src.model import MEXC_TICK_SIZE, INVENTORY_BALANCE, INVENTORY_LIMIT
+from src.crypto.market.book import DepthBook, BookSide
+from src.database.archive import ArchiveReader, merge_streams, MAX_TIMESTAMP_NS
+
+# the quoting of get_quotes and manage_orders: half_spread 0.00002, alpha half of it, 5 levels per side, 2000-4000 RMV per order
+DEFAULT_PARAMETERS = {
+    'half_spread': 0.00002,
+    'alpha': 0.00001,
+    'levels': 5,
+    'order_size': 3000,
+    'inventory_balance': float(INVENTORY_BALANCE),
+    'inventory_limit': float(INVENTORY_LIMIT)
+}
+
+TICK_SIZE = float(MEXC_TICK_SIZE)
+
+
+def parameter_grid(**values) -> dict[str, np.ndarray]:
+    combinations = list(itertools.product(*values.values()))
+    return {name: np.array([combination[i] for combination in combinations], dtype=float) for i, name in enumerate(values)}
+
+
+class Backtester:
+    # simulates every parameter combination at once: state is kept in (combinations, levels) arrays and each
+    # recorded event updates all of them with a handful of numpy operations
+    def __init__(self, archive_dir: str, parameters: dict[str, np.ndarray], start_ns: int = 0, end_ns: int = MAX_TIMESTAMP_NS, initial_inventory: float = 500_000, initial_cash: float = 500, percent: float = 2, maker_fee: float = 0.0, sample_interval: float = 60):
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.percent = percent
+        self.maker_fee = maker_fee
+        self.sample_interval_ns = int(sample_interval * 1e9)
+
+        count = max(len(np.atleast_1d(values)) for values in parameters.values()) if parameters else 1
+        self.parameters = {name: np.broadcast_to(np.asarray(parameters.get(name, default), dtype=float), (count,)).copy() for name, default in DEFAULT_PARAMETERS.items()}
+        self.count = count
+
+        self.half_spread = self.parameters['half_spread'] / TICK_SIZE
+        self.alpha = self.parameters['alpha'] / TICK_SIZE
+        self.order_size = self.parameters['order_size']
+        self.inventory_balance = self.parameters['inventory_balance']
+        self.inventory_limit = self.parameters['inventory_limit']
+
+        levels = self.parameters['levels'].astype(np.int64)
+        self.slots = np.arange(levels.max())[None, :]
+        self.mask = self.slots < levels[:, None]
+
+        self.readers = {stream: ArchiveReader(directory=archive_dir, stream=stream) for stream in ('mexc', 'mexc_trades', 'kucoin') if os.path.isdir(os.path.join(archive_dir, stream))}
+        if 'mexc' not in self.readers:
+            raise FileNotFoundError(f'No MEXC orderbook archive in {archive_dir}')
+        if 'mexc_trades' not in self.readers:
+            logger.warning('No MEXC trade archive, orders are only filled when the book crosses them')
+        if self.readers['mexc'].tick_size != MEXC_TICK_SIZE:
+            raise ValueError(f"MEXC archive was recorded with tick size {self.readers['mexc'].tick_size}")
+        self.size_scale = float(self.readers['mexc'].size_scale)
+
+        self.book = DepthBook()
+        self.book_arrays = {}
+        self.book_arrays_id = -1
+        self.kucoin: Optional[tuple[float, float, float, float]] = None
+        self.fair_tick: Optional[int] = None
+
+        shape = (count, self.slots.shape[1])
+        self.ask_base = np.zeros(count, dtype=np.int64)
+        self.bid_base = np.zeros(count, dtype=np.int64)
+        self.ask_queue, self.ask_remaining = np.zeros(shape), np.zeros(shape)
+        self.bid_queue, self.bid_remaining = np.zeros(shape), np.zeros(shape)
+        self.quoting = False
+        self.requote = True
+        self.rows = np.arange(count)[:, None] * self.slots.shape[1]
+
+        self.inventory = np.full(count, float(initial_inventory))
+        self.cash = np.full(count, float(initial_cash))
+        self.initial_inventory = float(initial_inventory)
+        self.initial_cash = float(initial_cash)
+        self.initial_mid: Optional[float] = None
+        self.last_mid: Optional[float] = None
+        self.fills = np.zeros(count, dtype=np.int64)
+        self.volume = np.zeros(count)
+        self.min_inventory = self.inventory.copy()
+        self.max_inventory = self.inventory.copy()
+
+        self.sample_times: list[int] = []
+        self.inventory_path: list[np.ndarray] = []
+        self.pnl_path: list[np.ndarray] = []
+        self.events = 0
+        self.wall_seconds = 0.0
+
+    def side_arrays(self, side: BookSide) -> tuple[np.ndarray, np.ndarray]:
+        # copies, a numpy view would pin the array('q') buffers and block later inserts
+        if self.book_arrays_id != self.book.update_id:
+            self.book_arrays = {
+                id(self.book.ask_side): (np.array(self.book.ask_side.ticks, dtype=np.int64), np.array(self.book.ask_side.sizes, dtype=np.float64) / self.size_scale),
+                id(self.book.bid_side): (np.array(self.book.bid_side.ticks, dtype=np.int64), np.array(self.book.bid_side.sizes, dtype=np.float64) / self.size_scale)
+            }
+            self.book_arrays_id = self.book.update_id
+        return self.book_arrays[id(side)]
+
+    def visible(self, side: BookSide, ticks: np.ndarray) -> np.ndarray:
+        book_ticks, book_sizes = self.side_arrays(side)
+        if len(book_ticks) == 0:
+            return np.zeros(ticks.shape)
+
+        index = np.minimum(np.searchsorted(book_ticks, ticks), len(book_ticks) - 1)
+        return np.where(book_ticks[index] == ticks, book_sizes[index], 0.0)
+
+    def mexc_mid(self) -> Optional[float]:
+        if self.book.best_ask is None or self.book.best_bid is None:
+            return None
+        return (self.book.best_ask + self.book.best_bid) / 2
+
+    def mexc_liquidity(self, mid: float) -> float:
+        ask_ticks, ask_sizes = self.side_arrays(self.book.ask_side)
+        bid_ticks, bid_sizes = self.side_arrays(self.book.bid_side)
+
+        upper = np.searchsorted(ask_ticks, mid * (1 + self.percent / 100), side='right')
+        lower = np.searchsorted(bid_ticks, mid * (1 - self.percent / 100), side='left')
+        return (float(ask_ticks[:upper] @ ask_sizes[:upper]) + float(bid_ticks[lower:] @ bid_sizes[lower:])) * TICK_SIZE
+
+    def on_kucoin(self, message: tuple):
+        _, _, asks, bids = message
+        if not asks or not bids:
+            self.kucoin = None
+            return
+
+        reader = self.readers['kucoin']
+        ratio = float(reader.tick_size / MEXC_TICK_SIZE)
+        scale = float(reader.size_scale)
+
+        best_ask, best_bid = min(tick for tick, _ in asks) * ratio, max(tick for tick, _ in bids) * ratio
+        mid = (best_ask + best_bid) / 2
+        upper, lower = mid * (1 + self.percent / 100), mid * (1 - self.percent / 100)
+        liquidity = sum(tick * ratio * size for tick, size in asks if tick * ratio <= upper) + sum(tick * ratio * size for tick, size in bids if tick * ratio >= lower)
+
+        self.kucoin = (mid, liquidity / scale * TICK_SIZE, best_ask, best_bid)
+
+    def update_fair_price(self):
+        # calculate_fair_price in ticks: both mids weighted by liquidity within percent, clamped to the KuCoin spread
+        mid = self.mexc_mid()
+        if mid is None:
+            self.fair_tick = None
+            return
+
+        if self.kucoin is None:
+            self.fair_tick = int(np.floor(mid + 0.5))
+            return
+
+        kucoin_mid, kucoin_liquidity, kucoin_ask, kucoin_bid = self.kucoin
+        mexc_liquidity = self.mexc_liquidity(mid)
+        total = mexc_liquidity + kucoin_liquidity
+        fair = (mid * mexc_liquidity + kucoin_mid * kucoin_liquidity) / total if total > 0 else mid
+        fair_tick = int(np.floor(fair + 0.5))
+
+        if fair_tick > kucoin_ask:
+            fair_tick = int(np.ceil(kucoin_ask - 0.5))
+        if fair_tick < kucoin_bid:
+            fair_tick = int(np.floor(kucoin_bid + 0.5))
+
+        self.fair_tick = fair_tick
+
+    def shift(self, queue: np.ndarray, remaining: np.ndarray, offset: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # slot k of the new ladder is slot k + offset of the old one, orders that leave the ladder are cancelled
+        if not offset.any():
+            return queue, remaining
+
+        index = self.slots + offset[:, None]
+        valid = (index >= 0) & (index < self.slots.shape[1])
+        index = self.rows + np.clip(index, 0, self.slots.shape[1] - 1)
+
+        queue = np.where(valid, queue.ravel()[index], 0.0)
+        remaining = np.where(valid & self.mask, remaining.ravel()[index], 0.0)
+        return queue, remaining
+
+    def update_quotes(self):
+        normalized_inventory = (self.inventory - self.inventory_balance) / self.inventory_limit
+        ask_base = np.floor(self.fair_tick + self.half_spread - self.alpha * normalized_inventory + 0.5).astype(np.int64)
+        bid_base = np.floor(self.fair_tick - self.half_spread - self.alpha * normalized_inventory + 0.5).astype(np.int64)
+
+        if self.quoting:
+            self.ask_queue, self.ask_remaining = self.shift(self.ask_queue, self.ask_remaining, ask_base - self.ask_base)
+            self.bid_queue, self.bid_remaining = self.shift(self.bid_queue, self.bid_remaining, self.bid_base - bid_base)
+        self.ask_base, self.bid_base = ask_base, bid_base
+        self.ask_range = (int(ask_base.min()), int(ask_base.max()) + self.slots.shape[1] - 1)
+        self.bid_range = (int(bid_base.min()) - self.slots.shape[1] + 1, int(bid_base.max()))
+        self.quoting = True
+
+        ask_ticks = self.ask_base[:, None] + self.slots
+        bid_ticks = self.bid_base[:, None] - self.slots
+
+        # new orders join the back of the visible queue, limited by the balance not already locked in orders
+        free_inventory = np.maximum(self.inventory - self.ask_remaining.sum(axis=1), 0)
+        fresh = self.mask & (self.ask_remaining <= 0)
+        place = fresh & (np.cumsum(fresh, axis=1) <= np.floor(free_inventory / self.order_size)[:, None])
+        self.ask_remaining = np.where(place, self.order_size[:, None], self.ask_remaining)
+        self.ask_queue = np.where(place, self.visible(self.book.ask_side, ask_ticks), self.ask_queue)
+
+        free_cash = np.maximum(self.cash - (self.bid_remaining * bid_ticks).sum(axis=1) * TICK_SIZE, 0)
+        fresh = self.mask & (self.bid_remaining <= 0)
+        place = fresh & (np.cumsum(fresh, axis=1) <= np.floor(free_cash / (self.order_size * np.maximum(self.bid_base, 1) * TICK_SIZE))[:, None])
+        self.bid_remaining = np.where(place, self.order_size[:, None], self.bid_remaining)
+        self.bid_queue = np.where(place, self.visible(self.book.bid_side, bid_ticks), self.bid_queue)
+
+    def execute(self, sell: bool, filled: np.ndarray, ticks: np.ndarray):
+        quantity = filled.sum(axis=1)
+        if not quantity.any():
+            return
+
+        notional = (filled * ticks).sum(axis=1) * TICK_SIZE
+        if sell:
+            self.ask_remaining -= filled
+            self.inventory -= quantity
+            self.cash += notional * (1 - self.maker_fee)
+        else:
+            self.bid_remaining -= filled
+            self.inventory += quantity
+            self.cash -= notional * (1 + self.maker_fee)
+
+        self.requote = True
+        self.fills += (filled > 0).sum(axis=1)
+        self.volume += notional
+        np.minimum(self.min_inventory, self.inventory, out=self.min_inventory)
+        np.maximum(self.max_inventory, self.inventory, out=self.max_inventory)
+
+    def on_trades(self, message: tuple):
+        # a trade fills the orders priced better than it entirely and the orders at its price once the queue ahead is used up
+        _, _, buys, sells = message
+        ask_ticks = self.ask_base[:, None] + self.slots
+        bid_ticks = self.bid_base[:, None] - self.slots
+
+        for tick, units in buys:
+            quantity = units / self.size_scale
+            active = self.ask_remaining > 0
+            at_price = active & (ask_ticks == tick)
+            filled = np.where(active & (ask_ticks < tick), self.ask_remaining, 0.0) + np.where(at_price, np.clip(quantity - self.ask_queue, 0.0, self.ask_remaining), 0.0)
+            self.ask_queue = np.where(at_price, np.maximum(self.ask_queue - quantity, 0.0), self.ask_queue)
+            self.execute(sell=True, filled=filled, ticks=ask_ticks)
+
+        for tick, units in sells:
+            quantity = units / self.size_scale
+            active = self.bid_remaining > 0
+            at_price = active & (bid_ticks == tick)
+            filled = np.where(active & (bid_ticks > tick), self.bid_remaining, 0.0) + np.where(at_price, np.clip(quantity - self.bid_queue, 0.0, self.bid_remaining), 0.0)
+            self.bid_queue = np.where(at_price, np.maximum(self.bid_queue - quantity, 0.0), self.bid_queue)
+            self.execute(sell=False, filled=filled, ticks=bid_ticks)
+
+    def on_book_change(self, asks: list[tuple[int, int]], bids: list[tuple[int, int]], snapshot: bool):
+        ask_ticks = self.ask_base[:, None] + self.slots
+        bid_ticks = self.bid_base[:, None] - self.slots
+        ask_low, ask_high = self.ask_range
+        bid_low, bid_high = self.bid_range
+
+        # the queue ahead never exceeds what is visible at the level, cancellations are assumed to come from ahead of us
+        if snapshot or any(ask_low <= tick <= ask_high for tick, _ in asks):
+            self.ask_queue = np.minimum(self.ask_queue, self.visible(self.book.ask_side, ask_ticks))
+        if snapshot or any(bid_low <= tick <= bid_high for tick, _ in bids):
+            self.bid_queue = np.minimum(self.bid_queue, self.visible(self.book.bid_side, bid_ticks))
+
+        # orders the recorded book trades through are taken immediately
+        if self.book.best_bid is not None and self.book.best_bid >= ask_low:
+            self.execute(sell=True, filled=np.where(ask_ticks <= self.book.best_bid, self.ask_remaining, 0.0), ticks=ask_ticks)
+        if self.book.best_ask is not None and self.book.best_ask <= bid_high:
+            self.execute(sell=False, filled=np.where(bid_ticks >= self.book.best_ask, self.bid_remaining, 0.0), ticks=bid_ticks)
+
+    def mark(self) -> np.ndarray:
+        # at the last mid of a book with both sides, an archive can end while one of them is empty
+        return self.cash + self.inventory * self.last_mid - (self.initial_cash + self.initial_inventory * self.initial_mid)
+
+    def run(self) -> dict:
+        started = time.perf_counter()
+        next_sample = 0
+
+        for timestamp_ns, stream, message in merge_streams(self.readers, self.start_ns, self.end_ns):
+            self.events += 1
+
+            if stream == 'mexc':
+                _, is_snapshot, asks, bids = message
+                update_id = self.book.update_id
+                if is_snapshot:
+                    self.book.load_snapshot(self.book.version + 1, asks, bids)
+                elif self.book.synced:
+                    self.book.apply_diff(self.book.version + 1, self.book.version + 1, asks, bids)
+                if self.book.update_id == update_id:
+                    continue
+                if self.quoting:
+                    self.on_book_change(asks=asks, bids=bids, snapshot=is_snapshot)
+            elif stream == 'mexc_trades':
+                if self.quoting:
+                    self.on_trades(message)
+            elif stream == 'kucoin':
+                self.on_kucoin(message)
+
+            fair_tick = self.fair_tick
+            self.update_fair_price()
+            if self.fair_tick is None:
+                continue
+            self.last_mid = self.mexc_mid() * TICK_SIZE
+            if self.initial_mid is None:
+                self.initial_mid = self.last_mid
+
+            # quotes only move with the fair price or the inventory
+            if self.requote or self.fair_tick != fair_tick:
+                self.update_quotes()
+                self.requote = False
+
+            if timestamp_ns >= next_sample:
+                self.sample_times.append(timestamp_ns)
+                self.inventory_path.append(self.inventory.copy())
+                self.pnl_path.append(self.mark())
+                next_sample = timestamp_ns + self.sample_interval_ns
+
+        self.wall_seconds = time.perf_counter() - started
+        return self.get_results()
+
+    def get_results(self) -> dict:
+        return {
+            **{name: values for name, values in self.parameters.items()},
+            'pnl': self.mark() if self.initial_mid is not None else np.zeros(self.count),
+            'inventory': self.inventory,
+            'cash': self.cash,
+            'fills': self.fills,
+            'volume': self.volume,
+            'min_inventory': self.min_inventory,
+            'max_inventory': self.max_inventory,
+            'sample_times': np.array(self.sample_times, dtype=np.int64),
+            'inventory_path': np.array(self.inventory_path).reshape(-1, self.count),
+            'pnl_path': np.array(self.pnl_path).reshape(-1, self.count)
+        }
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+
+
+def parse_values(value: str) -> list[float]:
+    # "0.00001,0.00002" or an inclusive range "start:stop:step"
+    if ':' in value:
+        start, stop, step = (float(part) for part in value.split(':'))
+        return list(np.arange(start, stop + step / 2, step))
+    return [float(part) for part in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest the quoting parameters on an orderbook and trade archive')
+    parser.add_argument('archive_dir')
+    parser.add_argument('--start', type=int, default=0, help='timestamp in ns')
+    parser.add_argument('--end', type=int, default=MAX_TIMESTAMP_NS, help='timestamp in ns')
+    for name, default in DEFAULT_PARAMETERS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=parse_values, default=[default])
+    parser.add_argument('--inventory', type=float, default=500_000)
+    parser.add_argument('--cash', type=float, default=500)
+    parser.add_argument('--maker-fee', type=float, default=0.0)
+    parser.add_argument('--output', help='save all results as .npz')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    grid = parameter_grid(**{name: getattr(args, name) for name in DEFAULT_PARAMETERS})
+    backtester = Backtester(archive_dir=args.archive_dir, parameters=grid, start_ns=args.start, end_ns=args.end, initial_inventory=args.inventory, initial_cash=args.cash, maker_fee=args.maker_fee)
+    try:
+        results = backtester.run()
+    finally:
+        backtester.close()
+
+    print(f'{backtester.count} combinations, {backtester.events} events in {backtester.wall_seconds:.1f} s')
+    for i in np.argsort(-results['pnl'])[:args.top]:
+        parameters = ', '.join(f'{name}={results[name][i]:g}' for name in DEFAULT_PARAMETERS)
+        print(f"pnl {results['pnl'][i]:10.4f} USDT  inventory {results['inventory'][i]:12.0f}  fills {results['fills'][i]:6d}  volume {results['volume'][i]:10.2f}  {parameters}")
+
+    if args.output:
+        np.savez(args.output, **results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
+import numpy as np
+from loguru import logger
+from src.model import FsyncPolicy
+from src.backtest.simulator import Backtester, DEFAULT_PARAMETERS, parameter_grid, parse_values
+from src.database.archive import MAX_TIMESTAMP_NS
+from src.database.journal import Journal, read_records
+
+SUMMARY_FIELDS = ('pnl', 'inventory', 'cash', 'fills', 'volume', 'min_inventory', 'max_inventory')
+PATH_FIELDS = ('sample_times', 'inventory_path', 'pnl_path')
+
+
+def encode_arrays(arrays: dict[str, np.ndarray]) -> dict[str, list]:
+    return {name: [array.dtype.str, list(array.shape), np.ascontiguousarray(array).tobytes()] for name, array in arrays.items()}
+
+
+def decode_arrays(encoded: dict[str, list]) -> dict[str, np.ndarray]:
+    return {name: np.frombuffer(data, dtype=np.dtype(dtype)).reshape(shape) for name, (dtype, shape, data) in encoded.items()}
+
+
+def grid_key(grid: dict[str, np.ndarray], options: dict) -> str:
+    digest = hashlib.sha256(repr(sorted(options.items())).encode())
+    for name in sorted(grid):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(grid[name], dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def run_chunk(archive_dir: str, chunk: int, parameters: dict[str, np.ndarray], options: dict, paths: bool) -> tuple[int, dict, int, float]:
+    # runs in a worker process, the archive segments are memory-mapped so every worker shares the page cache instead of receiving the data
+    backtester = Backtester(archive_dir=archive_dir, parameters=parameters, **options)
+    try:
+        results = backtester.run()
+    finally:
+        backtester.close()
+
+    fields = SUMMARY_FIELDS + PATH_FIELDS if paths else SUMMARY_FIELDS
+    return chunk, {name: results[name] for name in fields}, backtester.events, backtester.wall_seconds
+
+
+def init_worker(log_level: str):
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+
+
+class Sweep:
+    # the results journal starts with a header describing the grid, then one record per finished chunk,
+    # an interrupted sweep is resumed by skipping the chunks that already have a record
+    def __init__(self, archive_dir: str, grid: dict[str, np.ndarray], results_dir: str, chunk_size: int = 64, workers: int = os.cpu_count() or 1, paths: bool = False, log_level: str = 'WARNING', **options):
+        self.archive_dir = archive_dir
+        self.grid = {name: np.asarray(values, dtype=float) for name, values in grid.items()}
+        self.results_dir = results_dir
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.paths = paths
+        self.log_level = log_level
+        self.options = options
+
+        self.count = max((len(values) for values in self.grid.values()), default=1)
+        self.chunks = (self.count + chunk_size - 1) // chunk_size
+        self.key = grid_key(self.grid, {**options, 'chunk_size': chunk_size, 'paths': paths})
+        self.completed: dict[int, dict[str, np.ndarray]] = {}
+        self.events = 0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def load(self) -> bool:
+        # returns whether the results directory already holds a header for this sweep
+        if not os.path.isdir(self.results_dir):
+            return False
+
+        header = False
+        for kind, record in read_records(self.results_dir):
+            if kind == 'sweep':
+                if record['key'] != self.key:
+                    raise ValueError(f'{self.results_dir} holds the results of a different sweep, use another directory')
+                header = True
+            elif kind == 'chunk':
+                chunk, encoded = record
+                self.completed[chunk] = decode_arrays(encoded)
+        return header
+
+    def pending(self) -> Iterator[tuple[int, dict[str, np.ndarray]]]:
+        for chunk in range(self.chunks):
+            if chunk not in self.completed:
+                rows = slice(chunk * self.chunk_size, (chunk + 1) * self.chunk_size)
+                yield chunk, {name: values[rows] for name, values in self.grid.items()}
+
+    def run(self) -> dict:
+        started = time.perf_counter()
+        header = self.load()
+        if self.completed:
+            logger.info(f'Resuming sweep, {len(self.completed)} of {self.chunks} chunks already done')
+
+        journal = Journal(directory=self.results_dir, fsync_policy=FsyncPolicy.ALWAYS)
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.log_level,))
+        try:
+            if not header:
+                journal.append('sweep', {'key': self.key, 'archive_dir': self.archive_dir, 'count': self.count, 'chunk_size': self.chunk_size, 'parameters': list(self.grid)})
+
+            futures = [executor.submit(run_chunk, self.archive_dir, chunk, parameters, self.options, self.paths) for chunk, parameters in self.pending()]
+            for future in as_completed(futures):
+                chunk, results, events, seconds = future.result()
+                journal.append('chunk', (chunk, encode_arrays(results)))
+                self.completed[chunk] = results
+                self.events += events
+                self.cpu_seconds += seconds
+                logger.info(f'Chunk {chunk + 1}/{self.chunks} done in {seconds:.1f} s, {len(self.completed)}/{self.chunks} complete')
+            executor.shutdown()
+        except BaseException:
+            # on an interrupt the queued chunks are dropped instead of being run to completion, the finished ones are already journaled
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            journal.close()
+
+        self.wall_seconds = time.perf_counter() - started
+        return self.get_results()
+
+    def get_results(self) -> dict:
+        chunks = [self.completed[chunk] for chunk in range(self.chunks) if chunk in self.completed]
+        rows = np.concatenate([np.arange(chunk * self.chunk_size, min((chunk + 1) * self.chunk_size, self.count)) for chunk in range(self.chunks) if chunk in self.completed]) if chunks else np.empty(0, dtype=np.int64)
+
+        results = {name: values[rows] for name, values in self.grid.items()}
+        for name in SUMMARY_FIELDS:
+            results[name] = np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0)
+        if self.paths and chunks:
+            results['sample_times'] = chunks[0]['sample_times']
+            results['inventory_path'] = np.concatenate([chunk['inventory_path'] for chunk in chunks], axis=1)
+            results['pnl_path'] = np.concatenate([chunk['pnl_path'] for chunk in chunks], axis=1)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a backtest parameter sweep across processes, resumable from its results directory')
+    parser.add_argument('archive_dir')
+    parser.add_argument('results_dir', help='journal of finished chunks, rerunning with the same arguments skips them')
+    parser.add_argument('--start', type=int, default=0, help='timestamp in ns')
+    parser.add_argument('--end', type=int, default=MAX_TIMESTAMP_NS, help='timestamp in ns')
+    for name, default in DEFAULT_PARAMETERS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=parse_values, default=[default])
+    parser.add_argument('--inventory', type=float, default=500_000)
+    parser.add_argument('--cash', type=float, default=500)
+    parser.add_argument('--maker-fee', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=64, help='combinations simulated together by one worker')
+    parser.add_argument('--paths', action='store_true', help='also keep the sampled inventory and PnL paths')
+    parser.add_argument('--output', help='save all results as .npz')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    grid = parameter_grid(**{name: getattr(args, name) for name in DEFAULT_PARAMETERS})
+    sweep = Sweep(archive_dir=args.archive_dir, grid=grid, results_dir=args.results_dir, chunk_size=args.chunk_size, workers=args.workers, paths=args.paths, log_level='WARNING',
+                  start_ns=args.start, end_ns=args.end, initial_inventory=args.inventory, initial_cash=args.cash, maker_fee=args.maker_fee)
+    results = sweep.run()
+
+    print(f'{sweep.count} combinations in {sweep.chunks} chunks on {sweep.workers} workers, {sweep.events} events simulated in {sweep.wall_seconds:.1f} s ({sweep.cpu_seconds:.1f} s in workers)')
+    for i in np.argsort(-results['pnl'])[:args.top]:
+        parameters = ', '.join(f'{name}={results[name][i]:g}' for name in DEFAULT_PARAMETERS)
+        print(f"pnl {results['pnl'][i]:10.4f} USDT  inventory {results['inventory'][i]:12.0f}  fills {results['fills'][i]:6.0f}  volume {results['volume'][i]:10.2f}  {parameters}")
+
+    if args.output:
+        np.savez(args.output, **results)
+
+
+if __name__ == '__main__':
+    main()
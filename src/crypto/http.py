@@ -0,0 +1,35 @@
+import aiohttp
+import asyncio
+from loguru import logger
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_session(connection_limit: int = 100, connection_limit_per_host: int = 20, dns_cache_ttl: int = 300, keepalive_timeout: float = 60, request_timeout: float = 10) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=connection_limit,
+        limit_per_host=connection_limit_per_host,
+        ttl_dns_cache=dns_cache_ttl,
+        use_dns_cache=True,
+        keepalive_timeout=keepalive_timeout
+    )
+
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=request_timeout))
+
+
+async def request_with_retry(request, retries: int = 3, backoff: float = 0.5, max_backoff: float = 5):
+    attempt = 0
+
+    while True:
+        try:
+            status, data = await request()
+            if status not in RETRY_STATUSES or attempt >= retries:
+                return status, data
+            logger.warning(f'Request returned {status}, retrying ({attempt + 1}/{retries})')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt >= retries:
+                raise
+            logger.warning(f'Request failed: {e}, retrying ({attempt + 1}/{retries})')
+
+        await asyncio.sleep(min(backoff * 2 ** attempt, max_backoff))
+        attempt += 1
@@ -1,8 +1,7 @@
 import websockets
-import http.client
 import json
 from loguru import logger
-from src.model import CryptoCurrency, OrderBook, OrderLevel, ExchangeClient, EventType, QueueEvent
+from src.model import OrderBook, OrderLevel, ExchangeClient, EventType, QueueEvent, Symbol, DEFAULT_SYMBOL
 from decimal import Decimal
 import asyncio
 import time
@@ -11,42 +10,124 @@ import hmac
 import hashlib
 from src.database.client import DatabaseClient
 from datetime import datetime
+from src.crypto.http import request_with_retry
+from src.crypto.market.book import DepthBook, SIZE_DECIMALS, parse_fixed, price_to_ticks, size_to_units
+from typing import Optional
+
+KUCOIN_REST_URL = "https://api.kucoin.com"
+KUCOIN_TICK_SIZE = Decimal('0.00000001')
+KUCOIN_PRICE_DECIMALS = 8
+KUCOIN_DEPTH_TOPIC = "/spotMarket/level2Depth50:{symbols}"
+KUCOIN_SYMBOLS_PER_TOPIC = 100
 
 class KucoinClient(ExchangeClient):
-    def __init__(self, api_key: str, api_secret: str, api_passphrase: str, database_client: DatabaseClient, add_to_event_queue=None):
-        super().__init__(add_to_event_queue=add_to_event_queue, database_client=database_client, api_key=api_key, api_secret=api_secret)
+    def __init__(self, api_key: str, api_secret: str, api_passphrase: str, database_client: DatabaseClient, add_to_event_queue=None, archive=None, rest_base_url: str = KUCOIN_REST_URL, fixed_point: bool = False, symbol: Symbol = DEFAULT_SYMBOL, parent: Optional['KucoinClient'] = None):
+        super().__init__(add_to_event_queue=add_to_event_queue, database_client=database_client, api_key=api_key, api_secret=api_secret, archive=archive)
 
         self.api_passphrase = api_passphrase
+        self.rest_base_url = rest_base_url
+        self.fixed_point = fixed_point
+        self.symbol = symbol
+        self.parent = parent
+        self.clients = {symbol.pair: self}
+
+        # in fixed-point mode the levels are parsed straight into integer ticks of KUCOIN_TICK_SIZE
+        if fixed_point:
+            self.orderbook = DepthBook(tick_size=KUCOIN_TICK_SIZE)
+            self.levels = ([], [])
+
+        # counted for the metrics endpoint, the websocket of the children is that of their parent
+        self.book_updates = 0
+        self.reconnects = 0
+
+    def add_symbol(self, symbol: Symbol, add_to_event_queue, archive=None) -> 'KucoinClient':
+        client = KucoinClient(api_key=self.api_key, api_secret=self.api_secret, api_passphrase=self.api_passphrase, database_client=self.database_client, add_to_event_queue=add_to_event_queue, archive=archive, rest_base_url=self.rest_base_url, fixed_point=self.fixed_point, symbol=symbol, parent=self)
+        self.clients[symbol.pair] = client
+        return client
+
+    def get_orderbook(self):
+        # the fixed-point DepthBook changes in place, readers get a frozen copy of it like the MEXC book
+        if isinstance(self.orderbook, DepthBook):
+            return self.orderbook.freeze()
+        return self.orderbook
+
+    def get_session(self):
+        if self.parent is not None:
+            return self.parent.get_session()
+        return super().get_session()
 
-    @staticmethod
-    async def _get_ws_url_public():
-        connection = http.client.HTTPSConnection("api.kucoin.com")
-        payload = ''
-        headers = {}
-        connection.request("POST", "/api/v1/bullet-public", payload, headers)
-        response = connection.getresponse()
-        data = response.read()
-        parsed_data = json.loads(data)
+    async def close(self):
+        if self.parent is None:
+            await super().close()
+
+    async def _get_ws_url_public(self):
+        async def request():
+            async with self.get_session().post(self.rest_base_url + "/api/v1/bullet-public") as response:
+                return response.status, await response.json(content_type=None)
+
+        status, parsed_data = await request_with_retry(request, retries=3)
         ws_url = parsed_data["data"]["instanceServers"][0]["endpoint"] + "?token=" + parsed_data["data"]["token"]
 
         return ws_url
 
-    async def update_orderbook(self, first_currency: CryptoCurrency, second_currency: CryptoCurrency):
-        symbol = first_currency.value + '-' + second_currency.value
+    def update_levels(self, asks: list, bids: list) -> bool:
+        # returns False when the levels did not change
+        levels = (
+            [(parse_fixed(str(a[0]), KUCOIN_PRICE_DECIMALS), parse_fixed(str(a[1]), SIZE_DECIMALS)) for a in asks],
+            [(parse_fixed(str(b[0]), KUCOIN_PRICE_DECIMALS), parse_fixed(str(b[1]), SIZE_DECIMALS)) for b in bids]
+        )
+        if levels == self.levels:
+            return False
+
+        self.levels = levels
+        self.orderbook.load_snapshot(self.orderbook.version + 1, *levels)
+
+        if self.archive is not None:
+            self.archive.record_snapshot(timestamp_ns=time.time_ns(), asks=levels[0], bids=levels[1])
+        return True
+
+    async def handle_levels(self, data: dict):
+        if self.fixed_point:
+            if not self.update_levels(data['data']['asks'], data['data']['bids']):
+                return
+        else:
+            asks = [OrderLevel(price=Decimal(str(a[0])), size=Decimal(str(a[1])), id="") for a in data['data']['asks']]
+            bids = [OrderLevel(price=Decimal(str(a[0])), size=Decimal(str(a[1])), id="") for a in data['data']['bids']]
+
+            if self.orderbook.asks == asks and self.orderbook.bids == bids:
+                return
+
+            self.orderbook = OrderBook(asks=asks, bids=bids)
+
+            if self.archive is not None:
+                self.archive.record_snapshot(timestamp_ns=time.time_ns(), asks=[(price_to_ticks(ask.price, KUCOIN_TICK_SIZE), size_to_units(ask.size)) for ask in asks], bids=[(price_to_ticks(bid.price, KUCOIN_TICK_SIZE), size_to_units(bid.size)) for bid in bids])
+
+        self.book_updates += 1
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.database_client.record_orderbook(table='kucoin_orderbook', exchange='kucoin', orderbook=self.orderbook, timestamp=timestamp, symbol=self.symbol.pair)
+
+        event = QueueEvent(type=EventType.KUCOIN_ORDERBOOK_UPDATE, data=data)
+        await self.add_to_event_queue(event=event)
+
+    async def update_orderbook(self):
+        # one websocket for the depth of every symbol of this client and its children, KuCoin takes up to
+        # KUCOIN_SYMBOLS_PER_TOPIC symbols in one topic and tells them apart by the topic of each message
+        pairs = list(self.clients)
 
         while True:
             try:
                 ws_url = await self._get_ws_url_public()
-                subscribe_message = {
-                    "id": "sub-001",
-                    "type": "subscribe",
-                    "topic": f"/spotMarket/level2Depth50:{symbol}",
-                    "response": True
-                }
 
                 async with websockets.connect(ws_url, ping_interval=20, ping_timeout=20) as ws:
-                    await ws.send(json.dumps(subscribe_message))
-                    logger.info(f"Subscribed to topic {first_currency.value + second_currency.value}, KUCOIN")
+                    for i in range(0, len(pairs), KUCOIN_SYMBOLS_PER_TOPIC):
+                        subscribe_message = {
+                            "id": f"sub-{i // KUCOIN_SYMBOLS_PER_TOPIC + 1:03d}",
+                            "type": "subscribe",
+                            "topic": KUCOIN_DEPTH_TOPIC.format(symbols=','.join(pairs[i:i + KUCOIN_SYMBOLS_PER_TOPIC])),
+                            "response": True
+                        }
+                        await ws.send(json.dumps(subscribe_message))
+                    logger.info(f"Subscribed to {len(pairs)} symbols, KUCOIN")
 
                     async for message in ws:
                         try:
@@ -55,21 +136,13 @@ class KucoinClient(ExchangeClient):
                             if data['type'] != "message":
                                 continue
 
-                            asks = [OrderLevel(price=Decimal(str(a[0])), size=Decimal(str(a[1])), id="") for a in data['data']['asks']]
-                            bids = [OrderLevel(price=Decimal(str(a[0])), size=Decimal(str(a[1])), id="") for a in data['data']['bids']]
-
-                            if self.orderbook.asks == asks and self.orderbook.bids == bids:
-                                continue
-
-                            self.orderbook = OrderBook(asks=asks, bids=bids)
-
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            await self.database_client.record_orderbook(table='kucoin_orderbook', exchange='kucoin', orderbook=self.orderbook, timestamp=timestamp)
-
-                            event = QueueEvent(type=EventType.KUCOIN_ORDERBOOK_UPDATE, data=data)
-                            await self.add_to_event_queue(event=event)
+                            client = self.clients.get(data['topic'].rsplit(':', 1)[-1])
+                            if client is not None:
+                                await client.handle_levels(data)
                         except Exception as e:
                             logger.error(f'Exception: {e}')
             except Exception as e:
                 logger.error(f"Error: {e}")
-                await asyncio.sleep(5)
\ No newline at end of file
+                await asyncio.sleep(5)
+            finally:
+                self.reconnects += 1
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+from loguru import logger
+from src.model import DatabaseOrder, OrderAction, MAX_ORDERS_IN_FLIGHT, USE_BATCH_ORDERS
+from src.crypto.mexc.client import MexcClient
+from src.database.client import DatabaseClient
+
+MEXC_BATCH_ORDERS_LIMIT = 20
+
+
+def failures_as_none(action: str, results: list) -> list:
+    # a request that raised failed like one MEXC refused, its order is left as it was
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error(f'{action} failed: {result!r}')
+    return [None if isinstance(result, BaseException) else result for result in results]
+
+
+class OrderBatcher:
+    def __init__(self, mexc_client: MexcClient, database_client: DatabaseClient, max_in_flight: int = MAX_ORDERS_IN_FLIGHT, use_batch_endpoint: bool = USE_BATCH_ORDERS):
+        self.mexc_client = mexc_client
+        self.database_client = database_client
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.use_batch_endpoint = use_batch_endpoint
+
+    async def cancel(self, order: OrderAction):
+        async with self.semaphore:
+            return await self.mexc_client.cancel_order(order_id=order.order_id)
+
+    async def place(self, order: OrderAction, after: list[asyncio.Task]):
+        # an order waiting for cancellations is only placed once all of them went through
+        for task in after:
+            try:
+                if await task is None:
+                    return None
+            except Exception:
+                # logged with the result of the cancellation
+                return None
+
+        async with self.semaphore:
+            return await self.mexc_client.place_limit_order(side=order.side, order_type='limit', size=order.size, price=order.price)
+
+    async def place_batch(self, orders: list[OrderAction]) -> list[Optional[str]]:
+        async with self.semaphore:
+            return await self.mexc_client.place_batch_orders(orders=orders)
+
+    @staticmethod
+    def get_dependencies(cancels: list[OrderAction], cancel_tasks: list[asyncio.Task], places: list[OrderAction]) -> list[list[asyncio.Task]]:
+        # places are counted against the levels as if the cancels already went through, so a place that takes the level
+        # of a cancelled order waits for that cancel and one on the price of cancelled orders waits for all of them,
+        # a failed cancel then leaves its level to the order that is still live instead of adding one on top of it
+        pending_cancels: dict[tuple[str, Decimal], list[asyncio.Task]] = {}
+        for order, task in zip(cancels, cancel_tasks):
+            pending_cancels.setdefault((order.side, order.price), []).append(task)
+
+        dependencies = [list(pending_cancels.get((order.side, order.price), [])) for order in places]
+
+        for side in ('sell', 'buy'):
+            side_places = [i for i, order in enumerate(places) if order.side == side]
+            unpaired = [task for order, task in zip(cancels, cancel_tasks) if order.side == side]
+            free_levels = len(side_places) - len(unpaired)
+
+            unpaired_places = []
+            for i in side_places:
+                paired = next((task for task in dependencies[i] if task in unpaired), None)
+                if paired is None:
+                    unpaired_places.append(i)
+                else:
+                    unpaired.remove(paired)
+
+            for i in unpaired_places:
+                if free_levels > 0:
+                    free_levels -= 1
+                elif unpaired:
+                    dependencies[i].append(unpaired.pop(0))
+
+        return dependencies
+
+    async def execute(self, cancels: list[OrderAction], places: list[OrderAction]):
+        if not cancels and not places:
+            return
+
+        async with self.mexc_client.lock:
+            cancel_tasks = [asyncio.create_task(self.cancel(order)) for order in cancels]
+            dependencies = self.get_dependencies(cancels=cancels, cancel_tasks=cancel_tasks, places=places)
+
+            if self.use_batch_endpoint:
+                independent = [order for order, after in zip(places, dependencies) if not after]
+                dependent = [(order, after) for order, after in zip(places, dependencies) if after]
+
+                batches = [independent[i:i + MEXC_BATCH_ORDERS_LIMIT] for i in range(0, len(independent), MEXC_BATCH_ORDERS_LIMIT)]
+                batch_results = await asyncio.gather(*[self.place_batch(batch) for batch in batches], *[self.place(order, after=after) for order, after in dependent], return_exceptions=True)
+                batch_results = failures_as_none('Order placement', batch_results)
+
+                placed_ids = {}
+                for batch, result in zip(batches, batch_results[:len(batches)]):
+                    for order, order_id in zip(batch, result or [None] * len(batch)):
+                        placed_ids[id(order)] = order_id
+                for (order, _), order_id in zip(dependent, batch_results[len(batches):]):
+                    placed_ids[id(order)] = order_id
+
+                place_results = [placed_ids.get(id(order)) for order in places]
+            else:
+                place_results = await asyncio.gather(*[self.place(order, after=after) for order, after in zip(places, dependencies)], return_exceptions=True)
+                place_results = failures_as_none('Order placement', place_results)
+
+            cancel_results = failures_as_none('Order cancellation', await asyncio.gather(*cancel_tasks, return_exceptions=True))
+
+        self.reconcile(cancels=cancels, cancel_results=cancel_results, places=places, place_results=place_results)
+
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        await asyncio.gather(*[
+            self.database_client.record_order(order=DatabaseOrder(pair=self.mexc_client.symbol.pair, side=order.side, price=order.price, size=order.size, order_id=order_id, timestamp=timestamp), table_name="every_order_placed")
+            for order, order_id in zip(places, place_results) if order_id is not None
+        ])
+
+    def reconcile(self, cancels: list[OrderAction], cancel_results: list, places: list[OrderAction], place_results: list[Optional[str]]):
+        active_orders = self.mexc_client.active_orders
+
+        for order, result in zip(cancels, cancel_results):
+            if result is not None:
+                active_orders.remove(order_id=order.order_id)
+
+        for order, order_id in zip(places, place_results):
+            if order_id is not None:
+                active_orders.add(side=order.side, order_id=order_id, price=order.price, size=order.size)
@@ -0,0 +1,412 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+from typing import Iterator, Optional
+from src.model import OrderBook, OrderLevel, MEXC_TICK_SIZE, FAIR_PRICE_LEVELS
+
+SIZE_SCALE = 10 ** 8
+SIZE_DECIMALS = 8
+DECIMAL_SIZE_SCALE = Decimal(SIZE_SCALE)
+MIN_TICK = -2 ** 63
+MAX_TICK = 2 ** 63 - 1
+
+
+def price_to_ticks(price: Decimal, tick_size: Decimal = MEXC_TICK_SIZE) -> int:
+    return int((price / tick_size).to_integral_value())
+
+
+def ticks_to_price(ticks: int, tick_size: Decimal = MEXC_TICK_SIZE) -> Decimal:
+    return ticks * tick_size
+
+
+def size_to_units(size: Decimal) -> int:
+    return int((size * DECIMAL_SIZE_SCALE).to_integral_value())
+
+
+def units_to_size(units: int) -> Decimal:
+    return Decimal(units) / DECIMAL_SIZE_SCALE
+
+
+def parse_fixed(value: str, decimals: int) -> int:
+    # exact for plain decimal strings, digits beyond the scale are truncated
+    whole, _, fraction = value.partition('.')
+    return int(whole or '0') * 10 ** decimals + int(fraction[:decimals].ljust(decimals, '0'))
+
+
+class DepthWindow:
+    # running sum of tick * units over the levels of one side with low <= tick <= high
+    __slots__ = ('low', 'high', 'notional')
+
+    def __init__(self):
+        self.low = 0
+        self.high = -1
+        self.notional = 0
+
+    def copy(self) -> 'DepthWindow':
+        window = DepthWindow()
+        window.low, window.high, window.notional = self.low, self.high, self.notional
+        return window
+
+
+class BookSide:
+    def __init__(self):
+        # both arrays are kept sorted by ascending tick, sizes[i] belongs to ticks[i], shared arrays also belong to a
+        # frozen side and are copied before the next change
+        self.ticks = array('q')
+        self.sizes = array('q')
+        self.windows: list[DepthWindow] = []
+        self.shared = False
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def clear(self):
+        if self.shared:
+            self.ticks, self.sizes, self.shared = array('q'), array('q'), False
+        else:
+            del self.ticks[:]
+            del self.sizes[:]
+        for window in self.windows:
+            window.notional = 0
+
+    def unshare(self):
+        self.ticks, self.sizes, self.shared = array('q', self.ticks), array('q', self.sizes), False
+
+    def frozen(self) -> 'BookSide':
+        side = BookSide()
+        side.ticks, side.sizes = self.ticks, self.sizes
+        side.shared = self.shared = True
+        return side
+
+    def notional(self, low: int, high: int) -> int:
+        ticks, sizes = self.ticks, self.sizes
+        return sum(ticks[i] * sizes[i] for i in range(bisect_left(ticks, low), bisect_right(ticks, high)))
+
+    def move_window(self, window: DepthWindow, low: int, high: int):
+        # only the levels between the old and the new bounds are visited
+        if low > window.high or high < window.low or window.low > window.high:
+            window.notional = self.notional(low, high) if low <= high else 0
+        else:
+            if low < window.low:
+                window.notional += self.notional(low, window.low - 1)
+            elif low > window.low:
+                window.notional -= self.notional(window.low, low - 1)
+            if high > window.high:
+                window.notional += self.notional(window.high + 1, high)
+            elif high < window.high:
+                window.notional -= self.notional(high + 1, window.high)
+        window.low, window.high = low, high
+
+    def changed(self, tick: int, delta: int):
+        for window in self.windows:
+            if window.low <= tick <= window.high:
+                window.notional += tick * delta
+
+    def get(self, tick: int) -> int:
+        i = bisect_left(self.ticks, tick)
+        if i < len(self.ticks) and self.ticks[i] == tick:
+            return self.sizes[i]
+        return 0
+
+    def set(self, tick: int, size: int) -> bool:
+        i = bisect_left(self.ticks, tick)
+        found = i < len(self.ticks) and self.ticks[i] == tick
+
+        if size == 0:
+            if not found:
+                return False
+            if self.shared:
+                self.unshare()
+            if self.windows:
+                self.changed(tick, -self.sizes[i])
+            del self.ticks[i]
+            del self.sizes[i]
+            return True
+
+        if found:
+            if self.sizes[i] == size:
+                return False
+            if self.shared:
+                self.unshare()
+            if self.windows:
+                self.changed(tick, size - self.sizes[i])
+            self.sizes[i] = size
+            return True
+
+        if self.shared:
+            self.unshare()
+        if self.windows:
+            self.changed(tick, size)
+        self.ticks.insert(i, tick)
+        self.sizes.insert(i, size)
+        return True
+
+
+class DepthBook:
+    def __init__(self, tick_size: Decimal = MEXC_TICK_SIZE):
+        self.tick_size = tick_size
+        self.ask_side = BookSide()
+        self.bid_side = BookSide()  # ascending as well, best bid is the last level
+
+        self.version = 0
+        self.synced = False
+        self.update_id = 0
+
+        self._asks_view = ([], -1)
+        self._bids_view = ([], -1)
+        self._frozen: tuple[Optional[DepthBook], int] = (None, -1)
+
+        self.analytics = BookAnalytics(self)
+
+    def reset(self):
+        self.ask_side.clear()
+        self.bid_side.clear()
+        self.version = 0
+        self.synced = False
+        self.update_id += 1
+
+    def load_snapshot(self, version: int, asks: list[tuple[int, int]], bids: list[tuple[int, int]]):
+        self.reset()
+
+        for tick, size in asks:
+            self.ask_side.set(tick, size)
+        for tick, size in bids:
+            self.bid_side.set(tick, size)
+
+        self.version = version
+        self.synced = True
+
+    def apply_diff(self, from_version: int, to_version: int, asks: list[tuple[int, int]], bids: list[tuple[int, int]]) -> bool:
+        # returns False when a gap in versions is detected and the book has to be resynced
+        if to_version <= self.version:
+            return True
+
+        if from_version > self.version + 1:
+            self.synced = False
+            return False
+
+        changed = False
+        for tick, size in asks:
+            changed |= self.ask_side.set(tick, size)
+        for tick, size in bids:
+            changed |= self.bid_side.set(tick, size)
+
+        self.version = to_version
+        if changed:
+            self.update_id += 1
+
+        return True
+
+    @property
+    def best_ask(self) -> Optional[int]:
+        return self.ask_side.ticks[0] if self.ask_side.ticks else None
+
+    @property
+    def best_bid(self) -> Optional[int]:
+        return self.bid_side.ticks[-1] if self.bid_side.ticks else None
+
+    def get_asks(self, depth: Optional[int] = None) -> list[OrderLevel]:
+        count = len(self.ask_side) if depth is None else min(depth, len(self.ask_side))
+        ticks, sizes = self.ask_side.ticks, self.ask_side.sizes
+        return [OrderLevel(id="", price=ticks[i] * self.tick_size, size=Decimal(sizes[i]) / DECIMAL_SIZE_SCALE) for i in range(count)]
+
+    def get_bids(self, depth: Optional[int] = None) -> list[OrderLevel]:
+        count = len(self.bid_side) if depth is None else min(depth, len(self.bid_side))
+        ticks, sizes = self.bid_side.ticks, self.bid_side.sizes
+        last = len(ticks) - 1
+        return [OrderLevel(id="", price=ticks[last - i] * self.tick_size, size=Decimal(sizes[last - i]) / DECIMAL_SIZE_SCALE) for i in range(count)]
+
+    @property
+    def asks(self) -> list[OrderLevel]:
+        levels, update_id = self._asks_view
+        if update_id != self.update_id:
+            levels = self.get_asks()
+            self._asks_view = (levels, self.update_id)
+        return levels
+
+    @property
+    def bids(self) -> list[OrderLevel]:
+        levels, update_id = self._bids_view
+        if update_id != self.update_id:
+            levels = self.get_bids()
+            self._bids_view = (levels, self.update_id)
+        return levels
+
+    def freeze(self) -> 'DepthBook':
+        # a copy that never changes for readers that keep the book across awaits, made once per update: it shares the
+        # level arrays, the next change of a side copies them, and starts with the analytics of this book
+        book, update_id = self._frozen
+        if book is None or update_id != self.update_id:
+            book = DepthBook(tick_size=self.tick_size)
+            book.ask_side, book.bid_side = self.ask_side.frozen(), self.bid_side.frozen()
+            book.version, book.synced, book.update_id = self.version, self.synced, self.update_id
+            self.analytics.copy_to(book.analytics)
+            self._frozen = (book, self.update_id)
+        return book
+
+    def to_orderbook(self, depth: Optional[int] = None) -> OrderBook:
+        return OrderBook(asks=self.get_asks(depth), bids=self.get_bids(depth))
+
+    def without(self, orders) -> 'ExternalBook':
+        # orders is an OrderBook or an ActiveOrderStore, which keeps the units of our orders per tick up to date
+        if isinstance(orders, OrderBook):
+            return ExternalBook(book=self, own_asks=own_depth(orders.asks, self.tick_size), own_bids=own_depth(orders.bids, self.tick_size))
+        return ExternalBook(book=self, own_asks=orders.ask_side.depth, own_bids=orders.bid_side.depth)
+
+
+def own_depth(orders: list[OrderLevel], tick_size: Decimal = MEXC_TICK_SIZE) -> dict[int, int]:
+    # units of our orders per tick
+    depth = {}
+    for order in orders:
+        tick = price_to_ticks(order.price, tick_size)
+        depth[tick] = depth.get(tick, 0) + size_to_units(order.size)
+    return depth
+
+
+class ExternalBook:
+    # the book without our own orders: levels are read from the DepthBook arrays and our units are subtracted per tick
+    # on the way, nothing is copied and levels taken completely by our orders are skipped
+    def __init__(self, book: DepthBook, own_asks: dict[int, int], own_bids: dict[int, int]):
+        self.book = book
+        self.own_asks = own_asks
+        self.own_bids = own_bids
+
+    def asks(self, levels: Optional[int] = None) -> Iterator[tuple[int, int]]:
+        # (tick, units) from the best ask, levels limits how many levels of the full book are looked at
+        ticks, sizes, own = self.book.ask_side.ticks, self.book.ask_side.sizes, self.own_asks
+        for i in range(len(ticks) if levels is None else min(levels, len(ticks))):
+            units = sizes[i] - own.get(ticks[i], 0) if own else sizes[i]
+            if units > 0:
+                yield ticks[i], units
+
+    def bids(self, levels: Optional[int] = None) -> Iterator[tuple[int, int]]:
+        ticks, sizes, own = self.book.bid_side.ticks, self.book.bid_side.sizes, self.own_bids
+        last = len(ticks) - 1
+        for i in range(len(ticks) if levels is None else min(levels, len(ticks))):
+            units = sizes[last - i] - own.get(ticks[last - i], 0) if own else sizes[last - i]
+            if units > 0:
+                yield ticks[last - i], units
+
+    def real_fair_price(self, levels: int = FAIR_PRICE_LEVELS) -> Decimal:
+        # calculate_real_fair_price(subtract_orderbooks(top levels, our orders)) in integer ticks and units
+        numerator = 0
+        volume = 0
+        for (ask_tick, ask_units), (bid_tick, bid_units) in zip(self.asks(levels), self.bids(levels)):
+            numerator += bid_tick * ask_units + ask_tick * bid_units
+            volume += ask_units + bid_units
+
+        if volume == 0:
+            return Decimal('0')
+        return Decimal(numerator) / Decimal(volume) * self.book.tick_size
+
+
+class BookAnalytics:
+    # the numbers calculations.py derives from a book, kept up to date by the book instead of rescanning it: depth windows
+    # follow every level change and only walk the levels crossed when the mid moves, everything else is cached per update_id
+    def __init__(self, book: DepthBook):
+        self.book = book
+        self.windows: dict[Decimal, tuple[DepthWindow, DepthWindow]] = {}
+        self.window_mid: dict[Decimal, tuple[int, int]] = {}
+        self.cache: dict[tuple, tuple[int, object]] = {}
+        self.source: Optional[BookAnalytics] = None
+
+    def copy_to(self, analytics: 'BookAnalytics'):
+        # the windows are brought up to date here, where they follow every change, and copied with the cached values
+        for percent in self.windows:
+            self.market_notional(percent)
+        for percent, (ask_window, bid_window) in self.windows.items():
+            analytics.windows[percent] = (ask_window.copy(), bid_window.copy())
+            analytics.book.ask_side.windows.append(analytics.windows[percent][0])
+            analytics.book.bid_side.windows.append(analytics.windows[percent][1])
+        analytics.window_mid = dict(self.window_mid)
+        analytics.cache = dict(self.cache)
+        analytics.source = self
+
+    def add_windows(self, percent: Decimal):
+        # a percent first asked of a frozen copy is followed by the book it was made from as well
+        self.windows[percent] = (DepthWindow(), DepthWindow())
+        self.book.ask_side.windows.append(self.windows[percent][0])
+        self.book.bid_side.windows.append(self.windows[percent][1])
+        if self.source is not None and percent not in self.source.windows:
+            self.source.add_windows(percent)
+
+    def cached(self, key: tuple, calculate):
+        update_id, value = self.cache.get(key, (-1, None))
+        if update_id != self.book.update_id:
+            value = calculate()
+            self.cache[key] = (self.book.update_id, value)
+        return value
+
+    @property
+    def best_ask_price(self) -> Optional[Decimal]:
+        best_ask = self.book.best_ask
+        return None if best_ask is None else best_ask * self.book.tick_size
+
+    @property
+    def best_bid_price(self) -> Optional[Decimal]:
+        best_bid = self.book.best_bid
+        return None if best_bid is None else best_bid * self.book.tick_size
+
+    @property
+    def mid_price(self) -> Optional[Decimal]:
+        return self.cached(('mid',), self.calculate_mid_price)
+
+    def calculate_mid_price(self) -> Optional[Decimal]:
+        if self.book.best_ask is None or self.book.best_bid is None:
+            return None
+        return (self.best_ask_price + self.best_bid_price) / 2
+
+    @property
+    def spread(self) -> Optional[Decimal]:
+        return self.cached(('spread',), self.calculate_spread)
+
+    def calculate_spread(self) -> Optional[Decimal]:
+        # same operations as calculate_market_spread so the result is rounded the same way
+        mid_price = self.mid_price
+        if mid_price is None:
+            return None
+        return (self.best_ask_price - self.best_bid_price) / mid_price * 100
+
+    def market_depth(self, percent: Decimal) -> Decimal:
+        return self.cached(('depth', percent), lambda: Decimal(self.market_notional(percent)) * self.book.tick_size / DECIMAL_SIZE_SCALE)
+
+    def market_notional(self, percent: Decimal) -> int:
+        # market depth in ticks * units
+        best_ask, best_bid = self.book.best_ask, self.book.best_bid
+        if best_ask is None or best_bid is None:
+            return 0
+
+        if percent not in self.windows:
+            self.add_windows(percent)
+        ask_window, bid_window = self.windows[percent]
+
+        if self.window_mid.get(percent) != (best_ask, best_bid):
+            # price <= mid * (1 + percent / 100) and price >= mid * (1 - percent / 100) in ticks, mid being (best_ask + best_bid) / 2
+            ticks = Decimal(best_ask + best_bid)
+            upper = (ticks * (100 + percent) / 200).to_integral_value(rounding=ROUND_FLOOR)
+            lower = (ticks * (100 - percent) / 200).to_integral_value(rounding=ROUND_CEILING)
+            self.book.ask_side.move_window(ask_window, MIN_TICK, int(upper))
+            self.book.bid_side.move_window(bid_window, int(lower), MAX_TICK)
+            self.window_mid[percent] = (best_ask, best_bid)
+
+        return ask_window.notional + bid_window.notional
+
+    def real_fair_price(self, levels: int = FAIR_PRICE_LEVELS) -> Decimal:
+        return self.cached(('real_fair_price', levels), lambda: self.calculate_real_fair_price(levels))
+
+    def calculate_real_fair_price(self, levels: int) -> Decimal:
+        # calculate_real_fair_price over the top levels in integer ticks and units
+        ask_ticks, ask_sizes = self.book.ask_side.ticks, self.book.ask_side.sizes
+        bid_ticks, bid_sizes = self.book.bid_side.ticks, self.book.bid_side.sizes
+        count = min(levels, len(ask_ticks), len(bid_ticks))
+        last = len(bid_ticks) - 1
+
+        numerator = 0
+        volume = 0
+        for i in range(count):
+            numerator += bid_ticks[last - i] * ask_sizes[i] + ask_ticks[i] * bid_sizes[last - i]
+            volume += ask_sizes[i] + bid_sizes[last - i]
+
+        if volume == 0:
+            return Decimal('0')
+        return Decimal(numerator) / Decimal(volume) * self.book.tick_size
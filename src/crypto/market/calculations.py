@@ -1,12 +1,23 @@
 from decimal import Decimal, ROUND_HALF_DOWN, ROUND_HALF_UP
+from functools import cache
 from src.crypto.mexc.client import MexcClient
-from src.crypto.kucoin.client import KucoinClient
-from src.model import ExchangeClient, OrderLevel, INVENTORY_BALANCE, INVENTORY_LIMIT, MEXC_TICK_SIZE, OrderBook
+from src.crypto.kucoin.client import KucoinClient, KUCOIN_TICK_SIZE
+from typing import Optional
+from loguru import logger
+from src.crypto.market.book import DepthBook, ExternalBook, size_to_units
+from src.model import ExchangeClient, OrderLevel, Symbol, FAIR_PRICE_LEVELS, OrderBook
 
 
 def calculate_market_depth(client: ExchangeClient, percent: Decimal) -> Decimal:
     orderbook = client.get_orderbook()
 
+    if isinstance(orderbook, DepthBook):
+        return orderbook.analytics.market_depth(percent)
+
+    return calculate_orderbook_depth(orderbook=orderbook, percent=percent)
+
+
+def calculate_orderbook_depth(orderbook: OrderBook, percent: Decimal) -> Decimal:
     if len(orderbook.asks) == 0 or len(orderbook.bids) == 0:
         return Decimal('0')
 
@@ -58,22 +69,22 @@ def subtract_orderbooks(main_orderbook, subtract_orderbook):
     result_asks = []
     result_bids = []
 
+    # IDs of the first main orderbook level at every price
+    ask_ids = {level.price: level.id for level in reversed(main_orderbook.asks)}
+    bid_ids = {level.price: level.id for level in reversed(main_orderbook.bids)}
+
     # Process asks (should be sorted by price ascending)
     for price in sorted(ask_sizes.keys()):
         size = ask_sizes[price]
         if size > 0:
             # Use the ID from main orderbook if available, otherwise empty
-            original_level = next((l for l in main_orderbook.asks if l.price == price), None)
-            id_value = original_level.id if original_level else ''
-            result_asks.append(OrderLevel(id=id_value, price=price, size=size))
+            result_asks.append(OrderLevel(id=ask_ids.get(price, ''), price=price, size=size))
 
     # Process bids (should be sorted by price descending)
     for price in sorted(bid_sizes.keys(), reverse=True):
         size = bid_sizes[price]
         if size > 0:
-            original_level = next((l for l in main_orderbook.bids if l.price == price), None)
-            id_value = original_level.id if original_level else ''
-            result_bids.append(OrderLevel(id=id_value, price=price, size=size))
+            result_bids.append(OrderLevel(id=bid_ids.get(price, ''), price=price, size=size))
 
     return OrderBook(asks=result_asks, bids=result_bids)
 
@@ -113,34 +124,34 @@ def calculate_real_fair_price(orderbook):
 
 
 def calculate_fair_price(mexc_client: MexcClient, kucoin_client: KucoinClient, active_bids: list[OrderLevel], active_asks: list[OrderLevel], percent: Decimal):
-    mexc_orderbook = mexc_client.get_orderbook()
+    state = mexc_client.get_state()
+    mexc_orderbook = state.book
     kucoin_orderbook = kucoin_client.get_orderbook()
 
-    our_mexc_orders = mexc_client.get_active_orders()
-    #print(our_mexc_orders)
+    #print(state.active_orders)
     #print(mexc_orderbook)
-    #print(subtract_orderbooks(mexc_orderbook, our_mexc_orders))
-    real_fair_price = calculate_real_fair_price(subtract_orderbooks(mexc_orderbook, our_mexc_orders))
-    real_fair_price = round(Decimal(real_fair_price), 5)
+    real_fair_price = ExternalBook(book=mexc_orderbook, own_asks=state.own_asks, own_bids=state.own_bids).real_fair_price(levels=FAIR_PRICE_LEVELS)
+    real_fair_price = Decimal(real_fair_price).quantize(mexc_client.symbol.tick_size)
     #print("Real MexC Fair Price: ", real_fair_price)
 
 
-    if len(mexc_orderbook.asks) == 0 or len(kucoin_orderbook.asks) == 0:
+    mexc_mid_price = mexc_orderbook.analytics.mid_price
+    if mexc_mid_price is None or len(kucoin_orderbook.asks) == 0:
         return None, None
 
-    mexc_mid_price = (mexc_orderbook.asks[0].price + mexc_orderbook.bids[0].price) / 2
     kucoin_mid_price = (kucoin_orderbook.asks[0].price + kucoin_orderbook.bids[0].price) / 2
 
     kucoin_liquidity = calculate_market_depth(client=kucoin_client, percent=percent)
     mexc_liquidity = calculate_market_depth(client=mexc_client, percent=percent)
 
-    fair_price = ((mexc_mid_price * mexc_liquidity + kucoin_mid_price * kucoin_liquidity) / (mexc_liquidity + kucoin_liquidity)).quantize(Decimal('0.00001'), rounding=ROUND_HALF_UP)
+    tick_size = mexc_client.symbol.tick_size
+    fair_price = ((mexc_mid_price * mexc_liquidity + kucoin_mid_price * kucoin_liquidity) / (mexc_liquidity + kucoin_liquidity)).quantize(tick_size, rounding=ROUND_HALF_UP)
 
     if fair_price > kucoin_orderbook.asks[0].price:
-        fair_price = kucoin_orderbook.asks[0].price.quantize(Decimal('0.00001'), rounding=ROUND_HALF_DOWN)
+        fair_price = kucoin_orderbook.asks[0].price.quantize(tick_size, rounding=ROUND_HALF_DOWN)
 
     if fair_price < kucoin_orderbook.bids[0].price:
-        fair_price = kucoin_orderbook.bids[0].price.quantize(Decimal('0.00001'), rounding=ROUND_HALF_UP)
+        fair_price = kucoin_orderbook.bids[0].price.quantize(tick_size, rounding=ROUND_HALF_UP)
 
     if real_fair_price is None:
         return fair_price, fair_price
@@ -151,6 +162,13 @@ def calculate_fair_price(mexc_client: MexcClient, kucoin_client: KucoinClient, a
 def calculate_market_spread(client: ExchangeClient):
     orderbook = client.get_orderbook()
 
+    if isinstance(orderbook, DepthBook):
+        return orderbook.analytics.spread
+
+    return calculate_orderbook_spread(orderbook=orderbook)
+
+
+def calculate_orderbook_spread(orderbook: OrderBook):
     if len(orderbook.asks) == 0 or len(orderbook.bids) == 0:
         return None
 
@@ -164,23 +182,113 @@ def calculate_market_spread(client: ExchangeClient):
 
 
 def get_quotes(mexc_client: MexcClient, kucoin_client: KucoinClient):
-    active_orders = mexc_client.get_active_orders()
-    balance = mexc_client.get_balance()
+    symbol = mexc_client.symbol
+    state = mexc_client.get_state()
+    active_orders = state.active_orders
+    balance = state.balance
 
     fair_price, real_fair_price = calculate_fair_price(mexc_client=mexc_client, kucoin_client=kucoin_client, active_asks=active_orders.asks, active_bids=active_orders.bids, percent=Decimal('2'))
 
-    if fair_price is None or 'RMV' not in balance or 'USDT' not in balance:
+    if fair_price is None or symbol.base not in balance or symbol.quote not in balance:
         return None, None
 
-    current_inventory = balance['RMV']['free'] + balance['RMV']['locked']
-    half_spread = Decimal('0.00002')
+    current_inventory = balance[symbol.base]['free'] + balance[symbol.base]['locked']
+    half_spread = symbol.half_spread
     alpha = half_spread * Decimal('0.5')
-    normalized_inventory_position = (current_inventory - INVENTORY_BALANCE) / INVENTORY_LIMIT
+    normalized_inventory_position = (current_inventory - symbol.inventory_balance) / symbol.inventory_limit
 
     ask_price = fair_price + half_spread - alpha * normalized_inventory_position
     bid_price = fair_price - half_spread - alpha * normalized_inventory_position
 
-    ask_price = ask_price.quantize(MEXC_TICK_SIZE, rounding=ROUND_HALF_UP)
-    bid_price = bid_price.quantize(MEXC_TICK_SIZE, rounding=ROUND_HALF_UP)
+    ask_price = ask_price.quantize(symbol.tick_size, rounding=ROUND_HALF_UP)
+    bid_price = bid_price.quantize(symbol.tick_size, rounding=ROUND_HALF_UP)
+
+    return ask_price, bid_price
+
+
+# fixed-point versions: prices in integer ticks, sizes in integer units, exact rational arithmetic rounded once where the
+# Decimal versions quantize, they need a DepthBook on both exchanges (KucoinClient with fixed_point=True)
+
+@cache
+def tick_scale(symbol: Symbol) -> Optional[int]:
+    # KuCoin ticks in a MEXC tick of the symbol, the fair price is computed in KuCoin ticks so this has to be a whole
+    # number, symbols with a finer or not evenly divided MEXC tick are quoted with the Decimal versions
+    scale, remainder = divmod(symbol.tick_size, KUCOIN_TICK_SIZE)
+    if scale < 1 or remainder != 0:
+        logger.warning(f'MEXC tick size {symbol.tick_size} of {symbol.name} is not a multiple of the KuCoin tick size {KUCOIN_TICK_SIZE}, quoting it without fixed point')
+        return None
+    return int(scale)
+
+
+@cache
+def quote_parameters(symbol: Symbol) -> tuple[tuple[int, int], tuple[int, int], int, int]:
+    # half spread and alpha in ticks as exact ratios, inventory balance and limit in units
+    if tick_scale(symbol) is None:
+        raise ValueError(f'MEXC tick size {symbol.tick_size} of {symbol.name} is not a multiple of the KuCoin tick size {KUCOIN_TICK_SIZE}')
+
+    half_spread = (symbol.half_spread / symbol.tick_size).as_integer_ratio()
+    alpha = (symbol.half_spread * Decimal('0.5') / symbol.tick_size).as_integer_ratio()
+    return half_spread, alpha, size_to_units(symbol.inventory_balance), size_to_units(symbol.inventory_limit)
+
+
+def round_half_up(numerator: int, denominator: int) -> int:
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def round_half_down(numerator: int, denominator: int) -> int:
+    return -((denominator - 2 * numerator) // (2 * denominator))
+
+
+def calculate_fair_price_ticks(mexc_client: MexcClient, kucoin_client: KucoinClient, percent: Decimal) -> Optional[int]:
+    mexc_orderbook = mexc_client.get_orderbook()
+    kucoin_orderbook = kucoin_client.get_orderbook()
+
+    mexc_ask, mexc_bid = mexc_orderbook.best_ask, mexc_orderbook.best_bid
+    kucoin_ask, kucoin_bid = kucoin_orderbook.best_ask, kucoin_orderbook.best_bid
+    if mexc_ask is None or mexc_bid is None or kucoin_ask is None or kucoin_bid is None:
+        return None
+
+    # everything in KuCoin ticks, mids doubled
+    scale = tick_scale(mexc_client.symbol)
+    if scale is None:
+        return None
+    mexc_liquidity = mexc_orderbook.analytics.market_notional(percent) * scale
+    kucoin_liquidity = kucoin_orderbook.analytics.market_notional(percent)
+    liquidity = mexc_liquidity + kucoin_liquidity
+    if liquidity == 0:
+        return None
+
+    numerator = (mexc_ask + mexc_bid) * scale * mexc_liquidity + (kucoin_ask + kucoin_bid) * kucoin_liquidity
+    fair_price = round_half_up(numerator, 2 * scale * liquidity)
+
+    if fair_price * scale > kucoin_ask:
+        fair_price = round_half_down(kucoin_ask, scale)
+
+    if fair_price * scale < kucoin_bid:
+        fair_price = round_half_up(kucoin_bid, scale)
+
+    return fair_price
+
+
+def get_quote_ticks(mexc_client: MexcClient, kucoin_client: KucoinClient) -> tuple[Optional[int], Optional[int]]:
+    symbol = mexc_client.symbol
+    balance = mexc_client.get_state().balance
+
+    fair_price = calculate_fair_price_ticks(mexc_client=mexc_client, kucoin_client=kucoin_client, percent=Decimal('2'))
+
+    if fair_price is None or symbol.base not in balance or symbol.quote not in balance:
+        return None, None
+
+    current_inventory = size_to_units(balance[symbol.base]['free'] + balance[symbol.base]['locked'])
+
+    # fair_price +- half_spread - alpha * (inventory - balance) / limit over one denominator
+    (half_spread, half_spread_denominator), (alpha, alpha_denominator), inventory_balance, inventory_limit = quote_parameters(symbol)
+    denominator = half_spread_denominator * alpha_denominator * inventory_limit
+    skew = -alpha * half_spread_denominator * (current_inventory - inventory_balance)
+    spread = half_spread * alpha_denominator * inventory_limit
+
+    ask_price = round_half_up(fair_price * denominator + spread + skew, denominator)
+    bid_price = round_half_up(fair_price * denominator - spread + skew, denominator)
+
+    return ask_price, bid_price
 
-    return ask_price, bid_price
\ No newline at end of file
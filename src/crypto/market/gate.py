@@ -0,0 +1,28 @@
+from typing import Any, Optional
+
+
+class QuoteGate:
+    # remembers the last manage_orders pass that had nothing to cancel and every level filled, keyed on the quotes and
+    # the version of our orders: a tick with the same key finds the same unless the mid moved past one of our large
+    # orders, far_ask and far_bid are the outermost of those in the units of the bounds
+    def __init__(self):
+        self.key: Optional[tuple] = None
+        self.far_ask: Any = None
+        self.far_bid: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def skip(self, key: tuple, upper_bound: Any, lower_bound: Any) -> bool:
+        if key == self.key and (self.far_ask is None or self.far_ask <= upper_bound) and (self.far_bid is None or self.far_bid >= lower_bound):
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def remember(self, key: tuple, far_ask: Any, far_bid: Any):
+        self.key, self.far_ask, self.far_bid = key, far_ask, far_bid
+
+    def get_stats(self) -> dict:
+        passes = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / passes if passes else 0.0}
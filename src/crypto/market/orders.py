@@ -0,0 +1,177 @@
+import itertools
+from bisect import bisect_left
+from decimal import Decimal
+from typing import Optional
+from src.model import OrderBook, OrderLevel, MEXC_TICK_SIZE
+from src.crypto.market.book import price_to_ticks, size_to_units
+
+
+# orders per chunk of an OrderSide, a side splits into chunks of this size once it holds twice as many
+CHUNK_SIZE = 64
+
+
+class OrderSide:
+    # orders sorted by (signed tick, sequence): asks from the lowest price, bids from the highest, orders on the same
+    # price in the order they were added, like the stable sorts this replaces. kept in sorted chunks like a
+    # sortedcontainers SortedList: a bisect over the last key of every chunk finds the chunk, an insert or a delete
+    # moves at most 2 * CHUNK_SIZE entries instead of every order behind it
+    def __init__(self, sign: int):
+        self.sign = sign
+        self.key_chunks: list[list[tuple[int, int]]] = []
+        self.order_chunks: list[list[OrderLevel]] = []
+        self.maxes: list[tuple[int, int]] = []
+        self.count = 0
+        self.depth: dict[int, int] = {}
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def orders(self) -> list[OrderLevel]:
+        return list(itertools.chain.from_iterable(self.order_chunks))
+
+    def locate(self, key: tuple[int, int]) -> tuple[int, int]:
+        chunk = bisect_left(self.maxes, key)
+        return chunk, bisect_left(self.key_chunks[chunk], key)
+
+    def insert(self, key: tuple[int, int], order: OrderLevel):
+        if not self.maxes:
+            self.key_chunks.append([key])
+            self.order_chunks.append([order])
+            self.maxes.append(key)
+        else:
+            # keys only grow within a tick, a key past the last chunk goes to its end
+            chunk = min(bisect_left(self.maxes, key), len(self.maxes) - 1)
+            keys, orders = self.key_chunks[chunk], self.order_chunks[chunk]
+            i = bisect_left(keys, key)
+            keys.insert(i, key)
+            orders.insert(i, order)
+            self.maxes[chunk] = keys[-1]
+
+            if len(keys) > 2 * CHUNK_SIZE:
+                self.key_chunks[chunk:chunk + 1] = [keys[:CHUNK_SIZE], keys[CHUNK_SIZE:]]
+                self.order_chunks[chunk:chunk + 1] = [orders[:CHUNK_SIZE], orders[CHUNK_SIZE:]]
+                self.maxes.insert(chunk, keys[CHUNK_SIZE - 1])
+
+        self.count += 1
+        self.add_depth(key[0] * self.sign, size_to_units(order.size))
+
+    def remove(self, key: tuple[int, int]) -> OrderLevel:
+        chunk, i = self.locate(key)
+        keys, orders = self.key_chunks[chunk], self.order_chunks[chunk]
+        del keys[i]
+        order = orders.pop(i)
+
+        if keys:
+            self.maxes[chunk] = keys[-1]
+        else:
+            del self.key_chunks[chunk], self.order_chunks[chunk], self.maxes[chunk]
+
+        self.count -= 1
+        self.add_depth(key[0] * self.sign, -size_to_units(order.size))
+        return order
+
+    def replace(self, key: tuple[int, int], order: OrderLevel) -> OrderLevel:
+        chunk, i = self.locate(key)
+        orders = self.order_chunks[chunk]
+        previous, orders[i] = orders[i], order
+        self.add_depth(key[0] * self.sign, size_to_units(order.size) - size_to_units(previous.size))
+        return previous
+
+    def add_depth(self, tick: int, units: int):
+        units += self.depth.get(tick, 0)
+        if units:
+            self.depth[tick] = units
+        else:
+            self.depth.pop(tick, None)
+
+    def clear(self):
+        self.key_chunks.clear()
+        self.order_chunks.clear()
+        self.maxes.clear()
+        self.count = 0
+        self.depth.clear()
+
+
+class ActiveOrderStore:
+    # our open orders indexed by id, readers get an OrderBook snapshot that is rebuilt only after a change and is never
+    # modified afterwards, a resize replaces the OrderLevel instead of changing it
+    def __init__(self, tick_size: Decimal = MEXC_TICK_SIZE):
+        self.tick_size = tick_size
+        self.ask_side = OrderSide(sign=1)
+        self.bid_side = OrderSide(sign=-1)
+        self.index: dict[str, tuple[OrderSide, tuple[int, int], OrderLevel]] = {}
+        self.sequence = itertools.count()
+        self.version = 0
+        self.view: Optional[OrderBook] = None
+        self.depth_view: Optional[tuple[dict[int, int], dict[int, int]]] = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self.index
+
+    def get_side(self, side: str) -> OrderSide:
+        return self.bid_side if side == 'buy' else self.ask_side
+
+    def get(self, order_id: str) -> Optional[OrderLevel]:
+        entry = self.index.get(order_id)
+        return entry[2] if entry is not None else None
+
+    def add(self, side: str, order_id: str, price: Decimal, size: Decimal) -> bool:
+        # returns False when the order is already known, e.g. its websocket update arrived before the REST response
+        if order_id in self.index:
+            return False
+
+        order_side = self.get_side(side)
+        key = (price_to_ticks(price, self.tick_size) * order_side.sign, next(self.sequence))
+        order = OrderLevel(id=order_id, price=price, size=size)
+        order_side.insert(key, order)
+        self.index[order_id] = (order_side, key, order)
+        self.changed()
+        return True
+
+    def remove(self, order_id: str) -> Optional[OrderLevel]:
+        entry = self.index.pop(order_id, None)
+        if entry is None:
+            return None
+
+        order_side, key, _ = entry
+        order = order_side.remove(key)
+        self.changed()
+        return order
+
+    def resize(self, order_id: str, size: Decimal) -> bool:
+        entry = self.index.get(order_id)
+        if entry is None:
+            return False
+
+        order_side, key, order = entry
+        order = OrderLevel(id=order_id, price=order.price, size=size)
+        order_side.replace(key, order)
+        self.index[order_id] = (order_side, key, order)
+        self.changed()
+        return True
+
+    def clear(self):
+        self.ask_side.clear()
+        self.bid_side.clear()
+        self.index.clear()
+        self.changed()
+
+    def changed(self):
+        self.version += 1
+        self.view = None
+        self.depth_view = None
+
+    def snapshot(self) -> OrderBook:
+        if self.view is None:
+            self.view = OrderBook(asks=self.ask_side.orders, bids=self.bid_side.orders)
+        return self.view
+
+    def depth_snapshot(self) -> tuple[dict[int, int], dict[int, int]]:
+        # units of our asks and bids per tick, copied once per change like snapshot
+        if self.depth_view is None:
+            self.depth_view = (dict(self.ask_side.depth), dict(self.bid_side.depth))
+        return self.depth_view
@@ -0,0 +1,205 @@
+import asyncio
+import traceback
+from datetime import datetime
+from decimal import Decimal
+from loguru import logger
+from src.model import DatabaseMarketState, MetricFamily, Symbol, SYMBOLS, FIXED_POINT
+from src.crypto.mexc.client import MexcClient
+from src.crypto.kucoin.client import KucoinClient
+from src.crypto.market.calculations import calculate_market_depth, calculate_fair_price, calculate_market_spread
+from src.crypto.market.tracking import process_tick, reset_orders
+from src.database.client import DatabaseClient
+from src.dispatcher import EventDispatcher
+
+
+def parse_symbols(value: str) -> list[Symbol]:
+    # BASE-QUOTE pairs separated by commas
+    symbols = []
+    for pair in value.split(','):
+        base, _, quote = pair.strip().upper().partition('-')
+        if not base or not quote:
+            raise ValueError(f'Symbol {pair!r} is not of the form BASE-QUOTE')
+        symbols.append(SYMBOLS.get(f'{base}-{quote}', Symbol(base=base, quote=quote)))
+    return symbols
+
+
+class Market:
+    # the clients and dispatcher of one symbol, every symbol has its own event queue so that a busy pair
+    # does not merge or delay the updates of another one
+    def __init__(self, symbol: Symbol, mexc_client: MexcClient, kucoin_client: KucoinClient, dispatcher: EventDispatcher):
+        self.symbol = symbol
+        self.mexc_client = mexc_client
+        self.kucoin_client = kucoin_client
+        self.dispatcher = dispatcher
+
+    async def read_from_queue(self, database_client: DatabaseClient, fixed_point: bool = FIXED_POINT):
+        while True:
+            tick = await self.dispatcher.next_tick()
+
+            if not tick.filled_orders and tick.mexc_update is None and tick.kucoin_update is None:
+                continue
+
+            try:
+                await process_tick(tick=tick, mexc_client=self.mexc_client, kucoin_client=self.kucoin_client, database_client=database_client, fixed_point=fixed_point)
+                self.dispatcher.record_decision(tick)
+            except Exception as e:
+                logger.error(f"{self.symbol.name} error type: {type(e)}, details: {e}")
+                logger.error(traceback.format_exc())
+
+
+class SymbolRegistry:
+    # the first symbol is traded by the clients passed in, the others by their children, so all symbols share one
+    # session, balance and private websocket per exchange and the depth websockets are multiplexed
+    def __init__(self, mexc_client: MexcClient, kucoin_client: KucoinClient):
+        self.mexc_client = mexc_client
+        self.kucoin_client = kucoin_client
+        self.markets: dict[str, Market] = {}
+
+    def __iter__(self):
+        return iter(self.markets.values())
+
+    def __len__(self):
+        return len(self.markets)
+
+    def get(self, name: str) -> Market:
+        return self.markets[name]
+
+    def add(self, symbol: Symbol, mexc_archive=None, mexc_trade_archive=None, kucoin_archive=None) -> Market:
+        if symbol.name in self.markets:
+            raise ValueError(f'{symbol.name} is already registered')
+
+        dispatcher = EventDispatcher(queue=asyncio.Queue())
+
+        if not self.markets:
+            if symbol != self.mexc_client.symbol or symbol != self.kucoin_client.symbol:
+                raise ValueError(f'The first symbol has to be the one of the clients, {self.mexc_client.symbol.name}')
+            mexc_client, kucoin_client = self.mexc_client, self.kucoin_client
+            mexc_client.add_to_event_queue = kucoin_client.add_to_event_queue = dispatcher.put
+        else:
+            mexc_client = self.mexc_client.add_symbol(symbol=symbol, add_to_event_queue=dispatcher.put, archive=mexc_archive, trade_archive=mexc_trade_archive)
+            kucoin_client = self.kucoin_client.add_symbol(symbol=symbol, add_to_event_queue=dispatcher.put, archive=kucoin_archive)
+
+        market = Market(symbol=symbol, mexc_client=mexc_client, kucoin_client=kucoin_client, dispatcher=dispatcher)
+        self.markets[symbol.name] = market
+        return market
+
+    def start(self, database_client: DatabaseClient, fixed_point: bool = FIXED_POINT) -> list[asyncio.Task]:
+        # the public streams of all symbols and a decision loop and order reset per symbol
+        tasks = [
+            asyncio.create_task(self.mexc_client.update_orderbook()),
+            asyncio.create_task(self.kucoin_client.update_orderbook())
+        ]
+        for market in self:
+            tasks.append(asyncio.create_task(market.read_from_queue(database_client=database_client, fixed_point=fixed_point)))
+            tasks.append(asyncio.create_task(reset_orders(mexc_client=market.mexc_client)))
+        return tasks
+
+    def get_stats(self) -> dict:
+        return {name: market.dispatcher.get_stats() for name, market in self.markets.items()}
+
+    def get_metrics(self) -> list[MetricFamily]:
+        # read when the metrics endpoint is scraped: counters of the clients and dispatchers and what the analytics of
+        # the live book cache anyway, the book is not frozen for it
+        book_updates = MetricFamily(name='mm_book_updates_total', kind='counter', help='Orderbook updates applied')
+        events = MetricFamily(name='mm_events_total', kind='counter', help='Events taken from the event queue')
+        ticks = MetricFamily(name='mm_ticks_total', kind='counter', help='Ticks processed')
+        queue_depth = MetricFamily(name='mm_event_queue_depth', kind='gauge', help='Events waiting in the event queue')
+        order_latency = MetricFamily(name='mm_order_request_seconds', kind='histogram', help='Duration of MEXC order requests including retries')
+        order_requests = MetricFamily(name='mm_order_requests_total', kind='counter', help='MEXC order requests by result')
+        active_orders = MetricFamily(name='mm_active_orders', kind='gauge', help='Our open orders on MEXC')
+        market_depth = MetricFamily(name='mm_market_depth', kind='gauge', help='MEXC notional within 2% of the mid price in the quote currency')
+        expected_market_depth = MetricFamily(name='mm_expected_market_depth', kind='gauge', help='Market depth check_market_depth tops up to')
+        spread = MetricFamily(name='mm_market_spread_percent', kind='gauge', help='MEXC spread in percent of the mid price')
+        inventory = MetricFamily(name='mm_inventory', kind='gauge', help='Free and locked base currency on MEXC')
+        inventory_balance = MetricFamily(name='mm_inventory_balance', kind='gauge', help='Inventory the quotes are skewed towards')
+
+        for market in self:
+            mexc_client, kucoin_client, dispatcher = market.mexc_client, market.kucoin_client, market.dispatcher
+            labels = {'symbol': market.symbol.name}
+
+            book_updates.samples += [('', {**labels, 'exchange': 'mexc'}, mexc_client.book_updates), ('', {**labels, 'exchange': 'kucoin'}, kucoin_client.book_updates)]
+            events.samples.append(('', labels, dispatcher.events_received))
+            ticks.samples.append(('', labels, dispatcher.ticks))
+            queue_depth.samples.append(('', labels, dispatcher.queue.qsize()))
+
+            for action, metrics in mexc_client.order_requests.items():
+                order_latency.samples += metrics.histogram_samples({**labels, 'action': action})
+                order_requests.samples += [('', {**labels, 'action': action, 'result': 'ok'}, metrics.ok), ('', {**labels, 'action': action, 'result': 'error'}, metrics.errors)]
+
+            active_orders.samples += [('', {**labels, 'side': 'sell'}, len(mexc_client.active_orders.get_side('sell'))), ('', {**labels, 'side': 'buy'}, len(mexc_client.active_orders.get_side('buy')))]
+
+            analytics = mexc_client.orderbook.analytics
+            if analytics.mid_price is not None:
+                market_depth.samples.append(('', labels, analytics.market_depth(Decimal('2'))))
+                spread.samples.append(('', labels, analytics.spread))
+            expected_market_depth.samples.append(('', labels, market.symbol.expected_market_depth))
+
+            balance = mexc_client.get_balance().get(market.symbol.base)
+            if balance is not None:
+                inventory.samples.append(('', labels, balance['free'] + balance['locked']))
+            inventory_balance.samples.append(('', labels, market.symbol.inventory_balance))
+
+        reconnects = MetricFamily(name='mm_websocket_reconnects_total', kind='counter', help='Websocket connections lost or failed', samples=[
+            ('', {'stream': 'mexc_depth'}, self.mexc_client.reconnects['depth']),
+            ('', {'stream': 'mexc_private'}, self.mexc_client.reconnects['private']),
+            ('', {'stream': 'kucoin_depth'}, self.kucoin_client.reconnects)
+        ])
+
+        return [book_updates, events, ticks, queue_depth, order_latency, order_requests, active_orders, market_depth, expected_market_depth, spread, inventory, inventory_balance, reconnects]
+
+
+async def log_market_state(market: Market, database_client: DatabaseClient, record: bool):
+    mexc_client, kucoin_client, dispatcher = market.mexc_client, market.kucoin_client, market.dispatcher
+    state = mexc_client.get_state()
+    mexc_balance = state.balance
+    base, quote = market.symbol.base, market.symbol.quote
+    active_orders = state.active_orders
+
+    logger.info(f'start {market.symbol.name} state {state.sequence}')
+
+    market_depth = calculate_market_depth(client=mexc_client, percent=Decimal('2'))
+    fair_price, real_fair_price = calculate_fair_price(mexc_client=mexc_client, kucoin_client=kucoin_client, active_asks=[], active_bids=[], percent=Decimal('2'))
+    market_spread = calculate_market_spread(client=mexc_client)
+
+    logger.info(f"market depth: {market_depth}")
+    logger.info(f"fair price: {fair_price}")
+    logger.info(f"Real fair price: {real_fair_price}")
+    logger.info(f"market spread: {market_spread}")
+    logger.info(f"event queue: {dispatcher.get_stats()}")
+    logger.info(f"quote gate: {mexc_client.quote_gate.get_stats()}")
+    logger.info(f'len of active asks: {len(active_orders.asks)}')
+    logger.info(f'asks: {active_orders.asks}')
+    logger.info(f'len of active bids: {len(active_orders.bids)}')
+    logger.info(f'bids: {active_orders.bids}')
+
+    for i in range(1, len(active_orders.asks)):
+        if active_orders.asks[i].price == active_orders.asks[i - 1].price:
+            logger.error('Something is wrong')
+
+    for i in range(1, len(active_orders.bids)):
+        if active_orders.bids[i].price == active_orders.bids[i - 1].price:
+            logger.error('Something is wrong')
+
+    if fair_price is None:
+        logger.info('end\n')
+        return
+
+    logger.info(f"{quote} free balance: {mexc_balance[quote]['free']}")
+    logger.info(f"{quote} locked balance: {mexc_balance[quote]['locked']}")
+    logger.info(f"{quote} full balance: {mexc_balance[quote]['free'] + mexc_balance[quote]['locked']}")
+
+    logger.info(f"{base} free balance {mexc_balance[base]['free']}, approximated {quote} value: {mexc_balance[base]['free'] * fair_price}")
+    logger.info(f"{base} locked balance: {mexc_balance[base]['locked']}, approximate {quote} value: {mexc_balance[base]['locked'] * fair_price}")
+    logger.info(f"{base} full balance: {mexc_balance[base]['free'] + mexc_balance[base]['locked']}, approximated {quote} value: {(mexc_balance[base]['free'] + mexc_balance[base]['locked']) * fair_price}")
+
+    full_account_balance = mexc_balance[quote]['free'] + mexc_balance[quote]['locked'] + (mexc_balance[base]['free'] + mexc_balance[base]['locked']) * fair_price
+    logger.info(f"full_account_balance: {full_account_balance}")
+
+    # market_states has no symbol column, only the first symbol is recorded there
+    if record:
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        market_state = DatabaseMarketState(market_depth=market_depth, fair_price=fair_price, market_spread=market_spread, usdt_balance=mexc_balance[quote]['free'] + mexc_balance[quote]['locked'], rmv_balance=mexc_balance[base]['free'] + mexc_balance[base]['locked'], rmv_value=mexc_balance[base]['free'] * fair_price + mexc_balance[base]['locked'] * fair_price, timestamp=timestamp)
+        await database_client.record_market_state(market_state=market_state)
+
+    logger.info('end\n')
@@ -1,11 +1,15 @@
 from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
-from src.model import CryptoCurrency, DatabaseOrder, OrderBook, OrderLevel, ExchangeClient, MEXC_TICK_SIZE, INVENTORY_BALANCE, INVENTORY_LIMIT
+from src.model import DatabaseOrder, OrderBook, OrderAction, ExchangeClient, QueueTick, FIXED_POINT
 from src.crypto.mexc.client import MexcClient
 from src.crypto.kucoin.client import KucoinClient
 import random
 import asyncio
-from src.crypto.market.calculations import calculate_fair_price, calculate_market_depth, get_quotes
+import time
+from src.crypto.market.calculations import calculate_fair_price, calculate_market_depth, get_quotes, get_quote_ticks, tick_scale
+from src.crypto.market.book import DECIMAL_SIZE_SCALE, SIZE_SCALE, price_to_ticks, size_to_units, ticks_to_price
+from src.crypto.market.batcher import OrderBatcher
 from src.database.client import DatabaseClient
+from src.monitoring.latency import stage_timers
 from datetime import datetime
 from loguru import logger
 
@@ -13,136 +17,247 @@ lowest_possible_ask_price = Decimal('0')
 highest_possible_bid_price = Decimal('0')
 
 async def reset_orders(mexc_client: MexcClient):
-    active_orders = mexc_client.get_active_orders()
-
     while True:
         await asyncio.sleep(30 * 60)
         logger.info("Resetting orders on MEXC...")
-        cancellation = await mexc_client.cancel_all_orders(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT)
+        cancellation = await mexc_client.cancel_all_orders()
 
         if cancellation is not None:
-            active_orders.asks.clear()
-            active_orders.bids.clear()
+            mexc_client.active_orders.clear()
 
 
 async def manage_orders(mexc_client: MexcClient, kucoin_client: KucoinClient, database_client: DatabaseClient):
-    mexc_orderbook = mexc_client.get_orderbook()
+    state = mexc_client.get_state()
+    mexc_orderbook = state.book
     kucoin_orderbook = kucoin_client.get_orderbook()
-    balance = mexc_client.get_balance()
-    active_orders = mexc_client.get_active_orders()
+    balance = state.balance
+    active_orders = state.active_orders
+    symbol = mexc_client.symbol
+    tick_size = symbol.tick_size
 
-    number_of_asks, number_of_bids = 5, 5
+    number_of_asks, number_of_bids = symbol.levels, symbol.levels
 
+    started = time.perf_counter_ns()
     ask_price, bid_price = get_quotes(mexc_client=mexc_client, kucoin_client=kucoin_client)
+    quoted = time.perf_counter_ns()
+    stage_timers.record('get_quotes', quoted - started)
+
+    mid_price = mexc_orderbook.analytics.mid_price
 
-    if ask_price is None and bid_price is None or len(mexc_orderbook.asks) == 0 or len(mexc_orderbook.bids) == 0 or len(kucoin_orderbook.asks) == 0 or len(kucoin_orderbook.bids) == 0:
+    if ask_price is None and bid_price is None or mid_price is None or len(kucoin_orderbook.asks) == 0 or len(kucoin_orderbook.bids) == 0:
         return
 
-    mid_price = (mexc_orderbook.asks[0].price + mexc_orderbook.bids[0].price) / 2
     upper_bound = mid_price * Decimal('1.02')
     lower_bound = mid_price * Decimal('0.98')
 
-    for i in range(len(active_orders.asks) - 1, -1, -1):
-        if (active_orders.asks[i].price <= ask_price - MEXC_TICK_SIZE) or (active_orders.asks[i].price >= ask_price + number_of_asks * MEXC_TICK_SIZE) or (active_orders.asks[i].price == ask_price and active_orders.asks[i].size > Decimal('5_000')) or (active_orders.asks[i].price > upper_bound and active_orders.asks[i].size > Decimal('20_000')):
-            order_id = active_orders.asks[i].id
-            cancellation = await mexc_client.cancel_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, order_id=order_id)
+    gate_key = (ask_price, bid_price, mexc_client.active_orders.version)
+    if mexc_client.quote_gate.skip(key=gate_key, upper_bound=upper_bound, lower_bound=lower_bound):
+        stage_timers.record('manage_orders', time.perf_counter_ns() - quoted)
+        return
+
+    cancels = []
+    places = []
 
-            if cancellation is not None:
-                for j, order in enumerate(active_orders.asks):
-                    if order.id == order_id:
-                        del active_orders.asks[j]
-                        break
+    for ask in active_orders.asks:
+        if (ask.price <= ask_price - tick_size) or (ask.price >= ask_price + number_of_asks * tick_size) or (ask.price == ask_price and ask.size > Decimal('5_000')) or (ask.price > upper_bound and ask.size > Decimal('20_000')):
+            cancels.append(OrderAction(side='sell', price=ask.price, size=ask.size, order_id=ask.id))
 
-    for i in range(len(active_orders.bids) - 1, -1, -1):
-        if (active_orders.bids[i].price >= bid_price + MEXC_TICK_SIZE) or (active_orders.bids[i].price <= bid_price - number_of_bids * MEXC_TICK_SIZE) or (active_orders.bids[i].price == bid_price and active_orders.bids[i].size > Decimal('5_000')) or (active_orders.bids[i].price < lower_bound and active_orders.bids[i].size > Decimal('20_000')):
-            order_id = active_orders.bids[i].id
-            cancellation = await mexc_client.cancel_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, order_id=order_id)
+    for bid in active_orders.bids:
+        if (bid.price >= bid_price + tick_size) or (bid.price <= bid_price - number_of_bids * tick_size) or (bid.price == bid_price and bid.size > Decimal('5_000')) or (bid.price < lower_bound and bid.size > Decimal('20_000')):
+            cancels.append(OrderAction(side='buy', price=bid.price, size=bid.size, order_id=bid.id))
 
-            if cancellation is not None:
-                for j, order in enumerate(active_orders.bids):
-                    if order.id == order_id:
-                        del active_orders.bids[j]
+    if not cancels and len(active_orders.asks) >= number_of_asks and len(active_orders.bids) >= number_of_bids:
+        # nothing to do and no order size drawn, the balance is not read either
+        far_ask = max((ask.price for ask in active_orders.asks if ask.size > Decimal('20_000')), default=None)
+        far_bid = min((bid.price for bid in active_orders.bids if bid.size > Decimal('20_000')), default=None)
+        mexc_client.quote_gate.remember(key=gate_key, far_ask=far_ask, far_bid=far_bid)
+        stage_timers.record('manage_orders', time.perf_counter_ns() - quoted)
+        return
+
+    # counted as if the cancels went through, the batcher holds a place back until the cancel it replaces is confirmed
+    cancelled_ids = {order.order_id for order in cancels}
+    remaining_asks = [ask for ask in active_orders.asks if ask.id not in cancelled_ids]
+    remaining_bids = [bid for bid in active_orders.bids if bid.id not in cancelled_ids]
 
     max_size = Decimal('0')
-    if len(active_orders.asks) < number_of_asks:
-        max_size = balance['RMV']['free'] / Decimal(number_of_asks - len(active_orders.asks))
+    if len(remaining_asks) < number_of_asks:
+        max_size = balance[symbol.base]['free'] / Decimal(number_of_asks - len(remaining_asks))
 
-    while len(active_orders.asks) < number_of_asks:
-        found = any(d.price == ask_price for d in active_orders.asks)
+    ask_prices = {ask.price for ask in remaining_asks}
+    number_of_placed_asks = len(remaining_asks)
 
-        if not found:
-            size = Decimal(min(random.randint(2_000, 4_000), max_size))
+    while number_of_placed_asks < number_of_asks:
+        if ask_price not in ask_prices:
+            size = Decimal(min(random.randint(symbol.min_order_size, symbol.max_order_size), max_size))
             size = size.quantize(Decimal('1'), rounding=ROUND_DOWN)
 
             if max_size <= Decimal('400'):
-                max_size = balance['RMV']['free']
+                max_size = balance[symbol.base]['free']
 
-            if size <= 0 or balance['RMV']['free'] <= Decimal('400'): # order value can't be less than 1 USDT
-                logger.warning(f"To small balance: {balance['RMV']['free']} RMV")
+            if size <= 0 or balance[symbol.base]['free'] <= Decimal('400'): # order value can't be less than 1 USDT
+                logger.warning(f"To small balance: {balance[symbol.base]['free']} {symbol.base}")
                 break
 
-            order_id = await mexc_client.place_limit_order(first_currency=CryptoCurrency.RMV,second_currency=CryptoCurrency.USDT, side='sell',order_type='limit', size=size, price=ask_price)
+            places.append(OrderAction(side='sell', price=ask_price, size=size))
+            number_of_placed_asks += 1
 
-            if order_id is not None:
-                found = any(order_id == order.id for order in active_orders.asks)
-                if not found:
-                    active_orders.asks.append(OrderLevel(id=order_id, price=ask_price, size=size))
-                    active_orders.asks.sort(key=lambda ask: ask.price)
-
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    order = DatabaseOrder(pair='RMV-USDT', side='sell', price=ask_price, size=size, order_id=order_id, timestamp=timestamp)
-                    await database_client.record_order(order=order, table_name="every_order_placed")
-            else:
-                break
-
-        ask_price += MEXC_TICK_SIZE
+        ask_price += tick_size
 
     max_size_in_usdt = Decimal('0')
-    if len(active_orders.bids) < number_of_bids:
-        max_size_in_usdt = balance['USDT']['free'] / Decimal(number_of_bids - len(active_orders.bids))
+    if len(remaining_bids) < number_of_bids:
+        max_size_in_usdt = balance[symbol.quote]['free'] / Decimal(number_of_bids - len(remaining_bids))
 
-    while len(active_orders.bids) < number_of_bids:
-        found = any(d.price == bid_price for d in active_orders.bids)
+    bid_prices = {bid.price for bid in remaining_bids}
+    number_of_placed_bids = len(remaining_bids)
 
-        if not found:
+    while number_of_placed_bids < number_of_bids:
+        if bid_price not in bid_prices:
             if max_size_in_usdt <= Decimal('1.1'):
-                max_size_in_usdt = balance['USDT']['free']
+                max_size_in_usdt = balance[symbol.quote]['free']
 
-            size = Decimal(min(random.randint(2_000, 4_000), max_size_in_usdt / bid_price))
+            size = Decimal(min(random.randint(symbol.min_order_size, symbol.max_order_size), max_size_in_usdt / bid_price))
             size = size.quantize(Decimal('1'), rounding=ROUND_DOWN)
 
-            if size <= 0 or balance['USDT']['free'] <= Decimal('1.1'): # order value can't be less than 1 USDT
-                logger.warning(f"To small balance: {balance['USDT']['free']} USDT")
+            if size <= 0 or balance[symbol.quote]['free'] <= Decimal('1.1'): # order value can't be less than 1 USDT
+                logger.warning(f"To small balance: {balance[symbol.quote]['free']} {symbol.quote}")
                 break
 
-            order_id = await mexc_client.place_limit_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, side='buy',order_type='limit', size=size, price=bid_price)
+            places.append(OrderAction(side='buy', price=bid_price, size=size))
+            number_of_placed_bids += 1
+
+        bid_price -= tick_size
+
+    stage_timers.record('manage_orders', time.perf_counter_ns() - quoted)
+    await OrderBatcher(mexc_client=mexc_client, database_client=database_client).execute(cancels=cancels, places=places)
+
+
+async def manage_orders_fixed(mexc_client: MexcClient, kucoin_client: KucoinClient, database_client: DatabaseClient):
+    # manage_orders in integer ticks and units, prices and sizes become Decimal only in the OrderActions sent to MEXC
+    state = mexc_client.get_state()
+    mexc_orderbook = state.book
+    kucoin_orderbook = kucoin_client.get_orderbook()
+    balance = state.balance
+    active_orders = state.active_orders
+    symbol = mexc_client.symbol
+    tick_size = symbol.tick_size
+
+    number_of_asks, number_of_bids = symbol.levels, symbol.levels
+
+    started = time.perf_counter_ns()
+    ask_price, bid_price = get_quote_ticks(mexc_client=mexc_client, kucoin_client=kucoin_client)
+    quoted = time.perf_counter_ns()
+    stage_timers.record('get_quotes', quoted - started)
+
+    best_ask, best_bid = mexc_orderbook.best_ask, mexc_orderbook.best_bid
+
+    if ask_price is None and bid_price is None or best_ask is None or best_bid is None or kucoin_orderbook.best_ask is None or kucoin_orderbook.best_bid is None:
+        return
+
+    # price > mid * 1.02 and price < mid * 0.98 with mid = (best_ask + best_bid) / 2
+    upper_bound = (best_ask + best_bid) * 102
+    lower_bound = (best_ask + best_bid) * 98
+    max_level_units = 5_000 * SIZE_SCALE
+    max_far_units = 20_000 * SIZE_SCALE
+
+    gate_key = (ask_price, bid_price, mexc_client.active_orders.version)
+    if mexc_client.quote_gate.skip(key=gate_key, upper_bound=upper_bound, lower_bound=lower_bound):
+        stage_timers.record('manage_orders', time.perf_counter_ns() - quoted)
+        return
+
+    cancels = []
+    places = []
+
+    ask_ticks = [price_to_ticks(ask.price, tick_size) for ask in active_orders.asks]
+    bid_ticks = [price_to_ticks(bid.price, tick_size) for bid in active_orders.bids]
+
+    for ask, tick in zip(active_orders.asks, ask_ticks):
+        units = size_to_units(ask.size)
+        if (tick <= ask_price - 1) or (tick >= ask_price + number_of_asks) or (tick == ask_price and units > max_level_units) or (tick * 200 > upper_bound and units > max_far_units):
+            cancels.append(OrderAction(side='sell', price=ask.price, size=ask.size, order_id=ask.id))
+
+    for bid, tick in zip(active_orders.bids, bid_ticks):
+        units = size_to_units(bid.size)
+        if (tick >= bid_price + 1) or (tick <= bid_price - number_of_bids) or (tick == bid_price and units > max_level_units) or (tick * 200 < lower_bound and units > max_far_units):
+            cancels.append(OrderAction(side='buy', price=bid.price, size=bid.size, order_id=bid.id))
+
+    if not cancels and len(ask_ticks) >= number_of_asks and len(bid_ticks) >= number_of_bids:
+        far_ask = max((tick * 200 for ask, tick in zip(active_orders.asks, ask_ticks) if size_to_units(ask.size) > max_far_units), default=None)
+        far_bid = min((tick * 200 for bid, tick in zip(active_orders.bids, bid_ticks) if size_to_units(bid.size) > max_far_units), default=None)
+        mexc_client.quote_gate.remember(key=gate_key, far_ask=far_ask, far_bid=far_bid)
+        stage_timers.record('manage_orders', time.perf_counter_ns() - quoted)
+        return
+
+    # counted as if the cancels went through, the batcher holds a place back until the cancel it replaces is confirmed
+    cancelled_ids = {order.order_id for order in cancels}
+    remaining_asks = [tick for ask, tick in zip(active_orders.asks, ask_ticks) if ask.id not in cancelled_ids]
+    remaining_bids = [tick for bid, tick in zip(active_orders.bids, bid_ticks) if bid.id not in cancelled_ids]
+
+    # max sizes are kept as units / divisor so that they compare exactly like the Decimal divisions
+    free_rmv = size_to_units(balance[symbol.base]['free'])
+    max_size, max_size_divisor = 0, 1
+    if len(remaining_asks) < number_of_asks:
+        max_size, max_size_divisor = free_rmv, number_of_asks - len(remaining_asks)
 
-            if order_id is not None:
-                found = any(order_id == order.id for order in active_orders.bids)
-                if not found:
-                    active_orders.bids.append(OrderLevel(id=order_id, price=bid_price, size=size))
-                    active_orders.bids.sort(key=lambda bid: bid.price, reverse=True)
+    ask_prices = set(remaining_asks)
+    number_of_placed_asks = len(remaining_asks)
 
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    order = DatabaseOrder(pair='RMV-USDT', side='buy', price=bid_price, size=size, order_id=order_id, timestamp=timestamp)
-                    await database_client.record_order(order=order, table_name="every_order_placed")
-            else:
+    while number_of_placed_asks < number_of_asks:
+        if ask_price not in ask_prices:
+            size = min(random.randint(symbol.min_order_size, symbol.max_order_size), max_size // (max_size_divisor * SIZE_SCALE))
+
+            if max_size <= 400 * SIZE_SCALE * max_size_divisor:
+                max_size, max_size_divisor = free_rmv, 1
+
+            if size <= 0 or free_rmv <= 400 * SIZE_SCALE: # order value can't be less than 1 USDT
+                logger.warning(f"To small balance: {balance[symbol.base]['free']} {symbol.base}")
                 break
 
-        bid_price -= MEXC_TICK_SIZE
+            places.append(OrderAction(side='sell', price=ticks_to_price(ask_price, tick_size), size=Decimal(size)))
+            number_of_placed_asks += 1
+
+        ask_price += 1
+
+    free_usdt = size_to_units(balance[symbol.quote]['free'])
+    max_size_in_usdt, max_size_in_usdt_divisor = 0, 1
+    if len(remaining_bids) < number_of_bids:
+        max_size_in_usdt, max_size_in_usdt_divisor = free_usdt, number_of_bids - len(remaining_bids)
+
+    bid_prices = set(remaining_bids)
+    number_of_placed_bids = len(remaining_bids)
+    min_usdt_units = size_to_units(Decimal('1.1'))
+    ticks_per_unit = int(1 / tick_size)
+
+    while number_of_placed_bids < number_of_bids:
+        if bid_price not in bid_prices:
+            if max_size_in_usdt <= min_usdt_units * max_size_in_usdt_divisor:
+                max_size_in_usdt, max_size_in_usdt_divisor = free_usdt, 1
+
+            size = min(random.randint(symbol.min_order_size, symbol.max_order_size), max_size_in_usdt * ticks_per_unit // (max_size_in_usdt_divisor * SIZE_SCALE * bid_price))
+
+            if size <= 0 or free_usdt <= min_usdt_units: # order value can't be less than 1 USDT
+                logger.warning(f"To small balance: {balance[symbol.quote]['free']} {symbol.quote}")
+                break
+
+            places.append(OrderAction(side='buy', price=ticks_to_price(bid_price, tick_size), size=Decimal(size)))
+            number_of_placed_bids += 1
+
+        bid_price -= 1
+
+    stage_timers.record('manage_orders', time.perf_counter_ns() - quoted)
+    await OrderBatcher(mexc_client=mexc_client, database_client=database_client).execute(cancels=cancels, places=places)
 
 
 async def check_market_depth(mexc_client: MexcClient, database_client: DatabaseClient, percent: Decimal, expected_market_depth: Decimal):
-    mexc_orderbook = mexc_client.get_orderbook()
-    active_orders = mexc_client.get_active_orders()
-    mexc_balance = mexc_client.get_balance()
+    state = mexc_client.get_state()
+    mexc_orderbook = state.book
+    active_orders = state.active_orders
+    mexc_balance = state.balance
+    symbol = mexc_client.symbol
 
-    if len(mexc_orderbook.asks) == 0 or len(mexc_orderbook.bids) == 0 or 'USDT' not in mexc_balance or 'RMV' not in mexc_balance or len(active_orders.asks) == 0 or len(active_orders.bids) == 0:
-        return None
+    mid_price = mexc_orderbook.analytics.mid_price
 
-    lowest_ask = mexc_orderbook.asks[0].price
-    highest_bid = mexc_orderbook.bids[0].price
-    mid_price = (lowest_ask + highest_bid) / 2
+    if mid_price is None or symbol.quote not in mexc_balance or symbol.base not in mexc_balance or len(active_orders.asks) == 0 or len(active_orders.bids) == 0:
+        return None
 
     upper_bound = mid_price * (1 + percent / 100)
     lower_bound = mid_price * (1 - percent / 100)
@@ -163,9 +278,8 @@ async def check_market_depth(mexc_client: MexcClient, database_client: DatabaseC
     if market_depth < expected_market_depth * Decimal('0.999'):
         how_many_to_add = expected_market_depth - market_depth
 
-        usdt_balance = mexc_balance['USDT']['free']
-        rmv_balance = mexc_balance['RMV']['free']
-        mid_price = (mexc_orderbook.asks[0].price + mexc_orderbook.bids[0].price) / 2
+        usdt_balance = mexc_balance[symbol.quote]['free']
+        rmv_balance = mexc_balance[symbol.base]['free']
         rmv_value = mid_price * rmv_balance
 
         if len(active_orders.asks) == 0 or len(active_orders.bids) == 0:
@@ -177,12 +291,13 @@ async def check_market_depth(mexc_client: MexcClient, database_client: DatabaseC
         how_many_to_add_usdt = how_many_to_add * (usdt_balance / total_value)
         how_many_to_add_rmv = how_many_to_add * (rmv_value / total_value)
 
+        # the state is taken again after every step that awaited a cancel and a place, the orders and balance change meanwhile
         ask_id = len(active_orders.asks) - 1
         stopper = 0
 
         while how_many_to_add_rmv > 1 and stopper < 100 and len(active_orders.asks) > 1:
-            if mexc_balance['RMV']['free'] < 400:
-                logger.warning('to small balance to add RMV volume')
+            if mexc_balance[symbol.base]['free'] < 400:
+                logger.warning(f'to small balance to add {symbol.base} volume')
                 break
 
             if ask_id < 1:
@@ -191,35 +306,31 @@ async def check_market_depth(mexc_client: MexcClient, database_client: DatabaseC
             if 1 <= ask_id and active_orders.asks[ask_id].size < Decimal(220_000) and upper_bound >= active_orders.asks[ask_id].price:
                 price = active_orders.asks[ask_id].price
 
-                to_add = Decimal(min(random.randint(50_000, 80_000), mexc_balance['RMV']['free'] * Decimal('0.999')))
+                to_add = Decimal(min(random.randint(50_000, 80_000), mexc_balance[symbol.base]['free'] * Decimal('0.999')))
                 size = to_add + active_orders.asks[ask_id].size
                 size = size.quantize(Decimal('1'), rounding=ROUND_DOWN)
 
                 order_id = active_orders.asks[ask_id].id
-                cancellation = await mexc_client.cancel_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, order_id=order_id)
+                cancellation = await mexc_client.cancel_order(order_id=order_id)
 
                 if cancellation is not None:
-                    for i, order in enumerate(active_orders.asks):
-                        if order.id == order_id:
-                            del active_orders.asks[i]
-                            break
+                    mexc_client.active_orders.remove(order_id=order_id)
 
-                    order_id = await mexc_client.place_limit_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, side='sell', order_type='limit', size=size, price=price)
+                    order_id = await mexc_client.place_limit_order(side='sell', order_type='limit', size=size, price=price)
 
                     if order_id is not None:
-                        found = any(order_id == order.id for order in active_orders.asks)
-                        if not found:
-                            active_orders.asks.append(OrderLevel(id=order_id, price=price, size=size))
-                            active_orders.asks.sort(key=lambda x: x.price)
-
+                        if mexc_client.active_orders.add(side='sell', order_id=order_id, price=price, size=size):
                             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            order = DatabaseOrder(pair='RMV-USDT', side='sell', price=price, size=size, order_id=order_id, timestamp=timestamp)
+                            order = DatabaseOrder(pair=mexc_client.symbol.pair, side='sell', price=price, size=size, order_id=order_id, timestamp=timestamp)
                             await database_client.record_order(order=order, table_name="every_order_placed")
 
                         how_many_to_add_rmv -= to_add * price
                     else:
                         logger.error(f'Failed to place limit order: price: {price}, size: {size}, balances: {mexc_balance}')
 
+                state = mexc_client.get_state()
+                active_orders, mexc_balance = state.active_orders, state.balance
+
             ask_id -= 1
             stopper += 1
 
@@ -227,8 +338,8 @@ async def check_market_depth(mexc_client: MexcClient, database_client: DatabaseC
         stopper = 0
 
         while how_many_to_add_usdt > 1 and stopper < 100 and len(active_orders.bids) > 1:
-            if mexc_balance['USDT']['free'] < 1:
-                logger.warning('to small balance to add usdt volume')
+            if mexc_balance[symbol.quote]['free'] < 1:
+                logger.warning(f'to small balance to add {symbol.quote} volume')
                 break
 
             if bid_id < 1:
@@ -237,36 +348,70 @@ async def check_market_depth(mexc_client: MexcClient, database_client: DatabaseC
             if 1 <= bid_id and active_orders.bids[bid_id].size < Decimal(220_000) and lower_bound <= active_orders.bids[bid_id].price:
                 price = active_orders.bids[bid_id].price
 
-                to_add = Decimal(min(random.randint(50_000, 80_000), mexc_balance['USDT']['free'] / price * Decimal('0.999')))
+                to_add = Decimal(min(random.randint(50_000, 80_000), mexc_balance[symbol.quote]['free'] / price * Decimal('0.999')))
                 size = to_add + active_orders.bids[bid_id].size
                 size = size.quantize(Decimal('1'), rounding=ROUND_DOWN)
 
                 order_id = active_orders.bids[bid_id].id
-                cancellation = await mexc_client.cancel_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, order_id=order_id)
+                cancellation = await mexc_client.cancel_order(order_id=order_id)
 
                 if cancellation is not None:
-                    for i, order in enumerate(active_orders.bids):
-                        if order.id == order_id:
-                            del active_orders.bids[i]
-                            break
+                    mexc_client.active_orders.remove(order_id=order_id)
 
-                    order_id = await mexc_client.place_limit_order(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT, side='buy', order_type='limit', size=size, price=price)
+                    order_id = await mexc_client.place_limit_order(side='buy', order_type='limit', size=size, price=price)
 
                     if order_id is not None:
-                        found = any(order_id == order.id for order in active_orders.bids)
-                        if not found:
-                            active_orders.bids.append(OrderLevel(id=order_id, price=price, size=size))
-                            active_orders.bids.sort(key=lambda x: x.price, reverse=True)
-
+                        if mexc_client.active_orders.add(side='buy', order_id=order_id, price=price, size=size):
                             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            order = DatabaseOrder(pair='RMV-USDT', side='buy', price=price, size=size, order_id=order_id,timestamp=timestamp)
+                            order = DatabaseOrder(pair=mexc_client.symbol.pair, side='buy', price=price, size=size, order_id=order_id,timestamp=timestamp)
                             await database_client.record_order(order=order, table_name="every_order_placed")
 
                         how_many_to_add_usdt -= to_add * price
                     else:
                         logger.error(f'Failed to place limit order: price: {price}, size: {size}, balances: {mexc_balance}')
 
+                state = mexc_client.get_state()
+                active_orders, mexc_balance = state.active_orders, state.balance
+
             bid_id -= 1
             stopper += 1
 
-    return market_depth
\ No newline at end of file
+    return market_depth
+
+
+async def check_market_depth_fixed(mexc_client: MexcClient, database_client: DatabaseClient, percent: Decimal, expected_market_depth: Decimal):
+    # the usual outcome, enough depth, is decided in ticks * units, topping it up goes through REST calls anyway and is left to check_market_depth
+    state = mexc_client.get_state()
+    mexc_orderbook = state.book
+    active_orders = state.active_orders
+    mexc_balance = state.balance
+    symbol = mexc_client.symbol
+
+    if mexc_orderbook.best_ask is None or mexc_orderbook.best_bid is None or symbol.quote not in mexc_balance or symbol.base not in mexc_balance or len(active_orders.asks) == 0 or len(active_orders.bids) == 0:
+        return None
+
+    if mexc_orderbook.analytics.market_notional(percent) >= expected_market_depth * Decimal('0.999') * DECIMAL_SIZE_SCALE / mexc_orderbook.tick_size:
+        return mexc_orderbook.analytics.market_depth(percent)
+
+    return await check_market_depth(mexc_client=mexc_client, database_client=database_client, percent=percent, expected_market_depth=expected_market_depth)
+
+
+async def process_tick(tick: QueueTick, mexc_client: MexcClient, kucoin_client: KucoinClient, database_client: DatabaseClient, fixed_point: bool = FIXED_POINT):
+    fixed_point = fixed_point and tick_scale(mexc_client.symbol) is not None
+
+    for event in tick.filled_orders:
+        ...
+
+    if tick.mexc_update is not None or tick.kucoin_update is not None:
+        if fixed_point:
+            await manage_orders_fixed(mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client)
+        else:
+            await manage_orders(mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client)
+
+    if tick.mexc_update is not None:
+        started = time.perf_counter_ns()
+        if fixed_point:
+            await check_market_depth_fixed(mexc_client=mexc_client, database_client=database_client, percent=Decimal(2), expected_market_depth=mexc_client.symbol.expected_market_depth)
+        else:
+            await check_market_depth(mexc_client=mexc_client, database_client=database_client, percent=Decimal(2), expected_market_depth=mexc_client.symbol.expected_market_depth)
+        stage_timers.record('check_market_depth', time.perf_counter_ns() - started)
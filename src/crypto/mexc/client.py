@@ -1,38 +1,115 @@
-from src.model import CryptoCurrency, OrderBook, OrderLevel, ExchangeClient, EventType, QueueEvent, DatabaseOrder
+from src.model import OrderBook, ExchangeClient, MarketState, Symbol, DEFAULT_SYMBOL, EventType, QueueEvent, DatabaseOrder, OrderAction, PrivateOrderUpdate, PrivateDeal
 from src.database.client import DatabaseClient
 import websockets
-from src.crypto.mexc.websocket_proto import PushDataV3ApiWrapper_pb2
-from google.protobuf.json_format import MessageToDict
+from src.crypto.mexc.decode import parse_message, decode_depth, decode_deals, decode_private_order, decode_private_account, decode_private_deal
 import json
 from loguru import logger
 from decimal import Decimal
 import time
 import hmac
 import hashlib
-import requests
-import aiohttp
 import asyncio
+from src.crypto.http import request_with_retry
+from src.crypto.market.book import DepthBook, price_to_ticks, size_to_units
+from src.crypto.market.orders import ActiveOrderStore
+from src.crypto.market.gate import QuoteGate
+from src.monitoring.latency import stage_timers
+from src.monitoring.metrics import RequestMetrics
 from urllib.parse import urlencode
+from yarl import URL
 from datetime import datetime
-import inspect
+from typing import Awaitable, Optional
+
+MEXC_WS_URL = "wss://wbs-api.mexc.com/ws"
+MEXC_REST_URL = "https://api.mexc.com"
+MEXC_DEPTH_TOPIC = "spot@public.aggre.depth.v3.api.pb@100ms@{symbol}"
+MEXC_DEALS_TOPIC = "spot@public.aggre.deals.v3.api.pb@100ms@{symbol}"
+MEXC_DEPTH_SNAPSHOT_LIMIT = 5000
+MEXC_TOPICS_PER_CONNECTION = 30
+MEXC_PRIVATE_ORDERS_TOPIC = "spot@private.orders.v3.api.pb"
+MEXC_PRIVATE_DEALS_TOPIC = "spot@private.deals.v3.api.pb"
+MEXC_PRIVATE_ACCOUNT_TOPIC = "spot@private.account.v3.api.pb"
+PRIVATE_FILL_SETTLE_TIMEOUT = 0.05
+PRIVATE_LOG_KINDS = {'privateOrders': 'orders', 'privateDeals': 'deals', 'privateAccount': 'account'}
 
 class MexcClient(ExchangeClient):
-    def __init__(self, api_key: str, api_secret: str, database_client: DatabaseClient, add_to_event_queue=None):
-        super().__init__(add_to_event_queue=add_to_event_queue, database_client=database_client, api_key=api_key, api_secret=api_secret)
-
+    def __init__(self, api_key: str, api_secret: str, database_client: DatabaseClient, add_to_event_queue=None, connection_limit: int = 100, connection_limit_per_host: int = 20, dns_cache_ttl: int = 300, keepalive_timeout: float = 60, request_timeout: float = 10, archive=None, trade_archive=None, private_log=None, ws_base_url: str = MEXC_WS_URL, rest_base_url: str = MEXC_REST_URL, symbol: Symbol = DEFAULT_SYMBOL, parent: Optional['MexcClient'] = None):
+        session_config = {
+            'connection_limit': connection_limit,
+            'connection_limit_per_host': connection_limit_per_host,
+            'dns_cache_ttl': dns_cache_ttl,
+            'keepalive_timeout': keepalive_timeout,
+            'request_timeout': request_timeout
+        }
+        super().__init__(add_to_event_queue=add_to_event_queue, database_client=database_client, api_key=api_key, api_secret=api_secret, session_config=session_config, archive=archive)
+
+        # a client trades one symbol, clients made with add_symbol share the session, balance, private streams and
+        # depth websockets of their parent
+        self.symbol = symbol
+        self.parent = parent
+        self.clients = {symbol.name: self}
+        # replaced on every change, children read the balance of their parent
         self.balance = {}
-        self.ws_base_url = "wss://wbs-api.mexc.com/ws"
-        self.rest_base_url = "https://api.mexc.com"
+        self.ws_base_url = ws_base_url
+        self.rest_base_url = rest_base_url
         self.lock = asyncio.Lock()
-        self.active_orders = OrderBook(asks=[], bids=[])
+        self.orderbook = DepthBook(tick_size=symbol.tick_size)
+        self.active_orders = ActiveOrderStore(tick_size=symbol.tick_size)
+        self.state: Optional[MarketState] = None
+        self.quote_gate = QuoteGate()
+        self.snapshot: Optional[asyncio.Task] = None
+        self.buffered_diffs = []
         self.amount_sold = Decimal('0')
         self.amount_bought = Decimal('0')
+        self.deals = 0
+        self.fees: dict[str, Decimal] = {}
+        self.held_updates: list[tuple['MexcClient', object]] = []
+        self.awaited_tokens: set[str] = set()
+        # loop time of the account updates that arrived while no fill was waiting for them
+        self.updated_tokens: dict[str, float] = {}
+        self.settle_deadline = 0.0
+        self.private_log = private_log
+        self.trade_archive = trade_archive
+        # counted for the metrics endpoint, the websockets of the children are those of their parent
+        self.book_updates = 0
+        self.order_requests = {'place': RequestMetrics(), 'cancel': RequestMetrics()}
+        self.reconnects = {'depth': 0, 'private': 0}
+
+    def add_symbol(self, symbol: Symbol, add_to_event_queue, archive=None, trade_archive=None) -> 'MexcClient':
+        client = MexcClient(api_key=self.api_key, api_secret=self.api_secret, database_client=self.database_client, add_to_event_queue=add_to_event_queue, archive=archive, trade_archive=trade_archive, private_log=self.private_log, ws_base_url=self.ws_base_url, rest_base_url=self.rest_base_url, symbol=symbol, parent=self)
+        self.clients[symbol.name] = client
+        return client
+
+    def get_session(self):
+        if self.parent is not None:
+            return self.parent.get_session()
+        return super().get_session()
+
+    async def close(self):
+        if self.parent is None:
+            await super().close()
+
+    def get_orderbook(self) -> DepthBook:
+        return self.orderbook.freeze()
 
     def get_balance(self):
+        if self.parent is not None:
+            return self.parent.get_balance()
         return self.balance
 
-    def get_active_orders(self):
-        return self.active_orders
+    def get_active_orders(self) -> OrderBook:
+        return self.active_orders.snapshot()
+
+    def get_state(self) -> MarketState:
+        # the book, balance and orders handed out are never changed, so a new state is made only when one of them was
+        # replaced since the last one and every reader of a version shares it
+        book, balance, active_orders = self.get_orderbook(), self.get_balance(), self.get_active_orders()
+        state = self.state
+        if state is None or state.book is not book or state.balance is not balance or state.active_orders is not active_orders:
+            own_asks, own_bids = self.active_orders.depth_snapshot()
+            state = MarketState(sequence=state.sequence + 1 if state is not None else 1, book=book, balance=balance, active_orders=active_orders, own_asks=own_asks, own_bids=own_bids)
+            self.state = state
+        return state
 
     def get_amount_bought(self):
         return self.amount_bought
@@ -43,360 +120,448 @@ class MexcClient(ExchangeClient):
     def get_signature(self, query_string: str):
         return hmac.new(self.api_secret.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
 
-    async def create_listen_key(self):
-        url = self.rest_base_url + '/api/v3/userDataStream'
-
-        timestamp = str(int(time.time() * 1000))
-        params = {
-            'timestamp': timestamp
-        }
-
+    def get_signed_query(self, params: dict) -> str:
         query_string = urlencode(params)
         signature = self.get_signature(query_string=query_string)
-        params['signature'] = signature
+        return query_string + f'&signature={signature}'
 
+    async def signed_request(self, method: str, path: str, params: dict, retries: int = 0, metrics: Optional[RequestMetrics] = None):
         headers = {
-            "X-MEXC-APIKEY": self.api_key,
-            "Content-Type": "application/json"
+            'X-MEXC-APIKEY': self.api_key,
+            'Content-Type': 'application/json'
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, params=params) as response:
-                data = await response.json()
-                return data['listenKey']
-
-    async def extend_listen_key(self, listen_key):
-        while True:
-            await asyncio.sleep(30 * 60)
-            url = self.rest_base_url + '/api/v3/userDataStream'
-
-            timestamp = str(int(time.time() * 1000))
-            params = {
-                'timestamp': timestamp,
-                'listenKey': listen_key
-            }
+        async def request():
+            params['timestamp'] = str(int(time.time() * 1000))
+            query_string = self.get_signed_query(params=params)
 
-            query_string = urlencode(params)
-            signature = self.get_signature(query_string=query_string)
-            params['signature'] = signature
+            started = time.perf_counter_ns()
+            # the query is sent as it was signed, aiohttp would quote the escapes of the batch orders JSON again
+            async with self.get_session().request(method, URL(f'{self.rest_base_url}{path}?{query_string}', encoded=True), headers=headers) as response:
+                text = await response.text()
+            stage_timers.record('rest', time.perf_counter_ns() - started)
 
-            headers = {
-                "X-MEXC-APIKEY": self.api_key,
-                "Content-Type": "application/json"
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.put(url, headers=headers, params=params) as response:
-                    data = await response.json()
-                    logger.info(f'Extended listenKey: {data}')
-
-    async def track_active_orders(self, listen_key: str):
-        url = f'{self.ws_base_url}?listenKey={listen_key}'
-
-        while True:
             try:
-                async with websockets.connect(url, ping_interval=20, ping_timeout=20) as ws:
-                    subscribe_message = {
-                        "method": "SUBSCRIPTION",
-                        "params": ["spot@private.orders.v3.api.pb"]
-                    }
-
-                    await ws.send(json.dumps(subscribe_message))
-                    logger.info("Subscribed to MEXC order tracking")
-
-                    async for message in ws:
-                        try:
-                            if isinstance(message, str):
-                                continue
-
-                            result = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper()
-                            result.ParseFromString(message)
-
-                            data = MessageToDict(result)
-
-                            if 'privateOrders' in data:
-                                data = data['privateOrders']
-
-                                if data['status'] == 1:
-                                    side = 'buy' if data['tradeType'] == 1 else 'sell'
-                                    price = Decimal(str(data['price']))
-                                    size = Decimal(str(data['quantity']))
-                                    order_id = data['id']
-
-                                    orders = self.active_orders.bids if side == 'buy' else self.active_orders.asks
-                                    sort_reverse = True if side == 'buy' else False
-
-                                    found = any(order_id == order.id for order in orders)
-
-                                    if not found:
-                                        orders.append(OrderLevel(id=order_id, price=price, size=size))
-                                        orders.sort(key=lambda order: order.price, reverse=sort_reverse)
-
-                                        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                                        order = DatabaseOrder(pair='RMV-USDT', side=side, price=price, size=size, order_id=order_id, timestamp=timestamp)
-                                        await self.database_client.record_order(order=order, table_name="every_order_placed")
-                                elif data['status'] == 2 or data['status'] == 3:
-                                    side = 'buy' if data['tradeType'] == 1 else 'sell'
-                                    order_id = data['id']
-                                    price = Decimal(str(data['price']))
-                                    remain_size = Decimal(str(data['remainQuantity']))
-                                    trade_size = Decimal(str(data['cumulativeQuantity']))
-
-                                    if side == 'buy':
-                                        self.amount_bought += trade_size
-                                    else:
-                                        self.amount_sold += remain_size
+                data = json.loads(text)
+            except ValueError:
+                data = text
+            return response.status, data
 
-                                    orders = self.active_orders.bids if side == 'buy' else self.active_orders.asks
+        if metrics is None:
+            return await request_with_retry(request, retries=retries)
 
-                                    for i in range(len(orders) - 1, -1, -1):
-                                        if orders[i].id == order_id:
-                                            if data['status'] == 2:
-                                                del orders[i]
-                                            else:
-                                                orders[i].size = remain_size
-
-                                    logger.info(f"tracking orders mexc, data: {data}")
-                                    event = QueueEvent(type=EventType.FILLED_ORDER, data=data)
-
-                                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                                    order_id = data['id']
-
-                                    order = DatabaseOrder(pair='RMV-USDT', side=side, price=price, size=trade_size, timestamp=timestamp, order_id=order_id)
-                                    await self.database_client.record_order(order=order, table_name="orders")
-
-                                    await self.add_to_event_queue(event=event)
-                                elif data['status'] == 4 or data['status'] == 5:
-                                    side = 'buy' if data['tradeType'] == 1 else 'sell'
-                                    order_id = data['id']
+        started = time.perf_counter()
+        try:
+            status, data = await request_with_retry(request, retries=retries)
+        except Exception:
+            metrics.observe(seconds=time.perf_counter() - started, ok=False)
+            raise
+        metrics.observe(seconds=time.perf_counter() - started, ok=status == 200)
+        return status, data
 
-                                    orders = self.active_orders.bids if side == 'buy' else self.active_orders.asks
+    async def create_listen_key(self):
+        status, data = await self.signed_request('POST', '/api/v3/userDataStream', params={})
+        return data['listenKey']
 
-                                    found = any(order_id == order.id for order in orders)
+    async def extend_listen_key(self, listen_key):
+        while True:
+            await asyncio.sleep(30 * 60)
 
-                                    if found:
-                                        for i in range(len(orders) - 1, -1, -1):
-                                            if order_id == orders[i].id:
-                                                del orders[i]
-                                                break
-
-                                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                                await self.database_client.record_orderbook(table='our_orders', exchange='mexc', orderbook=self.active_orders, timestamp=timestamp)
-                        except Exception as e:
-                            logger.error(f"Error: {e}")
-            except websockets.exceptions.ConnectionClosedOK as e:
-                logger.info(f"WebSocket closed normally (1000 Bye): {e}. Reconnecting...")
-                await asyncio.sleep(5)
-            except Exception as e:
-                logger.error(f"Error: {e}")
-                await asyncio.sleep(5)
+            status, data = await self.signed_request('PUT', '/api/v3/userDataStream', params={'listenKey': listen_key})
+            logger.info(f'Extended listenKey: {data}')
+
+    def apply_order_update(self, data: Optional[PrivateOrderUpdate]) -> list[Awaitable]:
+        # changes the order state right away and returns the records and the queue event to await afterwards, so that
+        # the updates of one fill are all applied before anything else runs
+        if data is None:
+            return []
+
+        follow_ups = []
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        if data.status == 1:
+            side = data.side
+            price = data.price
+            size = data.quantity
+            order_id = data.id
+
+            if self.active_orders.add(side=side, order_id=order_id, price=price, size=size):
+                order = DatabaseOrder(pair=self.symbol.pair, side=side, price=price, size=size, order_id=order_id, timestamp=timestamp)
+                follow_ups.append(self.database_client.record_order(order=order, table_name="every_order_placed"))
+        elif data.status == 2 or data.status == 3:
+            side = data.side
+            order_id = data.id
+            price = data.price
+            remain_size = data.remain_quantity
+            trade_size = data.cumulative_quantity
+
+            if side == 'buy':
+                self.amount_bought += trade_size
+            else:
+                self.amount_sold += remain_size
+
+            if data.status == 2:
+                self.active_orders.remove(order_id=order_id)
+            else:
+                self.active_orders.resize(order_id=order_id, size=remain_size)
+
+            logger.info(f"tracking orders mexc, data: {data}")
+            event = QueueEvent(type=EventType.FILLED_ORDER, data=data)
+
+            order = DatabaseOrder(pair=self.symbol.pair, side=side, price=price, size=trade_size, timestamp=timestamp, order_id=order_id)
+            follow_ups.append(self.database_client.record_order(order=order, table_name="orders"))
+            follow_ups.append(self.add_to_event_queue(event=event))
+        elif data.status == 4 or data.status == 5:
+            self.active_orders.remove(order_id=data.id)
+
+        follow_ups.append(self.database_client.record_orderbook(table='our_orders', exchange='mexc', orderbook=self.active_orders.snapshot(), timestamp=timestamp, symbol=self.symbol.pair))
+        return follow_ups
+
+    async def handle_order_update(self, data: Optional[PrivateOrderUpdate]):
+        for follow_up in self.apply_order_update(data):
+            await follow_up
+
+    def handle_deal(self, deal: Optional[PrivateDeal]):
+        if deal is not None:
+            self.deals += 1
+            self.fees[deal.fee_currency] = self.fees.get(deal.fee_currency, Decimal('0')) + deal.fee_amount
+            logger.info(f"deal mexc, data: {deal}")
 
     async def get_balance_snapshot(self):
         try:
-            timestamp = str(int(time.time() * 1000))
-            query_string = f'api_key={self.api_key}&timestamp={timestamp}'
-            signature = self.get_signature(query_string=query_string)
-
-            url = 'https://api.mexc.com/api/v3/account'
-            params = {
-                'api_key': self.api_key,
-                'timestamp': timestamp,
-                'signature': signature
-            }
-
-            headers = {
-                'X-MEXC-APIKEY': self.api_key,
-                'Content-Type': 'application/json'
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params) as response:
-                    data = await response.json()
-
-                    for token in data['balances']:
-                        if token['asset'] == CryptoCurrency.RMV.value or token['asset'] == CryptoCurrency.USDT.value:
-                            self.balance[token['asset']] = {'free': Decimal(token['free']), 'locked': Decimal(token['locked'])}
+            status, data = await self.signed_request('GET', '/api/v3/account', params={'api_key': self.api_key})
+
+            # tokens without a balance are not listed by the exchange
+            tokens = {token for client in self.clients.values() for token in (client.symbol.base, client.symbol.quote)}
+            balance = dict(self.balance)
+            for token in tokens - balance.keys():
+                balance[token] = {'free': Decimal('0'), 'locked': Decimal('0')}
+            for token in data['balances']:
+                if token['asset'] in tokens:
+                    balance[token['asset']] = {'free': Decimal(token['free']), 'locked': Decimal(token['locked'])}
+            self.balance = balance
         except Exception as e:
             logger.error(f'error: {e}')
 
-    async def track_balance(self, listen_key: str):
+    def handle_account_update(self, account: Optional[tuple[str, Decimal, Decimal]]):
+        if account is not None:
+            token, free, locked = account
+            self.balance = {**self.balance, token: {'free': free, 'locked': locked}}
+
+    def hold_private_update(self, wrapper) -> bool:
+        # queues the decoded frame for its client, returns whether the held updates can be applied: a fill is held
+        # until the account updates of both tokens of its symbol have arrived, MEXC usually pushes them before the
+        # order, an update of the last PRIVATE_FILL_SETTLE_TIMEOUT seconds that no fill waited for counts as arrived
+        body = wrapper.WhichOneof('body')
+
+        if body == 'privateAccount':
+            update = decode_private_account(wrapper)
+            self.held_updates.append((self, update))
+            if update[0] in self.awaited_tokens:
+                self.awaited_tokens.discard(update[0])
+            else:
+                self.updated_tokens[update[0]] = asyncio.get_running_loop().time()
+        elif body == 'privateOrders' or body == 'privateDeals':
+            # the stream carries the orders of every symbol of the account, also of symbols traded by another process
+            client = self.clients.get(wrapper.symbol)
+            if client is None:
+                return not self.awaited_tokens
+
+            if body == 'privateDeals':
+                self.held_updates.append((client, decode_private_deal(wrapper)))
+            else:
+                update = decode_private_order(wrapper)
+                self.held_updates.append((client, update))
+                if update.status == 2 or update.status == 3:
+                    now = asyncio.get_running_loop().time()
+                    awaited = set()
+                    for token in (client.symbol.base, client.symbol.quote):
+                        updated_at = self.updated_tokens.pop(token, None)
+                        if updated_at is None or now - updated_at > PRIVATE_FILL_SETTLE_TIMEOUT:
+                            awaited.add(token)
+
+                    if awaited and not self.awaited_tokens:
+                        self.settle_deadline = now + PRIVATE_FILL_SETTLE_TIMEOUT
+                    self.awaited_tokens.update(awaited)
+
+        return not self.awaited_tokens
+
+    async def apply_private_updates(self):
+        updates, self.held_updates = self.held_updates, []
+        self.awaited_tokens.clear()
+
+        follow_ups = []
+        for client, update in updates:
+            if isinstance(update, PrivateOrderUpdate):
+                follow_ups.extend(client.apply_order_update(update))
+            elif isinstance(update, PrivateDeal):
+                client.handle_deal(update)
+            else:
+                client.handle_account_update(update)
+
+        for follow_up in follow_ups:
+            await follow_up
+
+    async def track_private(self, listen_key: str):
+        # orders, deals and balance on one websocket, every frame is decoded once and the updates are applied in the
+        # order they were sent
         url = f'{self.ws_base_url}?listenKey={listen_key}'
+        loop = asyncio.get_running_loop()
 
         while True:
             try:
                 async with websockets.connect(url, ping_interval=20, ping_timeout=20) as ws:
                     subscribe_message = {
                         "method": "SUBSCRIPTION",
-                        "params": ["spot@private.account.v3.api.pb"]
+                        "params": [MEXC_PRIVATE_ORDERS_TOPIC, MEXC_PRIVATE_DEALS_TOPIC, MEXC_PRIVATE_ACCOUNT_TOPIC]
                     }
 
                     await ws.send(json.dumps(subscribe_message))
+                    logger.info("Subscribed to MEXC orders, deals and account")
 
                     await self.get_balance_snapshot()
                     logger.info('Fetched balance snapshot')
 
-                    async for message in ws:
+                    while True:
+                        try:
+                            timeout = max(0.0, self.settle_deadline - loop.time()) if self.awaited_tokens else None
+                            message = await asyncio.wait_for(ws.recv(), timeout)
+                        except asyncio.TimeoutError:
+                            logger.warning(f'No account update of {", ".join(sorted(self.awaited_tokens))} within {PRIVATE_FILL_SETTLE_TIMEOUT} s of a fill')
+                            await self.apply_private_updates()
+                            continue
+
                         try:
                             if isinstance(message, str):
                                 continue
-                            result = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper()
-                            result.ParseFromString(message)
-
-                            data = MessageToDict(result)
-
-                            if 'privateAccount' in data:
-                                token = data['privateAccount']['vcoinName']
-
-                                self.balance[token] = {'free': Decimal(str(data['privateAccount']['balanceAmount'])), 'locked': Decimal(str(data['privateAccount']['frozenAmount']))}
 
+                            wrapper = parse_message(message)
+                            if self.private_log is not None:
+                                self.private_log.append(PRIVATE_LOG_KINDS.get(wrapper.WhichOneof('body'), 'other'), (time.time_ns(), message))
 
+                            if self.hold_private_update(wrapper):
+                                await self.apply_private_updates()
                         except Exception as e:
                             logger.error(f"Error: {e}")
+            except websockets.exceptions.ConnectionClosedOK as e:
+                logger.info(f"WebSocket closed normally (1000 Bye): {e}. Reconnecting...")
+                await asyncio.sleep(5)
             except Exception as e:
                 logger.error(f"Websocket connection error: {e}")
                 await asyncio.sleep(5)
+            finally:
+                self.reconnects['private'] += 1
+                self.updated_tokens.clear()
+                # whatever was held before the disconnect is still in the order it arrived
+                if self.held_updates:
+                    await self.apply_private_updates()
+
+    async def get_depth_snapshot(self):
+        async def request():
+            async with self.get_session().get(self.rest_base_url + '/api/v3/depth', params={'symbol': self.symbol.name, 'limit': MEXC_DEPTH_SNAPSHOT_LIMIT}) as response:
+                return response.status, await response.json(content_type=None)
+
+        status, data = await request_with_retry(request, retries=3)
+
+        tick_size = self.symbol.tick_size
+        asks = [(price_to_ticks(Decimal(price), tick_size), size_to_units(Decimal(size))) for price, size in data['asks']]
+        bids = [(price_to_ticks(Decimal(price), tick_size), size_to_units(Decimal(size))) for price, size in data['bids']]
+
+        return int(data['lastUpdateId']), asks, bids
+
+    def archive_orderbook(self, diff):
+        timestamp_ns = time.time_ns()
+
+        if diff is None or self.archive.snapshot_due():
+            ask_side, bid_side = self.orderbook.ask_side, self.orderbook.bid_side
+            self.archive.record_snapshot(timestamp_ns=timestamp_ns, asks=zip(ask_side.ticks, ask_side.sizes), bids=zip(bid_side.ticks, bid_side.sizes))
+        else:
+            self.archive.record_diff(timestamp_ns=timestamp_ns, asks=diff[2], bids=diff[3])
+
+    def resync(self):
+        self.orderbook.reset()
+        self.buffered_diffs = []
+        self.snapshot = asyncio.create_task(self.get_depth_snapshot())
+
+    async def handle_depth(self, diff):
+        started = time.perf_counter_ns()
+        update_id = self.orderbook.update_id
+
+        if not self.orderbook.synced:
+            self.buffered_diffs.append(diff)
+            if not self.snapshot.done():
+                return
+
+            # a cancelled snapshot has no exception to read, it is fetched again like a failed one
+            if self.snapshot.cancelled() or self.snapshot.exception() is not None:
+                reason = 'cancelled' if self.snapshot.cancelled() else self.snapshot.exception()
+                logger.error(f'Failed to fetch MEXC depth snapshot of {self.symbol.name}: {reason}')
+                self.snapshot = asyncio.create_task(self.get_depth_snapshot())
+                return
+
+            self.orderbook.load_snapshot(*self.snapshot.result())
+            logger.info(f'Loaded MEXC depth snapshot of {self.symbol.name}, version: {self.orderbook.version}')
+            diff = None
+
+            for buffered_diff in self.buffered_diffs:
+                if not self.orderbook.apply_diff(*buffered_diff):
+                    break
+            self.buffered_diffs = []
+        elif not self.orderbook.apply_diff(*diff):
+            logger.warning(f'MEXC depth gap of {self.symbol.name}: book version {self.orderbook.version}, diff from {diff[0]} to {diff[1]}, resyncing')
+        stage_timers.record('apply', time.perf_counter_ns() - started)
+
+        if not self.orderbook.synced:
+            self.resync()
+            return
+
+        if self.orderbook.update_id == update_id:
+            return
+        self.book_updates += 1
+
+        if self.archive is not None:
+            self.archive_orderbook(diff=diff)
+
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        await self.database_client.record_orderbook(table='mexc_orderbook', exchange='mexc', orderbook=self.orderbook.to_orderbook(depth=5), timestamp=timestamp, symbol=self.symbol.pair)
+
+        event = QueueEvent(type=EventType.MEXC_ORDERBOOK_UPDATE, data=diff)
+        await self.add_to_event_queue(event=event)
+
+    async def update_orderbook(self):
+        # the depth of every symbol of this client and its children, MEXC accepts MEXC_TOPICS_PER_CONNECTION topics on
+        # one websocket so the symbols are spread over as few connections as that allows
+        topics_per_symbol = 2 if any(client.trade_archive is not None for client in self.clients.values()) else 1
+        clients = list(self.clients.values())
+        per_connection = max(1, MEXC_TOPICS_PER_CONNECTION // topics_per_symbol)
+
+        await asyncio.gather(*[self.stream_depth(clients=clients[i:i + per_connection]) for i in range(0, len(clients), per_connection)])
+
+    async def stream_depth(self, clients: list['MexcClient']):
+        by_symbol = {client.symbol.name: client for client in clients}
 
-    async def update_orderbook(self, first_currency: CryptoCurrency, second_currency: CryptoCurrency):
-        symbol = first_currency.value + second_currency.value
         while True:
             try:
                 async with websockets.connect(self.ws_base_url, ping_interval=20, ping_timeout=20) as ws:
+                    topics = []
+                    for client in clients:
+                        topics.append(MEXC_DEPTH_TOPIC.format(symbol=client.symbol.name))
+                        if client.trade_archive is not None:
+                            topics.append(MEXC_DEALS_TOPIC.format(symbol=client.symbol.name))
+
                     subscribe_message = {
                         "method": "SUBSCRIPTION",
-                        "params": [f"spot@public.limit.depth.v3.api.pb@{symbol}@10"]
+                        "params": topics
                     }
 
                     await ws.send(json.dumps(subscribe_message))
-                    logger.info(f'Subscribed to topic, MEXC')
+                    logger.info(f'Subscribed to {len(topics)} topics, MEXC')
+
+                    for client in clients:
+                        client.resync()
 
                     async for message in ws:
                         try:
                             if isinstance(message, str):
                                 continue
 
-                            result = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper()
-                            result.ParseFromString(message)
-
-                            orderbook_dict = MessageToDict(result)
-                            data = {'asks': orderbook_dict['publicLimitDepths']['asks'], 'bids': orderbook_dict['publicLimitDepths']['bids']}
-
-                            asks = [OrderLevel(price=Decimal(str(ask['price'])), size=Decimal(str(ask['quantity'])), id="") for ask in data['asks']]
-                            bids = [OrderLevel(price=Decimal(str(bid['price'])), size=Decimal(str(bid['quantity'])), id="") for bid in data['bids']]
-
-                            if self.orderbook.asks == asks and self.orderbook.bids == bids:
+                            started = time.perf_counter_ns()
+                            wrapper = parse_message(message)
+                            client = by_symbol.get(wrapper.symbol)
+                            if client is None:
                                 continue
 
-                            self.orderbook = OrderBook(asks=asks, bids=bids)
-
-                            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            await self.database_client.record_orderbook(table='mexc_orderbook', exchange='mexc', orderbook=self.orderbook, timestamp=timestamp)
+                            diff = decode_depth(wrapper, client.symbol.price_decimals)
+                            if diff is None:
+                                deals = decode_deals(wrapper, client.symbol.price_decimals)
+                                if deals is not None and client.trade_archive is not None:
+                                    client.trade_archive.record_diff(timestamp_ns=time.time_ns(), asks=deals[0], bids=deals[1])
+                                continue
 
-                            event = QueueEvent(type=EventType.MEXC_ORDERBOOK_UPDATE, data=data)
-                            await self.add_to_event_queue(event=event)
+                            stage_timers.record('decode', time.perf_counter_ns() - started)
+                            await client.handle_depth(diff)
                         except Exception as e:
                             logger.error(f"error: {e}")
             except Exception as e:
                 logger.error(f'WebSocket connection error: {e}')
                 await asyncio.sleep(5)
+            finally:
+                # a stream that ended without an error is connected again as well
+                self.reconnects['depth'] += 1
 
-    async def place_limit_order(self, first_currency: CryptoCurrency, second_currency: CryptoCurrency, side: str, order_type: str, size: Decimal, price: Decimal):
-        async with self.lock:
-            symbol = first_currency.value + second_currency.value
-            url = self.rest_base_url + '/api/v3/order'
-
-            timestamp = str(int(time.time() * 1000))
-            params = {
-                'type': order_type.upper(),
-                'symbol': symbol,
-                'side': side.upper(),
-                'price': str(price),
-                'quantity': str(size),
-                'timestamp': timestamp
-            }
-
-            query_string = "&".join([f"{key}={params[key]}" for key in sorted(params.keys())])
-
-            signature = self.get_signature(query_string=query_string)
-            query_string += f'&signature={signature}'
-
-            headers = {
-                'X-MEXC-APIKEY': self.api_key,
-                'Content-Type': 'application/json'
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, params=query_string) as response:
-                    text = await response.text()
-                    if response.status == 200:
-                        data = await response.json()
-                        return data['orderId']
-                    else:
-                        logger.error(f'Order failed: {text}, price: {price}, size: {size}, side: {side},  balances: {self.balance}')
-                        try:
-                            caller_frame = inspect.stack()[1]
-                            caller_file = caller_frame.filename
-                            caller_line = caller_frame.lineno
-                            caller_func = caller_frame.function
-                            logger.info(f"Called from {caller_func} in {caller_file} at line {caller_line}")
-                        except Exception as e:
-                            logger.error(f"Error: {e}")
-                        return None
+    async def place_limit_order(self, side: str, order_type: str, size: Decimal, price: Decimal):
+        params = {
+            'type': order_type.upper(),
+            'symbol': self.symbol.name,
+            'side': side.upper(),
+            'price': str(price),
+            'quantity': str(size)
+        }
+
+        status, data = await self.signed_request('POST', '/api/v3/order', params=params, metrics=self.order_requests['place'])
+
+        if status == 200:
+            return data['orderId']
+        else:
+            logger.error(f'Order failed: {data}, price: {price}, size: {size}, side: {side},  balances: {self.get_balance()}')
+            return None
 
-    async def cancel_order(self, first_currency: CryptoCurrency, second_currency: CryptoCurrency, order_id: str):
-        symbol = first_currency.value + second_currency.value
-        url = self.rest_base_url + '/api/v3/order'
+    async def place_batch_orders(self, orders: list[OrderAction]) -> list[Optional[str]]:
+        batch_orders = [{
+            'type': 'LIMIT',
+            'symbol': self.symbol.name,
+            'side': order.side.upper(),
+            'price': str(order.price),
+            'quantity': str(order.size)
+        } for order in orders]
 
-        timestamp = str(int(time.time() * 1000))
+        status, data = await self.signed_request('POST', '/api/v3/batchOrders', params={'batchOrders': json.dumps(batch_orders, separators=(',', ':'))}, metrics=self.order_requests['place'])
 
+        if status != 200 or not isinstance(data, list):
+            logger.error(f'Batch order failed: {data}, orders: {orders}, balances: {self.get_balance()}')
+            return [None] * len(orders)
+
+        order_ids = []
+        for order, result in zip(orders, data):
+            if 'orderId' in result:
+                order_ids.append(result['orderId'])
+            else:
+                logger.error(f'Order failed: {result}, price: {order.price}, size: {order.size}, side: {order.side}')
+                order_ids.append(None)
+
+        return order_ids
+
+    async def cancel_order(self, order_id: str):
         params = {
-            'symbol': symbol.upper(),
+            'symbol': self.symbol.name.upper(),
             'orderId': order_id,
-            'timestamp': timestamp,
             'recvWindow': 60000,
             'api_key': self.api_key
         }
 
-        query_string = urlencode(params)
-        signature = hmac.new(self.api_secret.encode('utf-8'), query_string.encode('utf-8'),hashlib.sha256).hexdigest()
-        params['signature'] = signature
-
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, params=params) as response:
-                data = await response.json()
-
-                if response.status == 200:
-                    return data
-                else:
-                    logger.error(f'Order cancellation failed: {data}, order_id: {order_id}')
-                    try:
-                        caller_frame = inspect.stack()[1]
-                        caller_file = caller_frame.filename
-                        caller_line = caller_frame.lineno
-                        caller_func = caller_frame.function
-                        print(f"Called from {caller_func} in {caller_file} at line {caller_line}")
-                    except Exception as e:
-                        logger.error(f"Error: {e}")
-                    return None
-
-    async def cancel_all_orders(self, first_currency: CryptoCurrency, second_currency: CryptoCurrency):
-        timestamp = round(time.time() * 1000)
-        symbol = first_currency.value + second_currency.value
+        status, data = await self.signed_request('DELETE', '/api/v3/order', params=params, metrics=self.order_requests['cancel'])
+
+        if status == 200:
+            return data
+        else:
+            logger.error(f'Order cancellation failed: {data}, order_id: {order_id}')
+            return None
 
+    async def cancel_all_orders(self):
         params = {
             'api_key': self.api_key,
-            'symbol': symbol.upper(),
-            'timestamp': timestamp
+            'symbol': self.symbol.name.upper()
         }
 
-        query_string = '&'.join([f'{key}={params[key]}' for key in sorted(params.keys())])
-        signature = self.get_signature(query_string=query_string)
-
-        cancel_endpoint = f'/api/v3/openOrders?api_key={self.api_key}' + '&symbol=RMVUSDT' + '&' + 'timestamp=' + str(timestamp) + '&' + 'signature=' + signature
+        try:
+            status, data = await self.signed_request('DELETE', '/api/v3/openOrders', params=params, retries=3)
+        except Exception as e:
+            logger.error(f'Cancelling all orders failed: {e}')
+            return None
 
-        response = requests.delete(self.rest_base_url + cancel_endpoint)
-        if response.status_code == 200:
-            logger.info(f"Cancelled orders: {response.json()}")
-            return response
+        if status == 200:
+            logger.info(f"Cancelled orders: {data}")
+            return data
         else:
-            logger.error(f'{response.status_code}, {response.text}')
+            logger.error(f'{status}, {data}')
             return None
@@ -0,0 +1,104 @@
+from decimal import Decimal
+from typing import Optional
+from src.crypto.mexc.websocket_proto import PushDataV3ApiWrapper_pb2
+from src.crypto.market.book import SIZE_DECIMALS, parse_fixed, price_to_ticks, size_to_units
+from src.model import PrivateOrderUpdate, PrivateDeal, MEXC_TICK_SIZE
+
+PRICE_DECIMALS = -MEXC_TICK_SIZE.as_tuple().exponent
+
+
+def parse_message(message: bytes) -> PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper:
+    wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper()
+    wrapper.ParseFromString(message)
+    return wrapper
+
+
+def parse_ticks(value: str, price_decimals: int = PRICE_DECIMALS) -> int:
+    if 'e' in value or 'E' in value:
+        return price_to_ticks(Decimal(value), Decimal(1).scaleb(-price_decimals))
+    return parse_fixed(value, price_decimals)
+
+
+def parse_units(value: str) -> int:
+    if not value:
+        return 0
+    if 'e' in value or 'E' in value:
+        return size_to_units(Decimal(value))
+    return parse_fixed(value, SIZE_DECIMALS)
+
+
+def decode_levels(items, price_decimals: int = PRICE_DECIMALS) -> list[tuple[int, int]]:
+    return [(parse_ticks(item.price, price_decimals), parse_units(item.quantity)) for item in items]
+
+
+def decode_depth(wrapper: PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper, price_decimals: int = PRICE_DECIMALS) -> Optional[tuple[int, int, list[tuple[int, int]], list[tuple[int, int]]]]:
+    body = wrapper.WhichOneof('body')
+
+    if body == 'publicAggreDepths':
+        depth = wrapper.publicAggreDepths
+        from_version, to_version = int(depth.fromVersion), int(depth.toVersion)
+    elif body == 'publicIncreaseDepths':
+        depth = wrapper.publicIncreaseDepths
+        from_version = to_version = int(depth.version)
+    else:
+        return None
+
+    return from_version, to_version, decode_levels(depth.asks, price_decimals), decode_levels(depth.bids, price_decimals)
+
+
+def decode_deals(wrapper: PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper, price_decimals: int = PRICE_DECIMALS) -> Optional[tuple[list[tuple[int, int]], list[tuple[int, int]]]]:
+    # trades split by the book side they consumed: taker buys hit the asks, taker sells hit the bids
+    if wrapper.WhichOneof('body') != 'publicAggreDeals':
+        return None
+
+    buys, sells = [], []
+    for deal in wrapper.publicAggreDeals.deals:
+        (buys if deal.tradeType == 1 else sells).append((parse_ticks(deal.price, price_decimals), parse_units(deal.quantity)))
+
+    return buys, sells
+
+
+def decode_private_order(wrapper: PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper) -> Optional[PrivateOrderUpdate]:
+    if wrapper.WhichOneof('body') != 'privateOrders':
+        return None
+
+    order = wrapper.privateOrders
+
+    return PrivateOrderUpdate(
+        id=order.id,
+        side='buy' if order.tradeType == 1 else 'sell',
+        status=order.status,
+        price=Decimal(order.price or '0'),
+        quantity=Decimal(order.quantity or '0'),
+        remain_quantity=Decimal(order.remainQuantity or '0'),
+        cumulative_quantity=Decimal(order.cumulativeQuantity or '0')
+    )
+
+
+def decode_private_deal(wrapper: PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper) -> Optional[PrivateDeal]:
+    if wrapper.WhichOneof('body') != 'privateDeals':
+        return None
+
+    deal = wrapper.privateDeals
+
+    return PrivateDeal(
+        order_id=deal.orderId,
+        trade_id=deal.tradeId,
+        side='buy' if deal.tradeType == 1 else 'sell',
+        price=Decimal(deal.price or '0'),
+        quantity=Decimal(deal.quantity or '0'),
+        amount=Decimal(deal.amount or '0'),
+        is_maker=deal.isMaker,
+        fee_amount=Decimal(deal.feeAmount or '0'),
+        fee_currency=deal.feeCurrency,
+        time=deal.time
+    )
+
+
+def decode_private_account(wrapper: PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper) -> Optional[tuple[str, Decimal, Decimal]]:
+    if wrapper.WhichOneof('body') != 'privateAccount':
+        return None
+
+    account = wrapper.privateAccount
+
+    return account.vcoinName, Decimal(account.balanceAmount or '0'), Decimal(account.frozenAmount or '0')
@@ -0,0 +1,239 @@
+import heapq
+import json
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from typing import Iterator, Optional
+from loguru import logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FLAG_BID = 1
+FLAG_SNAPSHOT = 2
+FLAG_MESSAGE_START = 4
+
+COLUMNS = {'ts': 'q', 'tick': 'q', 'size': 'q', 'flags': 'b'}
+INDEX_FILE = 'index'
+META_FILE = 'meta.json'
+PRIVATE_LOG_STREAM = 'private'
+MAX_TIMESTAMP_NS = 2 ** 63 - 1
+
+
+class ArchiveWriter:
+    def __init__(self, directory: str, stream: str, tick_size: Decimal, size_scale: int, segment_rows: int = 4_000_000, index_every: int = 1024, snapshot_interval: float = 60):
+        self.directory = os.path.join(directory, stream)
+        self.segment_rows = segment_rows
+        self.index_every = index_every
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = 0.0
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, META_FILE), 'w') as file:
+            json.dump({'tick_size': str(tick_size), 'size_scale': size_scale}, file)
+
+        self.files = {}
+        self.segment_path: Optional[str] = None
+        self.rows = 0
+
+    def open_segment(self, timestamp_ns: int):
+        self.close_segment()
+
+        existing = [int(name) for name in os.listdir(self.directory) if name.isdigit()]
+        if existing and max(existing) >= timestamp_ns:
+            timestamp_ns = max(existing) + 1
+
+        self.segment_path = os.path.join(self.directory, f'{timestamp_ns:020d}')
+        os.makedirs(self.segment_path, exist_ok=True)
+        self.files = {name: open(os.path.join(self.segment_path, name), 'ab') for name in [*COLUMNS, INDEX_FILE]}
+        self.rows = 0
+
+    def close_segment(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def snapshot_due(self) -> bool:
+        return time.monotonic() - self.last_snapshot >= self.snapshot_interval
+
+    def record(self, timestamp_ns: int, asks, bids, snapshot: bool):
+        # asks and bids are iterables of (tick, size) pairs, a message is stored as consecutive rows
+        if self.segment_path is None or self.rows >= self.segment_rows:
+            self.open_segment(timestamp_ns)
+
+        columns = {name: array(code) for name, code in COLUMNS.items()}
+        base_flags = FLAG_SNAPSHOT if snapshot else 0
+
+        for side_flag, levels in ((0, asks), (FLAG_BID, bids)):
+            for tick, size in levels:
+                columns['tick'].append(tick)
+                columns['size'].append(size)
+                columns['flags'].append(base_flags | side_flag)
+
+        count = len(columns['tick'])
+        if count == 0:
+            # an empty message still marks a snapshot of an empty book
+            if not snapshot:
+                return
+            columns['tick'].append(0)
+            columns['size'].append(0)
+            columns['flags'].append(base_flags)
+            count = 1
+
+        columns['flags'][0] |= FLAG_MESSAGE_START
+        columns['ts'].extend([timestamp_ns] * count)
+
+        if self.rows // self.index_every != (self.rows + count) // self.index_every or self.rows == 0:
+            self.files[INDEX_FILE].write(array('q', [timestamp_ns, self.rows]).tobytes())
+
+        for name, values in columns.items():
+            self.files[name].write(values.tobytes())
+
+        self.rows += count
+
+        if snapshot:
+            self.last_snapshot = time.monotonic()
+
+    def record_snapshot(self, timestamp_ns: int, asks, bids):
+        self.record(timestamp_ns=timestamp_ns, asks=asks, bids=bids, snapshot=True)
+
+    def record_diff(self, timestamp_ns: int, asks, bids):
+        self.record(timestamp_ns=timestamp_ns, asks=asks, bids=bids, snapshot=False)
+
+    def flush(self):
+        for file in self.files.values():
+            file.flush()
+
+    def close(self):
+        self.close_segment()
+        self.segment_path = None
+
+
+class ArchiveSegment:
+    def __init__(self, path: str):
+        self.path = path
+        self.maps = []
+        self.columns = {}
+
+        for name, code in COLUMNS.items():
+            self.columns[name] = self.map_column(os.path.join(path, name), code)
+        self.index = self.map_column(os.path.join(path, INDEX_FILE), 'q')
+
+        # columns of a segment that is still being written can be ahead of each other
+        self.rows = min(len(column) for column in self.columns.values())
+        self.index_ts = self.index[0::2]
+        self.index_rows = self.index[1::2]
+
+    def map_column(self, path: str, code: str):
+        size = os.path.getsize(path)
+        usable = size - size % array(code).itemsize
+        if usable == 0:
+            return memoryview(b'').cast(code)
+
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), usable, access=mmap.ACCESS_READ)
+        self.maps.append(data)
+        return memoryview(data).cast(code)
+
+    def find(self, timestamp_ns: int) -> int:
+        # first row with ts >= timestamp_ns, the sparse index narrows the search before touching the ts column
+        i = bisect_left(self.index_ts, timestamp_ns)
+        j = bisect_right(self.index_ts, timestamp_ns)
+        low = self.index_rows[i - 1] if i > 0 else 0
+        high = self.index_rows[j] if j < len(self.index_rows) else self.rows
+
+        return bisect_left(self.columns['ts'], timestamp_ns, min(low, self.rows), min(high, self.rows))
+
+    def close(self):
+        for view in [self.index_ts, self.index_rows, self.index, *self.columns.values()]:
+            view.release()
+        for data in self.maps:
+            data.close()
+
+
+class ArchiveReader:
+    def __init__(self, directory: str, stream: str):
+        self.directory = os.path.join(directory, stream)
+
+        with open(os.path.join(self.directory, META_FILE)) as file:
+            meta = json.load(file)
+        self.tick_size = Decimal(meta['tick_size'])
+        self.size_scale = meta['size_scale']
+
+        self.segment_starts = sorted(int(name) for name in os.listdir(self.directory) if name.isdigit())
+        self.segments: dict[int, ArchiveSegment] = {}
+
+    def get_segment(self, start: int) -> ArchiveSegment:
+        if start not in self.segments:
+            self.segments[start] = ArchiveSegment(os.path.join(self.directory, f'{start:020d}'))
+        return self.segments[start]
+
+    def ranges(self, start_ns: int, end_ns: int) -> Iterator[tuple[ArchiveSegment, int, int]]:
+        # yields (segment, first row, last row + 1) covering start_ns <= ts < end_ns
+        first = max(bisect_right(self.segment_starts, start_ns) - 1, 0)
+        for segment_start in self.segment_starts[first:]:
+            if segment_start >= end_ns:
+                break
+            segment = self.get_segment(segment_start)
+            low, high = segment.find(start_ns), segment.find(end_ns)
+            if low < high:
+                yield segment, low, high
+
+    def rows(self, start_ns: int = 0, end_ns: int = MAX_TIMESTAMP_NS) -> Iterator[tuple[int, int, int, int]]:
+        for segment, low, high in self.ranges(start_ns, end_ns):
+            ts, tick, size, flags = (segment.columns[name] for name in COLUMNS)
+            for i in range(low, high):
+                yield ts[i], tick[i], size[i], flags[i]
+
+    def messages(self, start_ns: int = 0, end_ns: int = MAX_TIMESTAMP_NS) -> Iterator[tuple[int, bool, list[tuple[int, int]], list[tuple[int, int]]]]:
+        # yields (timestamp_ns, is_snapshot, asks, bids) with levels as (tick, size) pairs
+        message = None
+
+        for ts, tick, size, flags in self.rows(start_ns, end_ns):
+            if flags & FLAG_MESSAGE_START:
+                if message is not None:
+                    yield message
+                message = (ts, bool(flags & FLAG_SNAPSHOT), [], [])
+            elif message is None:
+                continue
+
+            if tick or size:
+                (message[3] if flags & FLAG_BID else message[2]).append((tick, size))
+
+        if message is not None:
+            yield message
+
+    def arrays(self, start_ns: int = 0, end_ns: int = MAX_TIMESTAMP_NS) -> dict:
+        if np is None:
+            raise RuntimeError('numpy is required for ArchiveReader.arrays')
+
+        parts = {name: [] for name in COLUMNS}
+        for segment, low, high in self.ranges(start_ns, end_ns):
+            for name, code in COLUMNS.items():
+                parts[name].append(np.frombuffer(segment.columns[name], dtype=np.dtype(code))[low:high])
+
+        # a single segment is returned as zero-copy views into the mapped files
+        return {name: (arrays[0] if len(arrays) == 1 else np.concatenate(arrays) if arrays else np.empty(0, dtype=np.dtype(COLUMNS[name]))) for name, arrays in parts.items()}
+
+    def close(self):
+        for segment in self.segments.values():
+            try:
+                segment.close()
+            except BufferError as e:
+                logger.warning(f'Archive segment {segment.path} is still referenced: {e}')
+        self.segments = {}
+
+
+def stream_messages(stream: str, reader: ArchiveReader, start_ns: int, end_ns: int) -> Iterator[tuple[int, str, tuple]]:
+    for message in reader.messages(start_ns, end_ns):
+        yield message[0], stream, message
+
+
+def merge_streams(readers: dict[str, ArchiveReader], start_ns: int = 0, end_ns: int = MAX_TIMESTAMP_NS) -> Iterator[tuple[int, str, tuple]]:
+    # (timestamp_ns, stream, message) of all streams by timestamp, equal timestamps keep the order of the readers
+    return heapq.merge(*[stream_messages(stream, reader, start_ns, end_ns) for stream, reader in readers.items()], key=lambda event: event[0])
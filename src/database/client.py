@@ -1,10 +1,18 @@
 from loguru import logger
-from src.model import DatabaseOrder, DatabaseMarketState, OrderBook
+from src.model import DatabaseOrder, DatabaseMarketState, MetricFamily, OrderBook, OverflowPolicy, DEFAULT_SYMBOL
+from src.database.writer import TableWriter
+from src.database.journal import Journal
 import aiomysql
+import asyncio
+from typing import Optional
 from decimal import Decimal, ROUND_HALF_UP
 
+ORDER_COLUMNS = ['pair', 'side', 'quantity', 'price', 'timestamp', 'order_id']
+MARKET_STATE_COLUMNS = ['market_depth', 'fair_price', 'market_spread', 'usdt_balance', 'rmv_balance', 'rmv_value', 'timestamp']
+ORDERBOOK_COLUMNS = ['exchange', 'symbol', 'timestamp'] + [f'{side}{i}_{field}' for side in ['bid', 'ask'] for i in range(1, 6) for field in ['price', 'size']]
+
 class DatabaseClient:
-    def __init__(self, host, user, password):
+    def __init__(self, host, user, password, max_buffer: int = 10_000, batch_size: int = 500, flush_interval: float = 1.0, overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, spill_dir: str = 'spill', journal: Optional[Journal] = None, replay_batch_size: int = 5_000, replay_interval: float = 1.0):
         self.host = host
         self.user = user
         self.password = password
@@ -12,7 +20,35 @@ class DatabaseClient:
         self.connection = None
         self.pool = None
 
+        tables = {
+            'orders': ORDER_COLUMNS,
+            'every_order_placed': ORDER_COLUMNS,
+            'market_states': MARKET_STATE_COLUMNS,
+            'kucoin_orderbook': ORDERBOOK_COLUMNS,
+            'mexc_orderbook': ORDERBOOK_COLUMNS,
+            'our_orders': ORDERBOOK_COLUMNS
+        }
+        self.writers = {table: TableWriter(table=table, columns=columns, max_buffer=max_buffer, batch_size=batch_size, flush_interval=flush_interval, overflow_policy=overflow_policy, spill_dir=spill_dir) for table, columns in tables.items()}
+
+        self.journal = journal
+        self.replay_batch_size = replay_batch_size
+        self.replay_interval = replay_interval
+        self.replay_task: Optional[asyncio.Task] = None
+        self.replayed_records = 0
+        self.failed_replays = 0
+
     async def connect(self):
+        if self.journal is not None:
+            self.journal.start()
+            self.replay_task = asyncio.create_task(self.replay_journal())
+            return
+
+        await self.create_pool()
+
+        for writer in self.writers.values():
+            writer.start(pool=self.pool)
+
+    async def create_pool(self):
         self.pool = await aiomysql.create_pool(
             host=self.host,
             user=self.user,
@@ -80,32 +116,63 @@ class DatabaseClient:
                         )
                     """)
 
+        for writer in self.writers.values():
+            writer.pool = self.pool
+
+    async def replay_journal(self):
+        backoff = self.replay_interval
+
+        while True:
+            try:
+                if self.pool is None:
+                    await self.create_pool()
+
+                if await self.replay_once() < self.replay_batch_size:
+                    await asyncio.sleep(self.replay_interval)
+                backoff = self.replay_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_replays += 1
+                logger.error(f"Failed to replay database journal: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    async def replay_once(self) -> int:
+        # the reads, the checkpoint fsync and the removal of replayed segments run in a worker thread, only the flush of
+        # the appended records stays on the loop
+        self.journal.flush()
+        records, position = await asyncio.to_thread(self.journal.read_segments, max_records=self.replay_batch_size, last_segment=self.journal.segment)
+        if not records:
+            return 0
+
+        rows = {}
+        for table, row in records:
+            rows.setdefault(table, []).append(row)
+
+        for table, table_rows in rows.items():
+            await self.writers[table].write(table_rows)
+
+        await asyncio.to_thread(self.journal.commit, position)
+        self.replayed_records += len(records)
+        return len(records)
+
+    async def put(self, table: str, row: tuple):
+        if self.journal is not None:
+            self.journal.append(table, row)
+        else:
+            await self.writers[table].put(row)
+
     async def record_order(self, order: DatabaseOrder, table_name: str):
         if table_name == 'orders':
             logger.info(f'Recording order: {order}')
 
-        async with self.pool.acquire() as connection:
-            try:
-                async with connection.cursor() as cursor:
-                    await cursor.execute(f"""
-                        INSERT INTO {table_name} (pair, side, quantity, price, timestamp, order_id)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (order.pair, order.side, order.size, order.price, order.timestamp, order.order_id))
-            except Exception as e:
-                logger.error(f"Failed to record order: {e}")
+        await self.put(table_name, (order.pair, order.side, order.size, order.price, order.timestamp, order.order_id))
 
     async def record_market_state(self, market_state: DatabaseMarketState):
-        async with self.pool.acquire() as connection:
-            async with connection.cursor() as cursor:
-                try:
-                    await cursor.execute("""
-                        INSERT INTO market_states  (market_depth, fair_price, market_spread, usdt_balance, rmv_balance, rmv_value, timestamp)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (market_state.market_depth.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.fair_price.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.market_spread.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.usdt_balance.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.rmv_balance.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.rmv_value.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.timestamp))
-                except Exception as e:
-                    logger.error(f"Failed to record market state: {e}")
-
-    async def record_orderbook(self, table: str, exchange: str, orderbook: OrderBook, timestamp: str):
+        await self.put('market_states', (market_state.market_depth.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.fair_price.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.market_spread.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.usdt_balance.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.rmv_balance.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.rmv_value.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP), market_state.timestamp))
+
+    async def record_orderbook(self, table: str, exchange: str, orderbook: OrderBook, timestamp: str, symbol: str = DEFAULT_SYMBOL.pair):
         values = []
         for i in range(5):
             if i < len(orderbook.bids):
@@ -120,17 +187,43 @@ class DatabaseClient:
             else:
                 values.extend([None, None])
 
-        async with self.pool.acquire() as connection:
-            async with connection.cursor() as cursor:
-                try:
-                    await cursor.execute(f"""
-                        INSERT INTO {table} (exchange, symbol, timestamp, bid1_price, bid1_size, bid2_price, bid2_size, bid3_price, bid3_size, bid4_price, bid4_size, bid5_price, bid5_size, ask1_price, ask1_size, ask2_price, ask2_size, ask3_price, ask3_size, ask4_price, ask4_size, ask5_price, ask5_size)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (exchange, "RMV-USDT", timestamp, *values))
-                except Exception as e:
-                    logger.error(f"Failer to record {exchange} orderbook: {e}")
+        await self.put(table, (exchange, symbol, timestamp, *values))
+
+    def get_stats(self) -> dict:
+        if self.journal is not None:
+            return {'journal': self.journal.get_stats(), 'replayed': self.replayed_records, 'failed_replays': self.failed_replays}
+        return {table: writer.get_stats() for table, writer in self.writers.items()}
+
+    def get_metrics(self) -> list[MetricFamily]:
+        if self.journal is not None:
+            # rows this process appended to the journal and has not replayed into MySQL yet
+            return [
+                MetricFamily(name='mm_db_backlog_rows', kind='gauge', help='Database rows waiting to be written', samples=[('', {'queue': 'journal'}, max(0, self.journal.records_appended - self.replayed_records))]),
+                MetricFamily(name='mm_db_failed_writes_total', kind='counter', help='Failed database writes', samples=[('', {'queue': 'journal'}, self.failed_replays)])
+            ]
+
+        return [
+            MetricFamily(name='mm_db_backlog_rows', kind='gauge', help='Database rows waiting to be written', samples=[('', {'queue': table}, len(writer.buffer)) for table, writer in self.writers.items()]),
+            MetricFamily(name='mm_db_rows_written_total', kind='counter', help='Database rows written', samples=[('', {'queue': table}, writer.rows_written) for table, writer in self.writers.items()]),
+            MetricFamily(name='mm_db_rows_dropped_total', kind='counter', help='Database rows dropped by the overflow policy', samples=[('', {'queue': table}, writer.rows_dropped) for table, writer in self.writers.items()]),
+            MetricFamily(name='mm_db_rows_spilled_total', kind='counter', help='Database rows spilled to disk by the overflow policy', samples=[('', {'queue': table}, writer.rows_spilled) for table, writer in self.writers.items()]),
+            MetricFamily(name='mm_db_failed_writes_total', kind='counter', help='Failed database writes', samples=[('', {'queue': table}, writer.failed_flushes) for table, writer in self.writers.items()])
+        ]
 
     async def close(self):
+        if self.journal is not None:
+            if self.replay_task is not None:
+                self.replay_task.cancel()
+            try:
+                if self.pool is not None:
+                    while await self.replay_once() > 0:
+                        pass
+            except Exception as e:
+                logger.error(f"Failed to replay database journal on shutdown: {e}")
+            self.journal.close()
+        else:
+            await asyncio.gather(*[writer.close() for writer in self.writers.values()])
+
         if self.pool:
             self.pool.close()
             await self.pool.wait_closed()
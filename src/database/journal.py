@@ -0,0 +1,191 @@
+import asyncio
+import os
+import struct
+from typing import Iterator, Optional
+import msgspec
+from loguru import logger
+from src.model import FsyncPolicy
+
+RECORD_HEADER = struct.Struct('>I')
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT_FILE = 'checkpoint'
+
+
+def fsync_descriptor(fd: int):
+    # closed by the thread that syncs it, also when the task that waits for it is cancelled
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    def __init__(self, directory: str = 'journal', segment_size: int = 64 * 1024 * 1024, fsync_policy: FsyncPolicy = FsyncPolicy.INTERVAL, fsync_interval: float = 1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.encoder = msgspec.msgpack.Encoder()
+
+        segments = self.list_segments()
+        # a new segment on every start, so a torn record at the end of the previous one is never appended to
+        self.segment = segments[-1] + 1 if segments else 0
+        self.file = open(self.segment_path(self.segment), 'ab')
+        self.segment_bytes = 0
+        self.dirty = False
+        self.fsync_task: Optional[asyncio.Task] = None
+
+        self.records_appended = 0
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'{segment:020d}{SEGMENT_SUFFIX}')
+
+    def list_segments(self) -> list[int]:
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def append(self, table: str, row: tuple):
+        payload = self.encoder.encode((table, row))
+        self.file.write(RECORD_HEADER.pack(len(payload)))
+        self.file.write(payload)
+
+        self.segment_bytes += RECORD_HEADER.size + len(payload)
+        self.records_appended += 1
+        self.dirty = True
+
+        if self.fsync_policy == FsyncPolicy.ALWAYS:
+            self.sync()
+
+        if self.segment_bytes >= self.segment_size:
+            self.roll()
+
+    def roll(self):
+        self.sync()
+        self.file.close()
+        self.segment += 1
+        self.file = open(self.segment_path(self.segment), 'ab')
+        self.segment_bytes = 0
+
+    def flush(self):
+        self.file.flush()
+
+    def sync(self):
+        self.file.flush()
+        if self.fsync_policy != FsyncPolicy.NEVER:
+            os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def start(self):
+        if self.fsync_policy == FsyncPolicy.INTERVAL and self.fsync_task is None:
+            self.fsync_task = asyncio.create_task(self.run_fsync())
+
+    async def run_fsync(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            if not self.dirty:
+                continue
+
+            # the thread syncs a duplicate of the descriptor, roll and close can close the file meanwhile, records
+            # appended while it runs keep the journal dirty for the next round
+            appended, segment = self.records_appended, self.segment
+            try:
+                self.file.flush()
+                await asyncio.to_thread(fsync_descriptor, os.dup(self.file.fileno()))
+            except OSError as e:
+                logger.error(f'Failed to fsync journal segment {segment}: {e}')
+                continue
+
+            if self.records_appended == appended:
+                self.dirty = False
+
+    def load_checkpoint(self) -> tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE), 'rb') as file:
+                return msgspec.msgpack.decode(file.read())
+        except FileNotFoundError:
+            segments = self.list_segments()
+            return (segments[0] if segments else self.segment), 0
+
+    def commit(self, position: tuple[int, int]):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(msgspec.msgpack.encode(position))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+
+        for segment in self.list_segments():
+            if segment < position[0]:
+                os.remove(self.segment_path(segment))
+
+    def read(self, max_records: int) -> tuple[list[tuple[str, list]], tuple[int, int]]:
+        # returns up to max_records records after the checkpoint together with the position to commit once they are stored
+        self.flush()
+        return self.read_segments(max_records=max_records, last_segment=self.segment)
+
+    def read_segments(self, max_records: int, last_segment: int) -> tuple[list[tuple[str, list]], tuple[int, int]]:
+        # only reads files and its own decoder, so it can run in a worker thread while the loop appends to the journal,
+        # segments before last_segment were synced and closed when they were rolled over
+        decoder = msgspec.msgpack.Decoder()
+        segment, offset = self.load_checkpoint()
+        records = []
+
+        while len(records) < max_records and segment <= last_segment:
+            try:
+                with open(self.segment_path(segment), 'rb') as file:
+                    file.seek(offset)
+                    while len(records) < max_records:
+                        header = file.read(RECORD_HEADER.size)
+                        if len(header) < RECORD_HEADER.size:
+                            break
+                        payload = file.read(RECORD_HEADER.unpack(header)[0])
+                        if len(payload) < RECORD_HEADER.unpack(header)[0]:
+                            break
+                        records.append(decoder.decode(payload))
+                        offset = file.tell()
+            except FileNotFoundError:
+                pass
+
+            if len(records) >= max_records or segment == last_segment:
+                break
+
+            # anything left in an older segment is a record torn by a crash
+            segment, offset = segment + 1, 0
+
+        return records, (segment, offset)
+
+    def close(self):
+        if self.fsync_task is not None:
+            self.fsync_task.cancel()
+            self.fsync_task = None
+        self.sync()
+        self.file.close()
+
+    def get_stats(self) -> dict:
+        segment, offset = self.load_checkpoint()
+        return {
+            'appended': self.records_appended,
+            'segments': len(self.list_segments()),
+            'replay_segment': segment,
+            'replay_offset': offset
+        }
+
+
+def read_records(directory: str) -> Iterator[tuple[str, list]]:
+    # every complete record of every segment from the beginning, ignoring the checkpoint and without opening a new segment
+    decoder = msgspec.msgpack.Decoder()
+    segments = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+    for name in segments:
+        with open(os.path.join(directory, name), 'rb') as file:
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                size = RECORD_HEADER.unpack(header)[0]
+                payload = file.read(size)
+                if len(payload) < size:
+                    break
+                yield decoder.decode(payload)
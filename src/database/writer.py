@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Optional
+import msgspec
+from loguru import logger
+from src.model import OverflowPolicy
+from src.monitoring.latency import stage_timers
+
+
+class TableWriter:
+    def __init__(self, table: str, columns: list[str], max_buffer: int = 10_000, batch_size: int = 500, flush_interval: float = 1.0, overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, spill_dir: str = 'spill'):
+        self.table = table
+        self.columns = columns
+        self.query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = os.path.join(spill_dir, f'{table}.jsonl')
+
+        self.buffer: deque[tuple] = deque()
+        self.pool = None
+        self.flush_requested = asyncio.Event()
+        self.space_available = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_spilled = 0
+        self.failed_flushes = 0
+
+    def start(self, pool):
+        self.pool = pool
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def put(self, row: tuple):
+        while len(self.buffer) >= self.max_buffer:
+            # blocking waits for the flush task, without a pool nothing empties the buffer and the oldest rows are dropped
+            if self.overflow_policy == OverflowPolicy.DROP_OLDEST or self.overflow_policy == OverflowPolicy.BLOCK and (self.pool is None or self.task is None):
+                self.buffer.popleft()
+                self.rows_dropped += 1
+            elif self.overflow_policy == OverflowPolicy.SPILL:
+                self.spill([row])
+                return
+            else:
+                self.space_available.clear()
+                self.flush_requested.set()
+                await self.space_available.wait()
+
+        self.buffer.append(row)
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush_requested.set()
+
+    def spill(self, rows: list[tuple]):
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, 'ab') as file:
+            for row in rows:
+                file.write(msgspec.json.encode(row) + b'\n')
+        self.rows_spilled += len(rows)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+
+            try:
+                await self.flush()
+                if not self.buffer and os.path.exists(self.spill_path):
+                    await self.replay_spill()
+            except Exception as e:
+                logger.error(f"Failed to flush {self.table}: {e}")
+
+    async def write(self, rows: list):
+        started = time.perf_counter_ns()
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.executemany(self.query, rows)
+        stage_timers.record('db_write', time.perf_counter_ns() - started)
+        self.rows_written += len(rows)
+
+    async def flush(self):
+        if self.pool is None:
+            return
+
+        async with self.lock:
+            while self.buffer:
+                rows = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+
+                try:
+                    await self.write(rows)
+                except BaseException:
+                    self.failed_flushes += 1
+                    # keep the batch for the next flush, rows pushed over the limit go through the overflow policy
+                    self.buffer.extendleft(reversed(rows))
+                    excess = len(self.buffer) - self.max_buffer
+                    if excess > 0 and self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                        for _ in range(excess):
+                            self.buffer.popleft()
+                        self.rows_dropped += excess
+                    elif excess > 0 and self.overflow_policy == OverflowPolicy.SPILL:
+                        self.spill(list(reversed([self.buffer.pop() for _ in range(excess)])))
+                    raise
+
+                self.space_available.set()
+
+    async def replay_spill(self):
+        replay_path = self.spill_path + '.replay'
+        if not os.path.exists(replay_path):
+            os.replace(self.spill_path, replay_path)
+
+        with open(replay_path, 'rb') as file:
+            rows = [msgspec.json.decode(line) for line in file if line.strip()]
+
+        async with self.lock:
+            for i in range(0, len(rows), self.batch_size):
+                await self.write(rows[i:i + self.batch_size])
+
+        os.remove(replay_path)
+        logger.info(f"Replayed {len(rows)} spilled rows into {self.table}")
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            # puts blocked on a full buffer go on without the flush task
+            self.space_available.set()
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush {self.table} on shutdown: {e}")
+            if self.overflow_policy == OverflowPolicy.SPILL:
+                self.spill(list(self.buffer))
+                self.buffer.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            'buffered': len(self.buffer),
+            'written': self.rows_written,
+            'dropped': self.rows_dropped,
+            'spilled': self.rows_spilled,
+            'failed_flushes': self.failed_flushes
+        }
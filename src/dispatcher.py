@@ -0,0 +1,84 @@
+import asyncio
+import time
+from loguru import logger
+from src.model import QueueEvent, QueueTick, EventType
+from src.monitoring.latency import stage_timers
+
+
+class EventDispatcher:
+    def __init__(self, queue: asyncio.Queue, clock=time.perf_counter):
+        self.queue = queue
+        self.clock = clock
+
+        self.events_received = 0
+        self.events_merged = 0
+        self.ticks = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    async def put(self, event: QueueEvent):
+        event.created_at = self.clock()
+        await self.queue.put(event)
+
+    async def next_tick(self) -> QueueTick:
+        events = [await self.queue.get()]
+
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+        self.queue_depth = len(events)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        self.events_received += len(events)
+
+        tick = QueueTick(size=len(events))
+        now = self.clock()
+
+        for event in events:
+            if not event or event.type is None:
+                logger.warning(f'Skipping invalid event: {event}')
+                continue
+
+            stage_timers.record('queue_wait', int((now - event.created_at) * 1e9))
+
+            if tick.created_at == 0.0 or event.created_at < tick.created_at:
+                tick.created_at = event.created_at
+
+            if event.type == EventType.FILLED_ORDER:
+                tick.filled_orders.append(event)
+            elif event.type == EventType.MEXC_ORDERBOOK_UPDATE:
+                if tick.mexc_update is not None:
+                    self.events_merged += 1
+                tick.mexc_update = event
+            elif event.type == EventType.KUCOIN_ORDERBOOK_UPDATE:
+                if tick.kucoin_update is not None:
+                    self.events_merged += 1
+                tick.kucoin_update = event
+
+        return tick
+
+    def record_decision(self, tick: QueueTick):
+        latency = self.clock() - tick.created_at
+        stage_timers.record('decision', int(latency * 1e9))
+
+        self.ticks += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    def get_stats(self) -> dict:
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'events_received': self.events_received,
+            'events_merged': self.events_merged,
+            'ticks': self.ticks,
+            'last_latency_ms': self.last_latency * 1000,
+            'max_latency_ms': self.max_latency * 1000,
+            'avg_latency_ms': self.total_latency / self.ticks * 1000 if self.ticks else 0.0
+        }
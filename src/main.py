@@ -1,17 +1,21 @@
 import asyncio
 import os
 from dotenv import load_dotenv
-from decimal import Decimal, getcontext
-from datetime import datetime
-from src.crypto.mexc.client import MexcClient
-from src.model import CryptoCurrency, DatabaseMarketState, QueueEvent, EventType, EXPECTED_MARKET_DEPTH
+from decimal import getcontext
+from src.crypto.mexc.client import MexcClient, MEXC_WS_URL, MEXC_REST_URL
+from src.model import OverflowPolicy, FsyncPolicy, Symbol, DEFAULT_SYMBOL, FIXED_POINT
 from src.crypto.kucoin.client import KucoinClient
-from src.crypto.market.tracking import manage_orders, check_market_depth, reset_orders
-from src.crypto.market.calculations import calculate_market_depth, calculate_fair_price, calculate_market_spread
+from src.crypto.market.registry import SymbolRegistry, log_market_state, parse_symbols
 from loguru import logger
 from src.database.client import DatabaseClient
+from src.database.journal import Journal
+from src.database.archive import ArchiveWriter, PRIVATE_LOG_STREAM
+from src.crypto.market.book import SIZE_SCALE
+from src.crypto.kucoin.client import KUCOIN_TICK_SIZE, KUCOIN_REST_URL
+from src.monitoring.loop_lag import LoopLagMonitor
+from src.monitoring.latency import stage_timers
+from src.monitoring.metrics import MetricsServer
 import signal
-import traceback
 from typing import Optional
 
 load_dotenv()
@@ -28,32 +32,20 @@ api_passphrase_kucoin = os.getenv("API_PASSPHRASE_KUCOIN")
 mysql_host = os.getenv("MYSQL_HOST")
 mysql_user = os.getenv("MYSQL_USER")
 mysql_password = os.getenv("MYSQL_PASSWORD")
+db_overflow_policy = OverflowPolicy(os.getenv("DB_OVERFLOW_POLICY", OverflowPolicy.DROP_OLDEST.value))
+db_journal_dir = os.getenv("DB_JOURNAL_DIR")
+db_journal_fsync_policy = FsyncPolicy(os.getenv("DB_JOURNAL_FSYNC_POLICY", FsyncPolicy.INTERVAL.value))
+archive_dir = os.getenv("ARCHIVE_DIR")
 
-event_queue: Optional[asyncio.Queue[QueueEvent]] = None
+mexc_ws_url = os.getenv("MEXC_WS_URL", MEXC_WS_URL)
+mexc_rest_url = os.getenv("MEXC_REST_URL", MEXC_REST_URL)
+kucoin_rest_url = os.getenv("KUCOIN_REST_URL", KUCOIN_REST_URL)
 
-async def add_to_event_queue(event: QueueEvent):
-    await event_queue.put(event)
-
-
-async def read_from_queue():
-    while True:
-        event = await event_queue.get()
-
-        if not event or event.type is None:
-            logger.warning(f'Skipping invalid event: {event}')
-            continue
-
-        try:
-            if event.type == EventType.KUCOIN_ORDERBOOK_UPDATE:
-                await manage_orders(mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client)
-            elif event.type == EventType.MEXC_ORDERBOOK_UPDATE:
-                await manage_orders(mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client)
-                await check_market_depth(mexc_client=mexc_client, database_client=database_client, percent=Decimal(2), expected_market_depth=EXPECTED_MARKET_DEPTH)
-            elif event.type == EventType.FILLED_ORDER:
-                ...
-        except Exception as e:
-            logger.error(f"error type: {type(e)}, details: {e}")
-            logger.error(traceback.format_exc())
+loop_lag_threshold_ms = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "50"))
+metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_port = os.getenv("METRICS_PORT")
+fixed_point = os.getenv("FIXED_POINT", str(FIXED_POINT)).lower() in ('1', 'true')
+symbols = parse_symbols(os.getenv("SYMBOLS", DEFAULT_SYMBOL.pair))
 
 
 def handle_exit(sig, frame):
@@ -63,91 +55,77 @@ def handle_exit(sig, frame):
 async def cancel_orders_and_exit():
     logger.info("Cancelling all orders on MEXC...")
     try:
+        if metrics_server is not None:
+            await metrics_server.stop()
         await database_client.close()
-        await mexc_client.cancel_all_orders(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT)
+        for market in registry:
+            await market.mexc_client.cancel_all_orders()
+        await mexc_client.close()
+        await kucoin_client.close()
+        for archive in [archive for symbol_archives in archives for archive in symbol_archives] + [private_log]:
+            if archive is not None:
+                archive.close()
     except Exception as e:
         logger.error(f"Error cancelling orders: {e}")
     asyncio.get_event_loop().stop()
 
 signal.signal(signal.SIGINT, handle_exit)
 
-database_client = DatabaseClient(host=mysql_host, user=mysql_user, password=mysql_password)
-mexc_client = MexcClient(api_key=api_key_mexc, api_secret=api_secret_mexc, add_to_event_queue=add_to_event_queue, database_client=database_client)
-kucoin_client = KucoinClient(api_key=api_key_kucoin, api_secret=api_secret_kucoin, api_passphrase=api_passphrase_kucoin, add_to_event_queue=add_to_event_queue, database_client=database_client)
+journal = Journal(directory=db_journal_dir, fsync_policy=db_journal_fsync_policy) if db_journal_dir else None
+database_client = DatabaseClient(host=mysql_host, user=mysql_user, password=mysql_password, overflow_policy=db_overflow_policy, journal=journal)
+private_log = Journal(directory=os.path.join(archive_dir, PRIVATE_LOG_STREAM)) if archive_dir else None
+
+def create_archives(directory: Optional[str], symbol: Symbol) -> tuple:
+    if directory is None:
+        return None, None, None
+    return (
+        ArchiveWriter(directory=directory, stream='mexc', tick_size=symbol.tick_size, size_scale=SIZE_SCALE),
+        ArchiveWriter(directory=directory, stream='mexc_trades', tick_size=symbol.tick_size, size_scale=SIZE_SCALE),
+        ArchiveWriter(directory=directory, stream='kucoin', tick_size=KUCOIN_TICK_SIZE, size_scale=SIZE_SCALE)
+    )
+
+# the first symbol is archived in ARCHIVE_DIR itself, every other one in a directory named after it
+archives = [create_archives(directory=archive_dir if i == 0 or not archive_dir else os.path.join(archive_dir, symbol.name), symbol=symbol) for i, symbol in enumerate(symbols)]
+
+mexc_client = MexcClient(api_key=api_key_mexc, api_secret=api_secret_mexc, database_client=database_client, archive=archives[0][0], trade_archive=archives[0][1], private_log=private_log, ws_base_url=mexc_ws_url, rest_base_url=mexc_rest_url, symbol=symbols[0])
+kucoin_client = KucoinClient(api_key=api_key_kucoin, api_secret=api_secret_kucoin, api_passphrase=api_passphrase_kucoin, database_client=database_client, archive=archives[0][2], rest_base_url=kucoin_rest_url, fixed_point=fixed_point, symbol=symbols[0])
+registry = SymbolRegistry(mexc_client=mexc_client, kucoin_client=kucoin_client)
+for symbol, (mexc_archive, mexc_trade_archive, kucoin_archive) in zip(symbols, archives):
+    registry.add(symbol=symbol, mexc_archive=mexc_archive, mexc_trade_archive=mexc_trade_archive, kucoin_archive=kucoin_archive)
+loop_lag_monitor = LoopLagMonitor(threshold_ms=loop_lag_threshold_ms)
+metrics_server = MetricsServer(collectors=[registry.get_metrics, database_client.get_metrics, loop_lag_monitor.get_metrics], host=metrics_host, port=int(metrics_port)) if metrics_port else None
 
 async def main():
-    await asyncio.sleep(30)
+    asyncio.create_task(loop_lag_monitor.run())
 
-    global event_queue
-    event_queue = asyncio.Queue()
+    await asyncio.sleep(30)
 
-    await mexc_client.cancel_all_orders(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT)
+    for market in registry:
+        await market.mexc_client.cancel_all_orders()
     await database_client.connect()
+    if private_log is not None:
+        private_log.start()
 
     listen_key = await mexc_client.create_listen_key()
     asyncio.create_task(mexc_client.extend_listen_key(listen_key=listen_key))
-    asyncio.create_task(mexc_client.track_balance(listen_key=listen_key))
-    asyncio.create_task(mexc_client.track_active_orders(listen_key=listen_key))
-
-    asyncio.create_task(mexc_client.update_orderbook(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT))
-
-    asyncio.create_task(kucoin_client.update_orderbook(first_currency=CryptoCurrency.RMV, second_currency=CryptoCurrency.USDT))
-
-    asyncio.create_task(read_from_queue())
-    asyncio.create_task(reset_orders(mexc_client=mexc_client))
+    asyncio.create_task(mexc_client.track_private(listen_key=listen_key))
 
-    mexc_balance = mexc_client.get_balance()
-    active_orders = mexc_client.get_active_orders()
+    registry.start(database_client=database_client, fixed_point=fixed_point)
+    if metrics_server is not None:
+        await metrics_server.start()
 
     while True:
         await asyncio.sleep(10)
-        try:
-            logger.info('start')
-
-            market_depth = calculate_market_depth(client=mexc_client, percent=Decimal('2'))
-            fair_price, real_fair_price = calculate_fair_price(mexc_client=mexc_client, kucoin_client=kucoin_client, active_asks=[], active_bids=[], percent=Decimal('2'))
-            market_spread = calculate_market_spread(client=mexc_client)
-
-            logger.info(f"market depth: {market_depth}")
-            logger.info(f"fair price: {fair_price}")
-            logger.info(f"Real fair price: {real_fair_price}")
-            logger.info(f"market spread: {market_spread}")
-            logger.info(f'len of active asks: {len(active_orders.asks)}')
-            logger.info(f'asks: {active_orders.asks}')
-            logger.info(f'len of active bids: {len(active_orders.bids)}')
-            logger.info(f'bids: {active_orders.bids}')
-
-            for i in range(1, len(active_orders.asks)):
-                if active_orders.asks[i].price == active_orders.asks[i - 1].price:
-                    logger.error('Something is wrong')
-
-            for i in range(1, len(active_orders.bids)):
-                if active_orders.bids[i].price == active_orders.bids[i - 1].price:
-                    logger.error('Something is wrong')
-
-            if fair_price is None:
-                print()
-                continue
-
-            logger.info(f"usdt free balance: {mexc_balance['USDT']['free']}")
-            logger.info(f"usdt locked balance: {mexc_balance['USDT']['locked']}")
-            logger.info(f"usdt full balance: {mexc_balance['USDT']['free'] + mexc_balance['USDT']['locked']}")
-
-            logger.info(f"rmv free balance {mexc_balance['RMV']['free']}, approximated usd value: {mexc_balance['RMV']['free'] * fair_price}")
-            logger.info(f"rmv locked balance: {mexc_balance['RMV']['locked']}, approximate usd value: {mexc_balance['RMV']['locked'] * fair_price}")
-            logger.info(f"rmv full balance: {mexc_balance['RMV']['free'] + mexc_balance['RMV']['locked']}, approximated usd value: {(mexc_balance['RMV']['free'] + mexc_balance['RMV']['locked']) * fair_price}")
-
-            full_account_balance = mexc_balance['USDT']['free'] + mexc_balance['USDT']['locked'] + (mexc_balance['RMV']['free'] + mexc_balance['RMV']['locked']) * fair_price
-            logger.info(f"full_account_balance: {full_account_balance}")
-
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"event loop lag: {loop_lag_monitor.get_stats()}")
+        logger.info(f"database writers: {database_client.get_stats()}")
+        logger.info(f"stage latency: {stage_timers.dump()}")
 
-            market_state = DatabaseMarketState(market_depth=market_depth, fair_price=fair_price, market_spread=market_spread, usdt_balance=mexc_balance['USDT']['free'] + mexc_balance['USDT']['locked'], rmv_balance=mexc_balance['RMV']['free'] + mexc_balance['RMV']['locked'], rmv_value=mexc_balance['RMV']['free'] * fair_price + mexc_balance['RMV']['locked'] * fair_price, timestamp=timestamp)
-            await database_client.record_market_state(market_state=market_state)
+        for market in registry:
+            try:
+                await log_market_state(market=market, database_client=database_client, record=market.symbol == symbols[0])
+            except Exception as e:
+                logger.error(e)
 
-            logger.info('end\n')
-        except Exception as e:
-            logger.error(e)
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,488 @@
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import time
+from dataclasses import fields
+from decimal import Decimal
+from typing import Optional
+from aiohttp import web, WSMsgType, WSCloseCode
+from loguru import logger
+from src.model import MockExchangeConfig, OrderAction, MEXC_TICK_SIZE
+from src.crypto.mexc.client import MEXC_DEPTH_TOPIC, MEXC_DEALS_TOPIC
+from src.crypto.mexc.websocket_proto import PushDataV3ApiWrapper_pb2
+from src.crypto.market.book import price_to_ticks
+
+MEXC_ORDERS_TOPIC = 'spot@private.orders.v3.api.pb'
+MEXC_PRIVATE_DEALS_TOPIC = 'spot@private.deals.v3.api.pb'
+MEXC_ACCOUNT_TOPIC = 'spot@private.account.v3.api.pb'
+KUCOIN_DEPTH_TOPIC = '/spotMarket/level2Depth50:{symbol}'
+KUCOIN_TICKS_PER_MEXC_TICK = 1000
+KUCOIN_TICK_SIZE = MEXC_TICK_SIZE / KUCOIN_TICKS_PER_MEXC_TICK
+
+ORDER_STATUS_NEW = 1
+ORDER_STATUS_FILLED = 2
+ORDER_STATUS_CANCELED = 4
+
+
+class MockExchange:
+    # a single aiohttp server standing in for the MEXC REST and websocket APIs and the KuCoin public depth stream
+    def __init__(self, config: Optional[MockExchangeConfig] = None):
+        self.config = config or MockExchangeConfig()
+        self.random = random.Random(self.config.seed)
+
+        self.mid = self.config.mid_price_ticks
+        self.asks: dict[int, int] = {self.mid + 1 + i: self.random.randint(1_000, 200_000) for i in range(self.config.book_levels)}
+        self.bids: dict[int, int] = {self.mid - i: self.random.randint(1_000, 200_000) for i in range(self.config.book_levels) if self.mid - i > 0}
+        self.version = 1
+
+        self.balances = {
+            'RMV': {'free': self.config.rmv_balance, 'locked': Decimal('0')},
+            'USDT': {'free': self.config.usdt_balance, 'locked': Decimal('0')}
+        }
+        self.orders: dict[str, OrderAction] = {}
+        self.order_symbols: dict[str, str] = {}
+        self.listen_keys: set[str] = set()
+        self.subscribers: dict[str, set[web.WebSocketResponse]] = {}
+        self.sockets: set[web.WebSocketResponse] = set()
+
+        self.app = web.Application(middlewares=[self.inject_faults])
+        self.app.add_routes([
+            web.get('/ws', self.mexc_ws),
+            web.get('/kucoin/ws', self.kucoin_ws),
+            web.post('/api/v3/userDataStream', self.create_listen_key),
+            web.put('/api/v3/userDataStream', self.extend_listen_key),
+            web.get('/api/v3/depth', self.get_depth),
+            web.get('/api/v3/account', self.get_account),
+            web.post('/api/v3/order', self.place_order),
+            web.post('/api/v3/batchOrders', self.place_batch_orders),
+            web.delete('/api/v3/order', self.cancel_order),
+            web.delete('/api/v3/openOrders', self.cancel_all_orders),
+            web.post('/api/v1/bullet-public', self.bullet_public)
+        ])
+        self.runner: Optional[web.AppRunner] = None
+        self.tasks: list[asyncio.Task] = []
+
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.disconnects = 0
+        self.orders_placed = 0
+        self.orders_cancelled = 0
+        self.orders_filled = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+        self.tasks = [asyncio.create_task(self.run_depth()), asyncio.create_task(self.run_kucoin())]
+        if self.config.disconnect_interval > 0:
+            self.tasks.append(asyncio.create_task(self.run_disconnects()))
+
+        host, port = self.runner.addresses[0][:2]
+        return f'{host}:{port}'
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        for ws in list(self.sockets):
+            await ws.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    @web.middleware
+    async def inject_faults(self, request: web.Request, handler):
+        if request.path.endswith('/ws'):
+            return await handler(request)
+
+        self.requests += 1
+        latency = self.config.latency_ms + self.random.uniform(-self.config.latency_jitter_ms, self.config.latency_jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+        if self.random.random() < self.config.error_rate:
+            self.rate_limited += 1
+            return web.json_response({'code': 429, 'msg': 'Too Many Requests'}, status=429)
+
+        return await handler(request)
+
+    def price(self, tick: int) -> str:
+        return str(tick * MEXC_TICK_SIZE)
+
+    def step(self) -> tuple[dict[int, int], dict[int, int], list[tuple[int, int, int]]]:
+        # random walk of the mid price, a few level updates and sometimes a trade at the top of the book,
+        # returns the changed levels with 0 for removed ones and the trades as (tick, quantity, trade type)
+        asks, bids = {}, {}
+
+        # the mid price moves at the same pace whatever the message rate is
+        if self.random.random() < self.config.mid_moves_per_second / self.config.depth_rate:
+            self.mid = max(1, self.mid + self.random.choice((-1, 1)))
+        for tick in [tick for tick in self.asks if tick <= self.mid]:
+            del self.asks[tick]
+            asks[tick] = 0
+        for tick in [tick for tick in self.bids if tick > self.mid]:
+            del self.bids[tick]
+            bids[tick] = 0
+
+        for _ in range(self.config.diff_levels):
+            offset = self.random.randrange(self.config.book_levels)
+            size = 0 if self.random.random() < 0.2 else self.random.randint(1_000, 200_000)
+
+            if self.random.random() < 0.5:
+                tick, book, changes = self.mid + 1 + offset, self.asks, asks
+            else:
+                tick, book, changes = self.mid - offset, self.bids, bids
+                if tick < 1:
+                    continue
+
+            if size:
+                book[tick] = size
+            else:
+                book.pop(tick, None)
+            changes[tick] = size
+
+        trades = []
+        if self.random.random() < self.config.trades_per_second / self.config.depth_rate:
+            buy = self.random.random() < 0.5
+            book, changes = (self.asks, asks) if buy else (self.bids, bids)
+            if book:
+                tick = min(book) if buy else max(book)
+                quantity = self.random.randint(1, book[tick])
+                book[tick] -= quantity
+                if book[tick] == 0:
+                    del book[tick]
+                changes[tick] = book.get(tick, 0)
+                trades.append((tick, quantity, 1 if buy else 2))
+
+        self.version += 1
+        return asks, bids, trades
+
+    async def publish(self, topic: str, wrapper: PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper):
+        wrapper.channel = topic
+        wrapper.sendTime = int(time.time() * 1000)
+        payload = wrapper.SerializeToString()
+
+        for ws in list(self.subscribers.get(topic, ())):
+            try:
+                await ws.send_bytes(payload)
+                self.messages_sent += 1
+            except ConnectionError:
+                self.unsubscribe(ws)
+
+    async def publish_json(self, topic: str, message: dict):
+        payload = json.dumps(message)
+
+        for ws in list(self.subscribers.get(topic, ())):
+            try:
+                await ws.send_str(payload)
+                self.messages_sent += 1
+            except ConnectionError:
+                self.unsubscribe(ws)
+
+    def base_token(self, symbol: str) -> str:
+        # every symbol is quoted in USDT, base tokens other than RMV start with the same balance
+        token = symbol[:-len('USDT')]
+        if token not in self.balances:
+            self.balances[token] = {'free': self.config.rmv_balance, 'locked': Decimal('0')}
+        return token
+
+    async def publish_order(self, order: OrderAction, status: int):
+        wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper(symbol=self.order_symbols.get(order.order_id, self.config.symbol))
+        pushed = wrapper.privateOrders
+        pushed.id, pushed.price, pushed.quantity = order.order_id, str(order.price), str(order.size)
+        pushed.tradeType = 1 if order.side == 'buy' else 2
+        pushed.status = status
+        pushed.remainQuantity = '0' if status == ORDER_STATUS_FILLED else str(order.size)
+        pushed.cumulativeQuantity = str(order.size) if status == ORDER_STATUS_FILLED else '0'
+        await self.publish(MEXC_ORDERS_TOPIC, wrapper)
+
+    async def publish_deal(self, order: OrderAction):
+        # every fill is a single maker trade, MEXC charges no maker fee on spot
+        wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper(symbol=self.order_symbols[order.order_id])
+        deal = wrapper.privateDeals
+        deal.orderId, deal.tradeId = order.order_id, secrets.token_hex(12)
+        deal.price, deal.quantity, deal.amount = str(order.price), str(order.size), str(order.size * order.price)
+        deal.tradeType = 1 if order.side == 'buy' else 2
+        deal.isMaker = True
+        deal.feeAmount, deal.feeCurrency = '0', 'USDT'
+        deal.time = int(time.time() * 1000)
+        await self.publish(MEXC_PRIVATE_DEALS_TOPIC, wrapper)
+
+    async def publish_account(self, token: str):
+        wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper()
+        account = wrapper.privateAccount
+        account.vcoinName = token
+        account.balanceAmount = str(self.balances[token]['free'])
+        account.frozenAmount = str(self.balances[token]['locked'])
+        await self.publish(MEXC_ACCOUNT_TOPIC, wrapper)
+
+    async def run_depth(self):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+
+        while True:
+            # a late iteration is not made up by sleeping less, the stream catches up at full speed instead
+            next_at += 1 / self.config.depth_rate
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            asks, bids, trades = self.step()
+            await self.fill_orders()
+
+            for topic in [topic for topic in self.subscribers if topic.startswith(MEXC_DEALS_TOPIC.format(symbol='')) and trades]:
+                wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper(symbol=topic.rsplit('@', 1)[-1])
+                wrapper.publicAggreDeals.eventType = topic.split('@100ms')[0]
+                for tick, quantity, trade_type in trades:
+                    deal = wrapper.publicAggreDeals.deals.add()
+                    deal.price, deal.quantity, deal.tradeType, deal.time = self.price(tick), str(quantity), trade_type, int(time.time() * 1000)
+                await self.publish(topic, wrapper)
+
+            if self.random.random() < self.config.drop_rate:
+                self.messages_dropped += 1
+                continue
+
+            for topic in [topic for topic in self.subscribers if topic.startswith(MEXC_DEPTH_TOPIC.format(symbol=''))]:
+                wrapper = PushDataV3ApiWrapper_pb2.PushDataV3ApiWrapper(symbol=topic.rsplit('@', 1)[-1])
+                depth = wrapper.publicAggreDepths
+                depth.fromVersion = depth.toVersion = str(self.version)
+                for tick, size in asks.items():
+                    level = depth.asks.add()
+                    level.price, level.quantity = self.price(tick), str(size)
+                for tick, size in bids.items():
+                    level = depth.bids.add()
+                    level.price, level.quantity = self.price(tick), str(size)
+                await self.publish(topic, wrapper)
+
+    async def run_kucoin(self):
+        while True:
+            await asyncio.sleep(1 / self.config.kucoin_rate)
+
+            mid = self.mid * KUCOIN_TICKS_PER_MEXC_TICK + self.random.randint(-200, 200)
+            asks = [[str((mid + 50 + i * 30) * KUCOIN_TICK_SIZE), str(self.random.randint(1_000, 100_000))] for i in range(50)]
+            bids = [[str((mid - 50 - i * 30) * KUCOIN_TICK_SIZE), str(self.random.randint(1_000, 100_000))] for i in range(50)]
+
+            for topic in [topic for topic in self.subscribers if topic.startswith(KUCOIN_DEPTH_TOPIC.format(symbol=''))]:
+                await self.publish_json(topic, {'type': 'message', 'topic': topic, 'subject': 'level2', 'data': {'asks': asks, 'bids': bids, 'timestamp': int(time.time() * 1000)}})
+
+    async def run_disconnects(self):
+        while True:
+            await asyncio.sleep(self.config.disconnect_interval)
+            logger.info(f'Mock exchange: disconnecting {len(self.sockets)} websockets')
+            for ws in list(self.sockets):
+                self.disconnects += 1
+                await ws.close(code=WSCloseCode.GOING_AWAY, message=b'mock disconnect')
+
+    def unsubscribe(self, ws: web.WebSocketResponse):
+        self.sockets.discard(ws)
+        for subscribers in self.subscribers.values():
+            subscribers.discard(ws)
+
+    async def mexc_ws(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        listen_key = request.query.get('listenKey')
+        self.sockets.add(ws)
+
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+
+                data = json.loads(message.data)
+                if data.get('method') == 'SUBSCRIPTION':
+                    for topic in data.get('params', []):
+                        if topic.startswith('spot@private') and listen_key not in self.listen_keys:
+                            await ws.send_str(json.dumps({'id': data.get('id', 0), 'code': 0, 'msg': f'Not Subscribed successfully! [{topic}]. Reason: Blocked!'}))
+                            continue
+                        if topic.startswith(MEXC_DEPTH_TOPIC.format(symbol='')):
+                            self.base_token(topic.rsplit('@', 1)[-1])
+                        self.subscribers.setdefault(topic, set()).add(ws)
+                        await ws.send_str(json.dumps({'id': data.get('id', 0), 'code': 0, 'msg': topic}))
+                elif data.get('method') == 'PING':
+                    await ws.send_str(json.dumps({'id': data.get('id', 0), 'code': 0, 'msg': 'PONG'}))
+        finally:
+            self.unsubscribe(ws)
+
+        return ws
+
+    async def kucoin_ws(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        await ws.send_str(json.dumps({'id': secrets.token_hex(8), 'type': 'welcome'}))
+
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+
+                data = json.loads(message.data)
+                if data.get('type') == 'subscribe':
+                    # one topic can name several symbols separated by commas
+                    prefix, _, symbols = data['topic'].partition(':')
+                    for symbol in symbols.split(','):
+                        self.subscribers.setdefault(f'{prefix}:{symbol}', set()).add(ws)
+                    await ws.send_str(json.dumps({'id': data.get('id'), 'type': 'ack'}))
+                elif data.get('type') == 'ping':
+                    await ws.send_str(json.dumps({'id': data.get('id'), 'type': 'pong'}))
+        finally:
+            self.unsubscribe(ws)
+
+        return ws
+
+    async def bullet_public(self, request: web.Request):
+        return web.json_response({'code': '200000', 'data': {'token': secrets.token_hex(16), 'instanceServers': [{'endpoint': f'ws://{request.host}/kucoin/ws', 'protocol': 'websocket', 'pingInterval': 18000, 'pingTimeout': 10000}]}})
+
+    async def create_listen_key(self, request: web.Request):
+        listen_key = secrets.token_hex(32)
+        self.listen_keys.add(listen_key)
+        return web.json_response({'listenKey': listen_key})
+
+    async def extend_listen_key(self, request: web.Request):
+        return web.json_response({'listenKey': request.query.get('listenKey')})
+
+    async def get_depth(self, request: web.Request):
+        limit = int(request.query.get('limit', 100))
+        return web.json_response({
+            'lastUpdateId': self.version,
+            'asks': [[self.price(tick), str(self.asks[tick])] for tick in sorted(self.asks)[:limit]],
+            'bids': [[self.price(tick), str(self.bids[tick])] for tick in sorted(self.bids, reverse=True)[:limit]]
+        })
+
+    async def get_account(self, request: web.Request):
+        return web.json_response({'balances': [{'asset': token, 'free': str(balance['free']), 'locked': str(balance['locked'])} for token, balance in self.balances.items()]})
+
+    def lock_funds(self, order: OrderAction, lock: bool) -> bool:
+        token, amount = ('USDT', order.size * order.price) if order.side == 'buy' else (self.base_token(self.order_symbols[order.order_id]), order.size)
+        balance = self.balances[token]
+
+        if lock:
+            if balance['free'] < amount:
+                return False
+            balance['free'] -= amount
+            balance['locked'] += amount
+        else:
+            balance['locked'] -= amount
+            balance['free'] += amount
+        return True
+
+    async def create_order(self, side: str, price: str, quantity: str, symbol: str) -> tuple[Optional[OrderAction], dict]:
+        order = OrderAction(side=side.lower(), price=Decimal(price), size=Decimal(quantity), order_id=f'C02__{secrets.token_hex(12)}')
+        self.order_symbols[order.order_id] = symbol
+
+        if not self.lock_funds(order, lock=True):
+            del self.order_symbols[order.order_id]
+            return None, {'code': 30004, 'msg': 'Insufficient position'}
+
+        self.orders[order.order_id] = order
+        self.orders_placed += 1
+
+        await self.publish_order(order, status=ORDER_STATUS_NEW)
+        await self.publish_account('USDT' if order.side == 'buy' else self.base_token(symbol))
+
+        return order, {'symbol': symbol, 'orderId': order.order_id, 'price': price, 'origQty': quantity, 'type': 'LIMIT', 'side': side.upper(), 'transactTime': int(time.time() * 1000)}
+
+    async def remove_order(self, order: OrderAction, status: int):
+        del self.orders[order.order_id]
+        self.lock_funds(order, lock=False)
+        token = self.base_token(self.order_symbols[order.order_id])
+
+        if status == ORDER_STATUS_FILLED:
+            # the locked amount was released above, the filled side is paid out of free balance
+            if order.side == 'buy':
+                self.balances['USDT']['free'] -= order.size * order.price
+                self.balances[token]['free'] += order.size
+            else:
+                self.balances[token]['free'] -= order.size
+                self.balances['USDT']['free'] += order.size * order.price
+            self.orders_filled += 1
+        else:
+            self.orders_cancelled += 1
+
+        await self.publish_order(order, status=status)
+        if status == ORDER_STATUS_FILLED:
+            await self.publish_deal(order)
+        del self.order_symbols[order.order_id]
+        for name in ('USDT', token):
+            await self.publish_account(name)
+
+    async def fill_orders(self):
+        # an order is filled as soon as the simulated mid price crosses it
+        for order in list(self.orders.values()):
+            tick = price_to_ticks(order.price)
+            if (order.side == 'sell' and tick <= self.mid) or (order.side == 'buy' and tick > self.mid):
+                await self.remove_order(order, status=ORDER_STATUS_FILLED)
+
+    async def place_order(self, request: web.Request):
+        query = request.query
+        order, response = await self.create_order(side=query['side'], price=query['price'], quantity=query['quantity'], symbol=query.get('symbol', self.config.symbol))
+        return web.json_response(response, status=200 if order is not None else 400)
+
+    async def place_batch_orders(self, request: web.Request):
+        results = []
+        for item in json.loads(request.query['batchOrders']):
+            _, response = await self.create_order(side=item['side'], price=item['price'], quantity=item['quantity'], symbol=item.get('symbol', self.config.symbol))
+            results.append(response)
+        return web.json_response(results)
+
+    async def cancel_order(self, request: web.Request):
+        order = self.orders.get(request.query.get('orderId', ''))
+        if order is None:
+            return web.json_response({'code': -2011, 'msg': 'Unknown order id.'}, status=400)
+
+        symbol = self.order_symbols[order.order_id]
+        await self.remove_order(order, status=ORDER_STATUS_CANCELED)
+        return web.json_response({'symbol': symbol, 'orderId': order.order_id, 'status': 'CANCELED'})
+
+    async def cancel_all_orders(self, request: web.Request):
+        symbol = request.query.get('symbol', self.config.symbol)
+        cancelled = [order for order in self.orders.values() if self.order_symbols[order.order_id] == symbol]
+        for order in cancelled:
+            await self.remove_order(order, status=ORDER_STATUS_CANCELED)
+        return web.json_response([{'symbol': symbol, 'orderId': order.order_id, 'status': 'CANCELED'} for order in cancelled])
+
+    def get_stats(self) -> dict:
+        return {
+            'version': self.version,
+            'messages_sent': self.messages_sent,
+            'messages_dropped': self.messages_dropped,
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'disconnects': self.disconnects,
+            'orders_placed': self.orders_placed,
+            'orders_cancelled': self.orders_cancelled,
+            'orders_filled': self.orders_filled,
+            'open_orders': len(self.orders)
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the MEXC and KuCoin APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    for field in fields(MockExchangeConfig):
+        parser.add_argument('--' + field.name.replace('_', '-'), type=type(field.default), default=field.default)
+    args = parser.parse_args()
+
+    exchange = MockExchange(MockExchangeConfig(**{field.name: getattr(args, field.name) for field in fields(MockExchangeConfig)}))
+    address = await exchange.start(host=args.host, port=args.port)
+    logger.info(f'Mock exchange listening, set MEXC_REST_URL=http://{address} MEXC_WS_URL=ws://{address}/ws KUCOIN_REST_URL=http://{address}')
+
+    try:
+        while True:
+            await asyncio.sleep(10)
+            logger.info(f'Mock exchange: {exchange.get_stats()}')
+    finally:
+        await exchange.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -2,8 +2,10 @@ from abc import abstractmethod, ABC
 from enum import Enum, auto
 from decimal import Decimal
 import msgspec
-from dataclasses import dataclass
-from typing import Any
+import aiohttp
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from src.crypto.http import create_session
 
 MEXC_TICK_SIZE = Decimal('0.00001')
 
@@ -12,10 +14,51 @@ INVENTORY_LIMIT = Decimal('200_000')
 
 EXPECTED_MARKET_DEPTH = Decimal(1250)
 
+FAIR_PRICE_LEVELS = 10
+
+HALF_SPREAD = Decimal('0.00002')
+FIXED_POINT = False
+
+MAX_ORDERS_IN_FLIGHT = 10
+USE_BATCH_ORDERS = False
+
 class CryptoCurrency(Enum):
     RMV = "RMV"
     USDT = "USDT"
 
+@dataclass(frozen=True)
+class Symbol:
+    # a traded pair with its quoting parameters, MEXC tick sizes are powers of ten
+    base: str
+    quote: str
+    tick_size: Decimal = MEXC_TICK_SIZE
+    levels: int = 5
+    min_order_size: int = 2_000
+    max_order_size: int = 4_000
+    half_spread: Decimal = HALF_SPREAD
+    inventory_balance: Decimal = INVENTORY_BALANCE
+    inventory_limit: Decimal = INVENTORY_LIMIT
+    expected_market_depth: Decimal = EXPECTED_MARKET_DEPTH
+
+    @property
+    def name(self) -> str:
+        # MEXC symbol
+        return self.base + self.quote
+
+    @property
+    def pair(self) -> str:
+        # KuCoin symbol and the pair column of the database
+        return f'{self.base}-{self.quote}'
+
+    @property
+    def price_decimals(self) -> int:
+        return -self.tick_size.as_tuple().exponent
+
+DEFAULT_SYMBOL = Symbol(base=CryptoCurrency.RMV.value, quote=CryptoCurrency.USDT.value)
+
+# parameters of the pairs we know, SYMBOLS=RMV-USDT,... selects the ones to run, unknown pairs get the defaults
+SYMBOLS = {symbol.pair: symbol for symbol in [DEFAULT_SYMBOL]}
+
 class OrderLevel(msgspec.Struct):
     id: str
     price: Decimal
@@ -25,17 +68,75 @@ class OrderBook(msgspec.Struct):
     asks: list[OrderLevel]
     bids: list[OrderLevel]
 
+class MarketState(msgspec.Struct, frozen=True):
+    # what a decision reads of one symbol on MEXC, none of it changes after it is handed out: book is a frozen DepthBook,
+    # balance and active_orders are replaced instead of modified, sequence grows with every change of any of them
+    sequence: int
+    book: Any
+    balance: dict
+    active_orders: OrderBook
+    own_asks: dict[int, int]
+    own_bids: dict[int, int]
+
+class MetricFamily(msgspec.Struct):
+    # one metric of the metrics endpoint, samples are (suffix, labels, value), the suffix is _bucket, _sum or _count for
+    # the samples of a histogram and empty otherwise
+    name: str
+    kind: str
+    help: str
+    samples: list[tuple[str, dict[str, str], Any]] = []
+
+class PrivateOrderUpdate(msgspec.Struct):
+    id: str
+    side: str
+    status: int
+    price: Decimal
+    quantity: Decimal
+    remain_quantity: Decimal
+    cumulative_quantity: Decimal
+
+class PrivateDeal(msgspec.Struct):
+    order_id: str
+    trade_id: str
+    side: str
+    price: Decimal
+    quantity: Decimal
+    amount: Decimal
+    is_maker: bool
+    fee_amount: Decimal
+    fee_currency: str
+    time: int
+
 class ExchangeClient(ABC):
-    def __init__(self, database_client, add_to_event_queue, api_key: str, api_secret: str):
+    def __init__(self, database_client, add_to_event_queue, api_key: str, api_secret: str, session_config: Optional[dict] = None, archive=None):
         self.orderbook = OrderBook(asks=[], bids=[])
         self.add_to_event_queue = add_to_event_queue
         self.database_client = database_client
+        self.archive = archive
         self.api_key = api_key
         self.api_secret = api_secret
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.session_config = session_config or {}
 
     def get_orderbook(self) -> OrderBook:
         return self.orderbook
 
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = create_session(**self.session_config)
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+@dataclass
+class OrderAction:
+    side: str
+    price: Decimal
+    size: Decimal
+    order_id: str = ''
+
 @dataclass
 class DatabaseOrder:
     pair: str
@@ -55,6 +156,16 @@ class DatabaseMarketState:
     rmv_value: Decimal
     timestamp: str
 
+class OverflowPolicy(Enum):
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+    SPILL = "spill"
+
+class FsyncPolicy(Enum):
+    ALWAYS = "always"
+    INTERVAL = "interval"
+    NEVER = "never"
+
 class EventType(Enum):
     KUCOIN_ORDERBOOK_UPDATE = auto()
     MEXC_ORDERBOOK_UPDATE = auto()
@@ -63,4 +174,60 @@ class EventType(Enum):
 @dataclass
 class QueueEvent:
     type: EventType
-    data: Any
\ No newline at end of file
+    data: Any
+    created_at: float = 0.0
+
+@dataclass
+class QueueTick:
+    filled_orders: list[QueueEvent] = field(default_factory=list)
+    mexc_update: Optional[QueueEvent] = None
+    kucoin_update: Optional[QueueEvent] = None
+    created_at: float = 0.0
+    size: int = 0
+
+@dataclass
+class ReplayOrder:
+    timestamp_ns: int
+    action: str
+    side: str
+    price: Decimal
+    size: Decimal
+    order_id: str
+
+@dataclass
+class MockExchangeConfig:
+    symbol: str = 'RMVUSDT'
+    depth_rate: float = 10
+    kucoin_rate: float = 10
+    book_levels: int = 50
+    diff_levels: int = 5
+    mid_price_ticks: int = 100
+    mid_moves_per_second: float = 1.0
+    trades_per_second: float = 2.0
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    drop_rate: float = 0.0
+    error_rate: float = 0.0
+    disconnect_interval: float = 0.0
+    rmv_balance: Decimal = Decimal('500000')
+    usdt_balance: Decimal = Decimal('500')
+    seed: int = 0
+
+@dataclass
+class WorkerConfig:
+    # what a worker process of the supervisor needs to trade its symbols, it is pickled to the process on start
+    mexc_ws_url: str
+    mexc_rest_url: str
+    kucoin_rest_url: str
+    api_key_mexc: str = ''
+    api_secret_mexc: str = ''
+    api_key_kucoin: str = ''
+    api_secret_kucoin: str = ''
+    api_passphrase_kucoin: str = ''
+    archive_dir: Optional[str] = None
+    fixed_point: bool = FIXED_POINT
+    loop_lag_threshold_ms: float = 50
+    log_level: str = 'INFO'
+    # worker i serves its metrics on metrics_port + 1 + i, the supervisor on metrics_port
+    metrics_host: str = '127.0.0.1'
+    metrics_port: Optional[int] = None
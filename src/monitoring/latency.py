@@ -0,0 +1,114 @@
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_BUCKETS = SUB_BUCKETS >> 1
+HIGHEST_NS = 60 * 1_000_000_000
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value: int) -> int:
+    # the HdrHistogram layout: values below SUB_BUCKETS have a bucket each, above that every power of two is split
+    # into HALF_BUCKETS buckets, so a bucket is never wider than 1 / HALF_BUCKETS of the values it holds
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return shift * HALF_BUCKETS + (value >> shift)
+
+
+def bucket_value(index: int) -> int:
+    # the highest value of a bucket, percentiles are reported as upper bounds like HdrHistogram does
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // HALF_BUCKETS - 1
+    return ((index - shift * HALF_BUCKETS + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    # counts of nanosecond durations in log-linear buckets, recording is an index computation and an increment,
+    # values above HIGHEST_NS are counted in the last bucket
+    def __init__(self):
+        self.counts = [0] * (bucket_index(HIGHEST_NS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        elif value > HIGHEST_NS:
+            value = HIGHEST_NS
+
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        self.counts[value if shift <= 0 else shift * HALF_BUCKETS + (value >> shift)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        if not self.count:
+            return 0
+
+        rank = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def export(self) -> dict:
+        # only the buckets in use, small enough for a health report
+        return {'counts': [(index, count) for index, count in enumerate(self.counts) if count], 'total': self.total, 'max': self.max}
+
+    def merge(self, exported: dict):
+        for index, count in exported['counts']:
+            self.counts[index] += count
+            self.count += count
+        self.total += exported['total']
+        self.max = max(self.max, exported['max'])
+
+    def get_stats(self) -> dict:
+        stats = {'count': self.count, 'mean_us': round(self.total / self.count / 1000, 1) if self.count else 0.0}
+        for percent in PERCENTILES:
+            stats[f'p{percent:g}_us'] = round(self.percentile(percent) / 1000, 1)
+        stats['max_us'] = round(self.max / 1000, 1)
+        return stats
+
+
+class StageTimers:
+    # a histogram per stage of the path from a depth frame to an order ack, the histograms cover the time since the
+    # last dump or export so every dump describes one interval
+    def __init__(self):
+        self.histograms: dict[str, LatencyHistogram] = {}
+
+    def record(self, stage: str, elapsed_ns: int):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(elapsed_ns)
+
+    def get_stats(self) -> dict:
+        return {stage: histogram.get_stats() for stage, histogram in self.histograms.items() if histogram.count}
+
+    def reset(self):
+        self.histograms = {}
+
+    def dump(self) -> dict:
+        stats = self.get_stats()
+        self.reset()
+        return stats
+
+    def export(self) -> dict:
+        exported = {stage: histogram.export() for stage, histogram in self.histograms.items() if histogram.count}
+        self.reset()
+        return exported
+
+    def merge(self, exported: dict):
+        for stage, histogram in exported.items():
+            if stage not in self.histograms:
+                self.histograms[stage] = LatencyHistogram()
+            self.histograms[stage].merge(histogram)
+
+
+# one per process, the stages are recorded where they happen and dumped by the loop that logs the health of the process
+stage_timers = StageTimers()
@@ -0,0 +1,48 @@
+import asyncio
+from loguru import logger
+from src.model import MetricFamily
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float = 50, interval: float = 0.1, debug: bool = False):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.debug = debug
+
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.blocked_count = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        if self.debug:
+            # asyncio then logs every callback slower than the threshold together with its source
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold_ms / 1000
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = (loop.time() - start - self.interval) * 1000
+
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+            if lag_ms > self.threshold_ms:
+                self.blocked_count += 1
+                logger.warning(f'Event loop blocked for {lag_ms:.1f} ms')
+
+    def get_metrics(self) -> list[MetricFamily]:
+        return [
+            MetricFamily(name='mm_event_loop_lag_seconds', kind='gauge', help='Event loop lag of the last measurement', samples=[('', {}, self.last_lag_ms / 1000)]),
+            MetricFamily(name='mm_event_loop_max_lag_seconds', kind='gauge', help='Largest event loop lag since the start', samples=[('', {}, self.max_lag_ms / 1000)]),
+            MetricFamily(name='mm_event_loop_blocked_total', kind='counter', help='Event loop lags above the threshold', samples=[('', {}, self.blocked_count)])
+        ]
+
+    def get_stats(self) -> dict:
+        return {
+            'last_lag_ms': self.last_lag_ms,
+            'max_lag_ms': self.max_lag_ms,
+            'blocked_count': self.blocked_count
+        }
@@ -0,0 +1,92 @@
+import bisect
+import math
+from typing import Any, Callable, Iterable, Optional
+from aiohttp import web
+from loguru import logger
+from src.model import MetricFamily
+
+ORDER_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestMetrics:
+    # latency and outcome of one kind of request since the start, cumulative like Prometheus histograms and counters
+    def __init__(self, buckets: tuple[float, ...] = ORDER_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.seconds = 0.0
+        self.ok = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, ok: bool):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.seconds += seconds
+        if ok:
+            self.ok += 1
+        else:
+            self.errors += 1
+
+    def histogram_samples(self, labels: dict[str, str]) -> list[tuple[str, dict[str, str], Any]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append(('_bucket', {**labels, 'le': format_value(bound)}, cumulative))
+        samples.append(('_bucket', {**labels, 'le': '+Inf'}, self.ok + self.errors))
+        samples.append(('_sum', labels, self.seconds))
+        samples.append(('_count', labels, self.ok + self.errors))
+        return samples
+
+
+def format_value(value) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(families: Iterable[MetricFamily]) -> str:
+    # the Prometheus text exposition format, samples without a value are left out
+    lines = []
+    for family in families:
+        lines.append(f'# HELP {family.name} {family.help}')
+        lines.append(f'# TYPE {family.name} {family.kind}')
+        for suffix, labels, value in family.samples:
+            if value is None:
+                continue
+            label_text = '{' + ','.join(f'{key}="{escape(str(label))}"' for key, label in labels.items()) + '}' if labels else ''
+            lines.append(f'{family.name}{suffix}{label_text} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    # /metrics on the event loop of the process, the collectors run when a scrape arrives and only read counters and
+    # cached values, so the loops that trade do nothing for it but count
+    def __init__(self, collectors: list[Callable[[], list[MetricFamily]]], host: str = '127.0.0.1', port: int = 9100):
+        self.collectors = collectors
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+        self.scrapes = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.scrapes += 1
+        families = [family for collect in self.collectors for family in collect()]
+        return web.Response(body=render(families).encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f'Serving metrics on http://{self.host}:{self.port}/metrics')
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
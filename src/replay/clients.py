@@ -0,0 +1,85 @@
+import itertools
+from decimal import Decimal
+from typing import Optional
+from src.model import DatabaseOrder, DatabaseMarketState, OrderAction, OrderBook, PrivateOrderUpdate, ReplayOrder, DEFAULT_SYMBOL
+from src.crypto.mexc.client import MexcClient
+
+
+class SimulatedClock:
+    def __init__(self, now_ns: int = 0):
+        self.now_ns = now_ns
+
+    def __call__(self) -> float:
+        return self.now_ns / 1e9
+
+
+class ReplayDatabaseClient:
+    def __init__(self):
+        self.records = 0
+
+    async def record_order(self, order: DatabaseOrder, table_name: str):
+        self.records += 1
+
+    async def record_market_state(self, market_state: DatabaseMarketState):
+        self.records += 1
+
+    async def record_orderbook(self, table: str, exchange: str, orderbook: OrderBook, timestamp: str, symbol: str = DEFAULT_SYMBOL.pair):
+        self.records += 1
+
+    async def put(self, table: str, row: tuple):
+        self.records += 1
+
+    def get_stats(self) -> dict:
+        return {'records': self.records}
+
+    async def close(self):
+        pass
+
+
+class ReplayMexcClient(MexcClient):
+    # acknowledges every request immediately and keeps the orders that would have been sent instead of calling MEXC
+    def __init__(self, database_client, add_to_event_queue, clock: SimulatedClock, balance: Optional[dict] = None):
+        super().__init__(api_key='', api_secret='', database_client=database_client, add_to_event_queue=add_to_event_queue)
+
+        self.clock = clock
+        self.balance = balance or {}
+        self.open_orders: dict[str, OrderAction] = {}
+        self.sent_orders: list[ReplayOrder] = []
+        self.order_ids = itertools.count(1)
+
+    def record(self, action: str, side: str, price: Decimal, size: Decimal, order_id: str):
+        self.sent_orders.append(ReplayOrder(timestamp_ns=self.clock.now_ns, action=action, side=side, price=price, size=size, order_id=order_id))
+
+    async def handle_order_update(self, data: Optional[PrivateOrderUpdate]):
+        # recorded orders of the live run can be cancelled by the replayed logic like its own
+        if data is not None and data.status == 1:
+            self.open_orders[data.id] = OrderAction(side=data.side, price=data.price, size=data.quantity, order_id=data.id)
+        elif data is not None and data.status in (2, 4, 5):
+            self.open_orders.pop(data.id, None)
+
+        await super().handle_order_update(data)
+
+    async def place_limit_order(self, side: str, order_type: str, size: Decimal, price: Decimal):
+        order_id = f'replay-{next(self.order_ids)}'
+        self.open_orders[order_id] = OrderAction(side=side, price=price, size=size, order_id=order_id)
+        self.record(action='place', side=side, price=price, size=size, order_id=order_id)
+        return order_id
+
+    async def place_batch_orders(self, orders: list[OrderAction]) -> list[Optional[str]]:
+        return [await self.place_limit_order(side=order.side, order_type='limit', size=order.size, price=order.price) for order in orders]
+
+    async def cancel_order(self, order_id: str):
+        order = self.open_orders.pop(order_id, None)
+        if order is None:
+            return None
+
+        self.record(action='cancel', side=order.side, price=order.price, size=order.size, order_id=order_id)
+        return {'orderId': order_id}
+
+    async def cancel_all_orders(self):
+        cancelled = list(self.open_orders.values())
+        self.open_orders.clear()
+
+        for order in cancelled:
+            self.record(action='cancel', side=order.side, price=order.price, size=order.size, order_id=order.order_id)
+        return [{'orderId': order.order_id} for order in cancelled]
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import heapq
+import os
+import random
+import sys
+import time
+import traceback
+from datetime import datetime
+from decimal import Decimal, getcontext
+from typing import Any, Iterator, Optional
+import msgspec
+from loguru import logger
+from src.model import EventType, OrderBook, OrderLevel, QueueEvent, MEXC_TICK_SIZE
+from src.crypto.kucoin.client import KucoinClient
+from src.crypto.market.book import SIZE_SCALE, ticks_to_price
+from src.crypto.market.tracking import process_tick
+from src.crypto.mexc.decode import parse_message, decode_private_order, decode_private_deal, decode_private_account
+from src.database.archive import ArchiveReader, merge_streams, PRIVATE_LOG_STREAM, MAX_TIMESTAMP_NS
+from src.database.journal import read_records
+from src.dispatcher import EventDispatcher
+from src.monitoring.latency import stage_timers
+from src.replay.clients import SimulatedClock, ReplayDatabaseClient, ReplayMexcClient
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class ReplayEngine:
+    def __init__(self, archive_dir: str, start_ns: int = 0, end_ns: int = MAX_TIMESTAMP_NS, balance: Optional[dict] = None, coalesce_window_ms: float = 0.0, private_orders: bool = True, seed: int = 0, fixed_point: bool = False):
+        self.archive_dir = archive_dir
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.coalesce_window_ns = int(coalesce_window_ms * 1_000_000)
+        self.private_orders = private_orders
+        self.seed = seed
+        self.fixed_point = fixed_point
+
+        self.clock = SimulatedClock(now_ns=start_ns)
+        self.queue = asyncio.Queue()
+        self.dispatcher = EventDispatcher(queue=self.queue, clock=self.clock)
+        self.database_client = ReplayDatabaseClient()
+        self.mexc_client = ReplayMexcClient(database_client=self.database_client, add_to_event_queue=self.dispatcher.put, clock=self.clock, balance=balance)
+        self.kucoin_client = KucoinClient(api_key='', api_secret='', api_passphrase='', database_client=self.database_client, add_to_event_queue=self.dispatcher.put, fixed_point=fixed_point)
+
+        self.readers = {stream: ArchiveReader(directory=archive_dir, stream=stream) for stream in ('mexc', 'kucoin') if os.path.isdir(os.path.join(archive_dir, stream))}
+        if 'mexc' in self.readers and (self.readers['mexc'].tick_size != MEXC_TICK_SIZE or self.readers['mexc'].size_scale != SIZE_SCALE):
+            raise ValueError(f"MEXC archive was recorded with tick size {self.readers['mexc'].tick_size} and size scale {self.readers['mexc'].size_scale}")
+
+        self.pending_since: Optional[int] = None
+        self.events_replayed = 0
+        self.errors = 0
+        self.decision_latencies: list[float] = []
+        self.wall_seconds = 0.0
+
+    def private_events(self) -> Iterator[tuple[int, str, Any]]:
+        directory = os.path.join(self.archive_dir, PRIVATE_LOG_STREAM)
+        if not os.path.isdir(directory):
+            return
+
+        for stream, (timestamp_ns, frame) in read_records(directory):
+            if self.start_ns <= timestamp_ns < self.end_ns:
+                yield timestamp_ns, stream, frame
+
+    def events(self) -> Iterator[tuple[int, str, Any]]:
+        return heapq.merge(merge_streams(self.readers, self.start_ns, self.end_ns), self.private_events(), key=lambda event: event[0])
+
+    async def apply(self, stream: str, payload: Any):
+        if stream == 'mexc':
+            _, is_snapshot, asks, bids = payload
+            book = self.mexc_client.orderbook
+            update_id = book.update_id
+            started = time.perf_counter_ns()
+
+            if is_snapshot:
+                book.load_snapshot(book.version + 1, asks, bids)
+            elif book.synced:
+                book.apply_diff(book.version + 1, book.version + 1, asks, bids)
+            stage_timers.record('apply', time.perf_counter_ns() - started)
+
+            if book.update_id != update_id and book.synced:
+                await self.mexc_client.add_to_event_queue(QueueEvent(type=EventType.MEXC_ORDERBOOK_UPDATE, data=None))
+        elif stream == 'kucoin' and self.fixed_point:
+            _, _, asks, bids = payload
+            if self.readers['kucoin'].tick_size != self.kucoin_client.orderbook.tick_size:
+                raise ValueError(f"KuCoin archive was recorded with tick size {self.readers['kucoin'].tick_size}")
+
+            if (asks, bids) != self.kucoin_client.levels:
+                self.kucoin_client.levels = (asks, bids)
+                self.kucoin_client.orderbook.load_snapshot(self.kucoin_client.orderbook.version + 1, asks, bids)
+                await self.kucoin_client.add_to_event_queue(QueueEvent(type=EventType.KUCOIN_ORDERBOOK_UPDATE, data=None))
+        elif stream == 'kucoin':
+            _, _, asks, bids = payload
+            reader = self.readers['kucoin']
+            scale = Decimal(reader.size_scale)
+            orderbook = OrderBook(
+                asks=[OrderLevel(id='', price=ticks_to_price(tick, reader.tick_size), size=Decimal(size) / scale) for tick, size in asks],
+                bids=[OrderLevel(id='', price=ticks_to_price(tick, reader.tick_size), size=Decimal(size) / scale) for tick, size in bids]
+            )
+
+            if orderbook != self.kucoin_client.orderbook:
+                self.kucoin_client.orderbook = orderbook
+                await self.kucoin_client.add_to_event_queue(QueueEvent(type=EventType.KUCOIN_ORDERBOOK_UPDATE, data=None))
+        elif stream == 'orders':
+            if self.private_orders:
+                await self.mexc_client.handle_order_update(decode_private_order(parse_message(payload)))
+        elif stream == 'deals':
+            self.mexc_client.handle_deal(decode_private_deal(parse_message(payload)))
+        elif stream == 'account':
+            self.mexc_client.handle_account_update(decode_private_account(parse_message(payload)))
+
+    async def drain(self):
+        while not self.queue.empty():
+            tick = await self.dispatcher.next_tick()
+
+            if not tick.filled_orders and tick.mexc_update is None and tick.kucoin_update is None:
+                continue
+
+            started = time.perf_counter()
+            try:
+                await process_tick(tick=tick, mexc_client=self.mexc_client, kucoin_client=self.kucoin_client, database_client=self.database_client, fixed_point=self.fixed_point)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"error type: {type(e)}, details: {e}")
+                logger.error(traceback.format_exc())
+            self.decision_latencies.append(time.perf_counter() - started)
+            self.dispatcher.record_decision(tick)
+
+        self.pending_since = None
+
+    async def run(self) -> dict:
+        random.seed(self.seed)
+        stage_timers.reset()
+        started = time.perf_counter()
+
+        for timestamp_ns, stream, payload in self.events():
+            # events closer together than the coalescing window reach the dispatcher as one tick
+            if self.pending_since is not None and timestamp_ns - self.pending_since >= self.coalesce_window_ns:
+                await self.drain()
+
+            self.clock.now_ns = timestamp_ns
+            await self.apply(stream, payload)
+            self.events_replayed += 1
+
+            if self.pending_since is None and not self.queue.empty():
+                self.pending_since = timestamp_ns
+
+        await self.drain()
+
+        self.wall_seconds = time.perf_counter() - started
+        return self.get_report()
+
+    def get_report(self) -> dict:
+        latencies = self.decision_latencies
+        sent_orders = self.mexc_client.sent_orders
+
+        return {
+            'events': self.events_replayed,
+            'ticks': len(latencies),
+            'errors': self.errors,
+            'wall_seconds': self.wall_seconds,
+            'events_per_second': self.events_replayed / self.wall_seconds if self.wall_seconds else 0.0,
+            'decision_p50_us': percentile(latencies, 50) * 1_000_000,
+            'decision_p90_us': percentile(latencies, 90) * 1_000_000,
+            'decision_p99_us': percentile(latencies, 99) * 1_000_000,
+            'decision_max_us': max(latencies, default=0.0) * 1_000_000,
+            'orders_placed': sum(order.action == 'place' for order in sent_orders),
+            'orders_cancelled': sum(order.action == 'cancel' for order in sent_orders),
+            'dispatcher': self.dispatcher.get_stats(),
+            'quote_gate': self.mexc_client.quote_gate.get_stats(),
+            # queue_wait and decision are in the simulated time of the archive
+            'stages': stage_timers.get_stats()
+        }
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+
+
+def parse_time(value: Optional[str], default: int) -> int:
+    if value is None:
+        return default
+    return int(datetime.fromisoformat(value).timestamp() * 1_000_000_000)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Replay an orderbook archive through the quoting logic')
+    parser.add_argument('archive_dir')
+    parser.add_argument('--start', help='ISO timestamp, defaults to the beginning of the archive')
+    parser.add_argument('--end', help='ISO timestamp, defaults to the end of the archive')
+    parser.add_argument('--rmv', type=Decimal, default=Decimal('500000'), help='free RMV balance before the first recorded account event')
+    parser.add_argument('--usdt', type=Decimal, default=Decimal('500'), help='free USDT balance before the first recorded account event')
+    parser.add_argument('--coalesce-ms', type=float, default=0.0)
+    parser.add_argument('--ignore-private-orders', action='store_true', help='do not feed the recorded order updates of the live run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixed-point', action='store_true', help='quote with integer ticks and units instead of Decimal')
+    parser.add_argument('--orders-out', help='write the orders that would have been sent as JSON lines')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    getcontext().prec = 18
+
+    balance = {
+        'RMV': {'free': args.rmv, 'locked': Decimal('0')},
+        'USDT': {'free': args.usdt, 'locked': Decimal('0')}
+    }
+
+    engine = ReplayEngine(archive_dir=args.archive_dir, start_ns=parse_time(args.start, 0), end_ns=parse_time(args.end, MAX_TIMESTAMP_NS), balance=balance, coalesce_window_ms=args.coalesce_ms, private_orders=not args.ignore_private_orders, seed=args.seed, fixed_point=args.fixed_point)
+    try:
+        report = await engine.run()
+    finally:
+        engine.close()
+
+    if args.orders_out:
+        with open(args.orders_out, 'wb') as file:
+            for order in engine.mexc_client.sent_orders:
+                file.write(msgspec.json.encode(order) + b'\n')
+
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,266 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from dataclasses import dataclass, field
+from decimal import getcontext
+from multiprocessing.context import SpawnProcess
+from typing import Any, Optional
+from dotenv import load_dotenv
+from loguru import logger
+from src.model import MetricFamily, OverflowPolicy, FsyncPolicy, Symbol, WorkerConfig, DEFAULT_SYMBOL, FIXED_POINT
+from src.crypto.mexc.client import MexcClient, MEXC_WS_URL, MEXC_REST_URL
+from src.crypto.kucoin.client import KUCOIN_REST_URL
+from src.crypto.market.registry import parse_symbols
+from src.database.client import DatabaseClient
+from src.database.journal import Journal
+from src.monitoring.loop_lag import LoopLagMonitor
+from src.monitoring.latency import stage_timers
+from src.monitoring.metrics import MetricsServer
+from src.worker import Channel, run_worker
+
+HEALTH_TIMEOUT = 10.0
+RESTART_DELAY = 5.0
+STOP_TIMEOUT = 30.0
+
+
+def partition_symbols(symbols: list[Symbol], workers: int) -> list[list[Symbol]]:
+    # round robin, so the first symbols, usually the busiest, end up in different processes
+    workers = max(1, min(workers, len(symbols)))
+    return [symbols[i::workers] for i in range(workers)]
+
+
+@dataclass
+class WorkerHandle:
+    index: int
+    symbols: list[Symbol]
+    process: Optional[SpawnProcess] = None
+    channel: Optional[Channel] = None
+    task: Optional[asyncio.Task] = None
+    started_at: float = 0.0
+    restarts: int = 0
+    health: dict = field(default_factory=dict)
+    last_health_at: float = 0.0
+    events_per_second: float = 0.0
+    ticks_per_second: float = 0.0
+    rows_received: int = 0
+
+
+class Supervisor:
+    # splits the symbols over worker processes that each run their own event loop, exchange clients and private
+    # stream, and keeps what is shared by all of them: the listen key and the database writers
+    def __init__(self, symbols: list[Symbol], workers: int, config: WorkerConfig, database_client: DatabaseClient):
+        self.config = config
+        self.database_client = database_client
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [WorkerHandle(index=i, symbols=partition) for i, partition in enumerate(partition_symbols(symbols, workers))]
+        self.record_symbol = symbols[0]
+
+        self.mexc_client = MexcClient(api_key=config.api_key_mexc, api_secret=config.api_secret_mexc, database_client=database_client, ws_base_url=config.mexc_ws_url, rest_base_url=config.mexc_rest_url, symbol=symbols[0])
+
+        self.listen_key: Optional[str] = None
+        self.tasks: list[asyncio.Task] = []
+        self.stopping = False
+
+    def spawn(self, worker: WorkerHandle):
+        parent_connection, child_connection = self.context.Pipe(duplex=True)
+        pairs = ','.join(symbol.pair for symbol in worker.symbols)
+        worker.process = self.context.Process(target=run_worker, args=(worker.index, pairs, child_connection, self.config, self.record_symbol in worker.symbols), name=f'worker-{worker.index}', daemon=True)
+        worker.process.start()
+        child_connection.close()
+
+        worker.channel = Channel(parent_connection)
+        worker.channel.start()
+        worker.started_at = time.monotonic()
+        worker.health = {}
+        worker.last_health_at = 0.0
+        worker.task = asyncio.create_task(self.serve(worker))
+
+        if self.listen_key is not None:
+            worker.channel.send('listen_key', self.listen_key)
+        logger.info(f'Started worker {worker.index} (pid {worker.process.pid}) for {pairs}')
+
+    async def serve(self, worker: WorkerHandle):
+        channel = worker.channel
+        while True:
+            message = await channel.receive()
+            if message is None:
+                return
+
+            kind, payload = message
+            if kind == 'rows':
+                for table, row in payload:
+                    await self.database_client.put(table, tuple(row))
+                worker.rows_received += len(payload)
+            elif kind == 'health':
+                self.update_health(worker, payload)
+
+    def update_health(self, worker: WorkerHandle, health: dict):
+        # the stage histograms of all workers add up to those of the supervisor, which also times the database writes
+        stage_timers.merge(health.pop('stages', {}))
+        now = time.monotonic()
+        if worker.health and now > worker.last_health_at:
+            elapsed = now - worker.last_health_at
+            worker.events_per_second = (health['events_received'] - worker.health['events_received']) / elapsed
+            worker.ticks_per_second = (health['ticks'] - worker.health['ticks']) / elapsed
+        worker.health = health
+        worker.last_health_at = now
+
+    async def watch(self):
+        # a worker that exited is started again, its orders are cancelled by the new process before it quotes
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+
+            for worker in self.workers:
+                if self.stopping:
+                    return
+
+                if not worker.process.is_alive():
+                    if now - worker.started_at < RESTART_DELAY:
+                        continue
+                    logger.error(f'Worker {worker.index} exited with code {worker.process.exitcode}, restarting')
+                    worker.task.cancel()
+                    worker.channel.close()
+                    worker.restarts += 1
+                    self.spawn(worker)
+                elif now - max(worker.last_health_at, worker.started_at) > HEALTH_TIMEOUT:
+                    logger.warning(f'No health report from worker {worker.index} for {now - max(worker.last_health_at, worker.started_at):.1f} s')
+
+    async def start(self):
+        for worker in self.workers:
+            self.spawn(worker)
+
+        self.listen_key = await self.mexc_client.create_listen_key()
+        for worker in self.workers:
+            worker.channel.send('listen_key', self.listen_key)
+
+        self.tasks = [
+            asyncio.create_task(self.mexc_client.extend_listen_key(listen_key=self.listen_key)),
+            asyncio.create_task(self.watch())
+        ]
+
+    async def stop(self):
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        for worker in self.workers:
+            worker.channel.send('stop')
+
+        # the workers cancel their orders and send their last rows before they exit
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while any(worker.process.is_alive() for worker in self.workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        for worker in self.workers:
+            if worker.process.is_alive():
+                logger.error(f'Worker {worker.index} did not stop in {STOP_TIMEOUT} s, terminating')
+                worker.process.terminate()
+            if worker.task is not None:
+                await asyncio.wait([worker.task], timeout=1)
+                worker.task.cancel()
+            worker.channel.close()
+
+        await self.mexc_client.close()
+
+    def get_metrics(self) -> list[MetricFamily]:
+        # the trading metrics are served by every worker itself
+        return [
+            MetricFamily(name='mm_worker_up', kind='gauge', help='Whether the worker process is alive', samples=[('', {'worker': str(worker.index)}, int(worker.process is not None and worker.process.is_alive())) for worker in self.workers]),
+            MetricFamily(name='mm_worker_restarts_total', kind='counter', help='Worker processes started again after they exited', samples=[('', {'worker': str(worker.index)}, worker.restarts) for worker in self.workers])
+        ]
+
+    def get_stats(self) -> dict[int, dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            worker.index: {
+                'pid': worker.process.pid if worker.process is not None else None,
+                'alive': worker.process is not None and worker.process.is_alive(),
+                'symbols': [symbol.name for symbol in worker.symbols],
+                'restarts': worker.restarts,
+                'health_age_s': now - worker.last_health_at if worker.last_health_at else None,
+                'events_per_second': worker.events_per_second,
+                'ticks_per_second': worker.ticks_per_second,
+                'max_latency_ms': worker.health.get('max_latency_ms'),
+                'max_loop_lag_ms': worker.health.get('loop_lag', {}).get('max_lag_ms'),
+                'rows_received': worker.rows_received
+            }
+            for worker in self.workers
+        }
+
+
+async def main():
+    load_dotenv()
+    getcontext().prec = 18
+
+    symbols = parse_symbols(os.getenv("SYMBOLS", DEFAULT_SYMBOL.pair))
+    workers = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+    archive_dir = os.getenv("ARCHIVE_DIR")
+    db_journal_dir = os.getenv("DB_JOURNAL_DIR")
+
+    config = WorkerConfig(
+        mexc_ws_url=os.getenv("MEXC_WS_URL", MEXC_WS_URL),
+        mexc_rest_url=os.getenv("MEXC_REST_URL", MEXC_REST_URL),
+        kucoin_rest_url=os.getenv("KUCOIN_REST_URL", KUCOIN_REST_URL),
+        api_key_mexc=os.getenv("API_KEY_MEXC"),
+        api_secret_mexc=os.getenv("API_SECRET_MEXC"),
+        api_key_kucoin=os.getenv("API_KEY_KUCOIN"),
+        api_secret_kucoin=os.getenv("API_SECRET_KUCOIN"),
+        api_passphrase_kucoin=os.getenv("API_PASSPHRASE_KUCOIN"),
+        archive_dir=archive_dir,
+        fixed_point=os.getenv("FIXED_POINT", str(FIXED_POINT)).lower() in ('1', 'true'),
+        loop_lag_threshold_ms=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "50")),
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        metrics_port=int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+    )
+
+    journal = Journal(directory=db_journal_dir, fsync_policy=FsyncPolicy(os.getenv("DB_JOURNAL_FSYNC_POLICY", FsyncPolicy.INTERVAL.value))) if db_journal_dir else None
+    database_client = DatabaseClient(host=os.getenv("MYSQL_HOST"), user=os.getenv("MYSQL_USER"), password=os.getenv("MYSQL_PASSWORD"), overflow_policy=OverflowPolicy(os.getenv("DB_OVERFLOW_POLICY", OverflowPolicy.DROP_OLDEST.value)), journal=journal)
+
+    supervisor = Supervisor(symbols=symbols, workers=workers, config=config, database_client=database_client)
+    loop_lag_monitor = LoopLagMonitor(threshold_ms=config.loop_lag_threshold_ms)
+    metrics_server = MetricsServer(collectors=[supervisor.get_metrics, database_client.get_metrics, loop_lag_monitor.get_metrics], host=config.metrics_host, port=config.metrics_port) if config.metrics_port is not None else None
+    stopped = asyncio.Event()
+
+    async def stop():
+        try:
+            await supervisor.stop()
+            if metrics_server is not None:
+                await metrics_server.stop()
+            await database_client.close()
+        except Exception as e:
+            logger.error(f"Error stopping workers: {e}")
+        stopped.set()
+
+    def handle_exit():
+        if not supervisor.stopping:
+            asyncio.create_task(stop())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, handle_exit)
+
+    asyncio.create_task(loop_lag_monitor.run())
+    await asyncio.sleep(30)
+
+    await database_client.connect()
+    await supervisor.start()
+    if metrics_server is not None:
+        await metrics_server.start()
+
+    while not stopped.is_set():
+        try:
+            await asyncio.wait_for(stopped.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.info(f"event loop lag: {loop_lag_monitor.get_stats()}")
+            logger.info(f"database writers: {database_client.get_stats()}")
+            logger.info(f"stage latency: {stage_timers.dump()}")
+            for index, stats in supervisor.get_stats().items():
+                logger.info(f"worker {index}: {stats}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,349 @@
+import asyncio
+import os
+import signal
+import struct
+import sys
+import time
+from decimal import getcontext
+from multiprocessing.connection import Connection
+from typing import Any, Optional
+import msgspec
+from loguru import logger
+from src.model import MetricFamily, Symbol, WorkerConfig
+from src.crypto.mexc.client import MexcClient
+from src.crypto.kucoin.client import KucoinClient, KUCOIN_TICK_SIZE
+from src.crypto.market.book import SIZE_SCALE
+from src.crypto.market.registry import SymbolRegistry, log_market_state, parse_symbols
+from src.database.archive import ArchiveWriter, PRIVATE_LOG_STREAM
+from src.database.client import DatabaseClient
+from src.database.journal import Journal
+from src.monitoring.loop_lag import LoopLagMonitor
+from src.monitoring.latency import stage_timers
+from src.monitoring.metrics import MetricsServer
+
+HEALTH_INTERVAL = 1.0
+ROWS_FLUSH_INTERVAL = 0.05
+# a batch of rows stays well below the pipe buffer of the OS (64 KB on Linux)
+ROWS_BATCH_BYTES = 32 * 1024
+FRAME_HEADER = struct.Struct('!i')
+READ_SIZE = 256 * 1024
+DRAIN_TIMEOUT = 5.0
+MARKET_STATE_INTERVAL = 10
+
+
+class Channel:
+    # one end of the duplex pipe between the supervisor and a worker, messages are msgpack encoded (kind, payload)
+    # pairs framed by their length like multiprocessing does, the pipe is non-blocking and read and written from the
+    # event loop when it is readable or writable, so a peer that reads late never blocks the loop of the sender
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.encoder = msgspec.msgpack.Encoder()
+        self.decoder = msgspec.msgpack.Decoder()
+        self.messages: Optional[asyncio.Queue] = None
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+        self.writing = False
+        self.broken = False
+
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.messages_received = 0
+
+    def start(self):
+        self.messages = asyncio.Queue()
+        os.set_blocking(self.connection.fileno(), False)
+        asyncio.get_running_loop().add_reader(self.connection.fileno(), self.read)
+
+    def read(self):
+        try:
+            while True:
+                chunk = os.read(self.connection.fileno(), READ_SIZE)
+                if not chunk:
+                    raise EOFError
+                self.incoming += chunk
+                if len(chunk) < READ_SIZE:
+                    break
+        except BlockingIOError:
+            pass
+        except (EOFError, OSError):
+            # the other process is gone, receive returns None from now on
+            self.disconnect()
+            return
+
+        offset = 0
+        while len(self.incoming) - offset >= FRAME_HEADER.size:
+            size = FRAME_HEADER.unpack_from(self.incoming, offset)[0]
+            end = offset + FRAME_HEADER.size + size
+            if len(self.incoming) < end:
+                break
+            self.messages.put_nowait(self.decoder.decode(self.incoming[offset + FRAME_HEADER.size:end]))
+            self.messages_received += 1
+            offset = end
+        del self.incoming[:offset]
+
+    async def receive(self) -> Optional[tuple[str, Any]]:
+        return await self.messages.get()
+
+    def send(self, kind: str, payload: Any = None) -> bool:
+        # queues the message and writes what the pipe takes now, the rest is written when it becomes writable
+        if self.broken or self.connection.closed:
+            return False
+
+        data = self.encoder.encode((kind, payload))
+        self.outgoing += FRAME_HEADER.pack(len(data))
+        self.outgoing += data
+        self.messages_sent += 1
+        self.bytes_sent += len(data)
+
+        if not self.writing:
+            self.write()
+        return not self.broken
+
+    def write(self):
+        try:
+            while self.outgoing:
+                written = os.write(self.connection.fileno(), self.outgoing)
+                del self.outgoing[:written]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.disconnect()
+            return
+
+        if self.outgoing and not self.writing:
+            asyncio.get_running_loop().add_writer(self.connection.fileno(), self.write)
+            self.writing = True
+        elif not self.outgoing and self.writing:
+            asyncio.get_running_loop().remove_writer(self.connection.fileno())
+            self.writing = False
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        # waits until the queued messages are written, e.g. the last rows of a worker before it closes the pipe
+        deadline = time.monotonic() + timeout
+        while self.outgoing and not self.broken and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    def disconnect(self):
+        if self.broken:
+            return
+        self.broken = True
+        self.outgoing.clear()
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self.connection.fileno())
+        if self.writing:
+            loop.remove_writer(self.connection.fileno())
+            self.writing = False
+        self.messages.put_nowait(None)
+
+    def close(self):
+        if self.messages is not None and not self.connection.closed:
+            loop = asyncio.get_running_loop()
+            loop.remove_reader(self.connection.fileno())
+            if self.writing:
+                loop.remove_writer(self.connection.fileno())
+                self.writing = False
+        self.connection.close()
+
+    def get_stats(self) -> dict:
+        return {'messages_sent': self.messages_sent, 'bytes_sent': self.bytes_sent, 'bytes_buffered': len(self.outgoing), 'messages_received': self.messages_received}
+
+
+class ShardDatabaseClient(DatabaseClient):
+    # formats records like DatabaseClient but sends the rows to the supervisor, which owns the database writers,
+    # rows are batched so a busy worker sends a few messages per second instead of one per record
+    def __init__(self, channel: Channel):
+        super().__init__(host=None, user=None, password=None)
+        self.channel = channel
+        self.rows: list[msgspec.Raw] = []
+        self.rows_bytes = 0
+        self.flush_task: Optional[asyncio.Task] = None
+        self.rows_sent = 0
+
+    async def connect(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.run_flush())
+
+    async def put(self, table: str, row: tuple):
+        # encoded once here, the batch is a msgpack array of the encoded rows and is capped in bytes
+        row = msgspec.Raw(self.channel.encoder.encode((table, row)))
+        self.rows.append(row)
+        self.rows_bytes += len(row)
+        if self.rows_bytes >= ROWS_BATCH_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.channel.send('rows', self.rows)
+            self.rows_sent += len(self.rows)
+            self.rows = []
+            self.rows_bytes = 0
+
+    async def run_flush(self):
+        while True:
+            await asyncio.sleep(ROWS_FLUSH_INTERVAL)
+            self.flush()
+
+    def get_stats(self) -> dict:
+        return {'rows_sent': self.rows_sent, 'rows_buffered': len(self.rows)}
+
+    def get_metrics(self) -> list[MetricFamily]:
+        # the rows are written by the supervisor, the backlog of a worker is what it has not sent yet
+        return [
+            MetricFamily(name='mm_db_backlog_rows', kind='gauge', help='Database rows waiting to be written', samples=[('', {'queue': 'pipe'}, len(self.rows))]),
+            MetricFamily(name='mm_db_rows_sent_total', kind='counter', help='Database rows sent to the supervisor', samples=[('', {'queue': 'pipe'}, self.rows_sent)])
+        ]
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.flush()
+
+
+def symbol_archives(archive_dir: Optional[str], symbol: Symbol) -> tuple:
+    # every symbol of a worker is archived in a directory named after it
+    if archive_dir is None:
+        return None, None, None
+    directory = os.path.join(archive_dir, symbol.name)
+    return (
+        ArchiveWriter(directory=directory, stream='mexc', tick_size=symbol.tick_size, size_scale=SIZE_SCALE),
+        ArchiveWriter(directory=directory, stream='mexc_trades', tick_size=symbol.tick_size, size_scale=SIZE_SCALE),
+        ArchiveWriter(directory=directory, stream='kucoin', tick_size=KUCOIN_TICK_SIZE, size_scale=SIZE_SCALE)
+    )
+
+
+class Worker:
+    # trades a partition of the symbols in its own process and event loop with its own private stream, the supervisor
+    # sends the listen key and receives the database rows and a health report every HEALTH_INTERVAL
+    def __init__(self, index: int, symbols: list[Symbol], channel: Channel, config: WorkerConfig, record_market_state: bool = False):
+        self.index = index
+        self.symbols = symbols
+        self.channel = channel
+        self.config = config
+        self.record_market_state = record_market_state
+
+        self.database_client = ShardDatabaseClient(channel=channel)
+        self.archives = [symbol_archives(config.archive_dir, symbol) for symbol in symbols]
+        self.private_log = Journal(directory=os.path.join(config.archive_dir, symbols[0].name, PRIVATE_LOG_STREAM)) if config.archive_dir else None
+
+        mexc_archive, mexc_trade_archive, kucoin_archive = self.archives[0]
+        self.mexc_client = MexcClient(api_key=config.api_key_mexc, api_secret=config.api_secret_mexc, database_client=self.database_client, archive=mexc_archive, trade_archive=mexc_trade_archive, private_log=self.private_log, ws_base_url=config.mexc_ws_url, rest_base_url=config.mexc_rest_url, symbol=symbols[0])
+        self.kucoin_client = KucoinClient(api_key=config.api_key_kucoin, api_secret=config.api_secret_kucoin, api_passphrase=config.api_passphrase_kucoin, database_client=self.database_client, archive=kucoin_archive, rest_base_url=config.kucoin_rest_url, fixed_point=config.fixed_point, symbol=symbols[0])
+        self.registry = SymbolRegistry(mexc_client=self.mexc_client, kucoin_client=self.kucoin_client)
+        for symbol, (mexc_archive, mexc_trade_archive, kucoin_archive) in zip(symbols, self.archives):
+            self.registry.add(symbol=symbol, mexc_archive=mexc_archive, mexc_trade_archive=mexc_trade_archive, kucoin_archive=kucoin_archive)
+        self.loop_lag_monitor = LoopLagMonitor(threshold_ms=config.loop_lag_threshold_ms)
+        self.metrics_server = MetricsServer(collectors=[self.registry.get_metrics, self.database_client.get_metrics, self.loop_lag_monitor.get_metrics], host=config.metrics_host, port=config.metrics_port + 1 + index) if config.metrics_port is not None else None
+
+        self.listen_key: Optional[str] = None
+        self.ready = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+
+    def handle_message(self, kind: str, payload: Any):
+        if kind == 'listen_key':
+            self.listen_key = payload
+            self.ready.set()
+        elif kind == 'stop':
+            self.stopping.set()
+
+    async def receive(self):
+        while True:
+            message = await self.channel.receive()
+            if message is None:
+                logger.error('Supervisor is gone, stopping')
+                self.stopping.set()
+                return
+            self.handle_message(*message)
+
+    async def report_health(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            # with the stage histogram buckets recorded since the last report, the supervisor adds them up
+            self.channel.send('health', {**self.get_stats(), 'stages': stage_timers.export()})
+
+    async def log_market_states(self):
+        while True:
+            await asyncio.sleep(MARKET_STATE_INTERVAL)
+            for market in self.registry:
+                try:
+                    await log_market_state(market=market, database_client=self.database_client, record=self.record_market_state and market.symbol == self.symbols[0])
+                except Exception as e:
+                    logger.error(e)
+
+    async def run(self):
+        self.channel.start()
+        self.tasks = [asyncio.create_task(self.receive()), asyncio.create_task(self.loop_lag_monitor.run()), asyncio.create_task(self.report_health())]
+
+        for market in self.registry:
+            await market.mexc_client.cancel_all_orders()
+        await self.database_client.connect()
+        if self.private_log is not None:
+            self.private_log.start()
+
+        # the private stream needs the listen key of the supervisor
+        await asyncio.wait([asyncio.create_task(self.ready.wait()), asyncio.create_task(self.stopping.wait())], return_when=asyncio.FIRST_COMPLETED)
+        if not self.stopping.is_set():
+            logger.info(f'Worker {self.index} trading {", ".join(symbol.name for symbol in self.symbols)}')
+            self.tasks.append(asyncio.create_task(self.mexc_client.track_private(listen_key=self.listen_key)))
+            self.tasks.append(asyncio.create_task(self.log_market_states()))
+            self.tasks.extend(self.registry.start(database_client=self.database_client, fixed_point=self.config.fixed_point))
+            if self.metrics_server is not None:
+                await self.metrics_server.start()
+
+        await self.stopping.wait()
+        await self.stop()
+
+    async def stop(self):
+        logger.info(f'Worker {self.index}: cancelling all orders on MEXC...')
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        try:
+            for market in self.registry:
+                await market.mexc_client.cancel_all_orders()
+        except Exception as e:
+            logger.error(f'Error cancelling orders: {e}')
+
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.database_client.close()
+        await self.channel.drain()
+        await self.mexc_client.close()
+        await self.kucoin_client.close()
+        for archive in [archive for archives in self.archives for archive in archives] + [self.private_log]:
+            if archive is not None:
+                archive.close()
+        self.channel.close()
+
+    def get_stats(self) -> dict:
+        dispatchers = self.registry.get_stats()
+        return {
+            'pid': os.getpid(),
+            'time': time.time(),
+            'symbols': len(dispatchers),
+            'events_received': sum(stats['events_received'] for stats in dispatchers.values()),
+            'ticks': sum(stats['ticks'] for stats in dispatchers.values()),
+            'max_queue_depth': max(stats['max_queue_depth'] for stats in dispatchers.values()),
+            'max_latency_ms': max(stats['max_latency_ms'] for stats in dispatchers.values()),
+            'quote_gate_hits': sum(market.mexc_client.quote_gate.hits for market in self.registry),
+            'quote_gate_misses': sum(market.mexc_client.quote_gate.misses for market in self.registry),
+            'loop_lag': self.loop_lag_monitor.get_stats(),
+            'database': self.database_client.get_stats(),
+            'channel': self.channel.get_stats()
+        }
+
+
+def run_worker(index: int, pairs: str, connection: Connection, config: WorkerConfig, record_market_state: bool):
+    # the process target, the supervisor handles interrupts and tells the workers to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    getcontext().prec = 18
+    logger.remove()
+    logger.add(sys.stderr, level=config.log_level, format='<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | worker ' + str(index) + ' | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>')
+
+    async def main():
+        worker = Worker(index=index, symbols=parse_symbols(pairs), channel=Channel(connection), config=config, record_market_state=record_market_state)
+        await worker.run()
+
+    asyncio.run(main())
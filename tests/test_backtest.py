@@ -0,0 +1,52 @@
+import tempfile
+import numpy as np
+from src.backtest.simulator import Backtester, parameter_grid
+from src.crypto.market.book import SIZE_SCALE
+from src.database.archive import ArchiveWriter
+from src.model import MEXC_TICK_SIZE
+
+START_NS = 1_700_000_000_000_000_000
+
+
+def backtest(directory: str) -> dict:
+    backtester = Backtester(archive_dir=directory, parameters=parameter_grid(half_spread=[0.00002, 0.00004]), initial_inventory=500_000, initial_cash=500)
+    try:
+        return backtester.run()
+    finally:
+        backtester.close()
+
+
+def record(directory: str, messages: list[tuple[bool, list, list]]):
+    mexc = ArchiveWriter(directory=directory, stream='mexc', tick_size=MEXC_TICK_SIZE, size_scale=SIZE_SCALE)
+    for i, (snapshot, asks, bids) in enumerate(messages):
+        levels = [(tick, size * SIZE_SCALE) for tick, size in asks], [(tick, size * SIZE_SCALE) for tick, size in bids]
+        if snapshot:
+            mexc.record_snapshot(START_NS + i * 1_000_000_000, *levels)
+        else:
+            mexc.record_diff(START_NS + i * 1_000_000_000, *levels)
+    mexc.close()
+
+
+def test_archive_ending_with_an_empty_side():
+    # the last diff removes every bid, the PnL is marked at the mid before it
+    with tempfile.TemporaryDirectory() as directory:
+        record(directory, [
+            (True, [(1_001 + i, 100_000) for i in range(10)], [(999 - i, 100_000) for i in range(10)]),
+            (False, [(1_001, 50_000)], [(999, 50_000)]),
+            (False, [], [(999 - i, 0) for i in range(10)])
+        ])
+        results = backtest(directory)
+
+    assert len(results['pnl']) == 2
+    assert np.all(np.isfinite(results['pnl']))
+    assert np.array_equal(results['pnl'], results['cash'] + results['inventory'] * 1_000 * float(MEXC_TICK_SIZE) - (500 + 500_000 * 1_000 * float(MEXC_TICK_SIZE)))
+
+
+def test_archive_without_a_mid():
+    # a side is empty from the start, nothing is quoted or marked
+    with tempfile.TemporaryDirectory() as directory:
+        record(directory, [(True, [(1_001 + i, 100_000) for i in range(10)], [])])
+        results = backtest(directory)
+
+    assert np.array_equal(results['pnl'], np.zeros(2))
+    assert len(results['pnl_path']) == 0
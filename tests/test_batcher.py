@@ -0,0 +1,95 @@
+import asyncio
+from decimal import Decimal
+import aiohttp
+import pytest
+from src.crypto.market.batcher import OrderBatcher
+from src.crypto.mexc.client import MexcClient
+from src.mock.exchange import MockExchange
+from src.model import MockExchangeConfig, OrderAction, MEXC_TICK_SIZE
+from src.replay.clients import ReplayDatabaseClient
+
+SIZE = Decimal('2000')
+
+
+class RecordingDatabaseClient(ReplayDatabaseClient):
+    def __init__(self):
+        super().__init__()
+        self.placed: list[str] = []
+
+    async def record_order(self, order, table_name: str):
+        await super().record_order(order=order, table_name=table_name)
+        if table_name == 'every_order_placed':
+            self.placed.append(order.order_id)
+
+
+def order(side: str, ticks: int, order_id: str = '') -> OrderAction:
+    return OrderAction(side=side, price=MEXC_TICK_SIZE * ticks, size=SIZE, order_id=order_id)
+
+
+def active_ids(mexc_client: MexcClient, side: str) -> dict[Decimal, str]:
+    book = mexc_client.active_orders.snapshot()
+    levels = book.asks if side == 'sell' else book.bids
+    return {level.price: level.id for level in levels}
+
+
+async def execute_with_errors(use_batch_endpoint: bool):
+    # the mid price stays at 100 ticks so none of the orders fills
+    exchange = MockExchange(MockExchangeConfig(mid_moves_per_second=0, seed=1))
+    address = await exchange.start()
+    database_client = RecordingDatabaseClient()
+    mexc_client = MexcClient(api_key='k', api_secret='s', database_client=database_client, ws_base_url=f'ws://{address}/ws', rest_base_url=f'http://{address}')
+    batcher = OrderBatcher(mexc_client=mexc_client, database_client=database_client, use_batch_endpoint=use_batch_endpoint)
+
+    try:
+        await batcher.execute(cancels=[], places=[order('sell', 110 + i) for i in range(3)] + [order('buy', 90 - i) for i in range(3)])
+        asks, bids = active_ids(mexc_client, 'sell'), active_ids(mexc_client, 'buy')
+        assert set(exchange.orders) == set(asks.values()) | set(bids.values())
+
+        # the cancel of the ask at 110 and the places of the ask at 114 and the bid at 87 raise, every other request
+        # reaches the exchange
+        failing_cancel = asks[MEXC_TICK_SIZE * 110]
+        failing_prices = {MEXC_TICK_SIZE * 114, MEXC_TICK_SIZE * 87}
+        cancel_order, place_limit_order, place_batch_orders = mexc_client.cancel_order, mexc_client.place_limit_order, mexc_client.place_batch_orders
+
+        async def cancel_with_errors(order_id: str):
+            if order_id == failing_cancel:
+                raise aiohttp.ClientConnectionError('connection reset')
+            return await cancel_order(order_id=order_id)
+
+        async def place_with_errors(side: str, order_type: str, size: Decimal, price: Decimal):
+            if price in failing_prices:
+                raise asyncio.TimeoutError()
+            return await place_limit_order(side=side, order_type=order_type, size=size, price=price)
+
+        async def place_batch_with_errors(orders: list[OrderAction]):
+            if any(order.price in failing_prices for order in orders):
+                raise aiohttp.ClientConnectionError('connection reset')
+            return await place_batch_orders(orders=orders)
+
+        mexc_client.cancel_order, mexc_client.place_limit_order, mexc_client.place_batch_orders = cancel_with_errors, place_with_errors, place_batch_with_errors
+
+        # all asks move up by three ticks, the bid at 90 is replaced at the same price and one is added at 87
+        cancels = [order('sell', ticks, asks[MEXC_TICK_SIZE * ticks]) for ticks in (110, 111, 112)] + [order('buy', 90, bids[MEXC_TICK_SIZE * 90])]
+        places = [order('sell', ticks) for ticks in (113, 114, 115)] + [order('buy', 90), order('buy', 87)]
+        await batcher.execute(cancels=cancels, places=places)
+
+        asks_after, bids_after = active_ids(mexc_client, 'sell'), active_ids(mexc_client, 'buy')
+        assert set(exchange.orders) == set(asks_after.values()) | set(bids_after.values())
+
+        # the ask whose cancel failed is still live and the place that would have taken its level was held back
+        assert sorted(asks_after) == [MEXC_TICK_SIZE * 110, MEXC_TICK_SIZE * 115]
+        assert asks_after[MEXC_TICK_SIZE * 110] == failing_cancel
+        assert sorted(bids_after) == [MEXC_TICK_SIZE * 88, MEXC_TICK_SIZE * 89, MEXC_TICK_SIZE * 90]
+        assert bids_after[MEXC_TICK_SIZE * 90] != bids[MEXC_TICK_SIZE * 90]
+
+        # every acknowledged place is recorded, also those of a call in which other requests raised
+        assert len(database_client.placed) == 8
+        assert set(asks_after.values()) | set(bids_after.values()) <= set(database_client.placed)
+    finally:
+        await mexc_client.close()
+        await exchange.stop()
+
+
+@pytest.mark.parametrize('use_batch_endpoint', [False, True])
+def test_execute_reconciles_after_errors(use_batch_endpoint: bool):
+    asyncio.run(execute_with_errors(use_batch_endpoint=use_batch_endpoint))
@@ -0,0 +1,171 @@
+import random
+from decimal import Decimal, ROUND_HALF_DOWN, ROUND_HALF_UP, localcontext
+import pytest
+from src.crypto.kucoin.client import KucoinClient
+from src.crypto.market.book import DepthBook, price_to_ticks, size_to_units, ticks_to_price
+from src.crypto.market.calculations import calculate_fair_price, calculate_market_depth, calculate_orderbook_depth, calculate_orderbook_spread, calculate_real_fair_price, subtract_orderbooks
+from src.crypto.mexc.client import MexcClient
+from src.model import OrderBook, OrderLevel, FAIR_PRICE_LEVELS, MEXC_TICK_SIZE
+from src.replay.clients import ReplayDatabaseClient
+
+MID_TICK = 1_000
+PERCENTS = (Decimal('0.5'), Decimal('2'), Decimal('5'))
+SEEDS = (1, 2, 3)
+
+
+@pytest.fixture(autouse=True)
+def precision():
+    # the precision the bot runs with
+    with localcontext() as context:
+        context.prec = 18
+        yield
+
+
+def random_size() -> int:
+    return random.randint(1, 10_000_000) * 10 ** 6
+
+
+def random_level(side: str) -> tuple[int, int]:
+    # mostly near the top of the book, a third of the updates remove a level so the best prices and the mid move
+    distance = int(random.expovariate(1 / 15))
+    tick = MID_TICK + 1 + distance if side == 'ask' else MID_TICK - 1 - distance
+    return tick, 0 if random.random() < 0.3 else random_size()
+
+
+def random_snapshot(levels: int) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+    # levels on random ticks, not every tick has one
+    asks = sorted(random.sample(range(MID_TICK + 1, MID_TICK + 1 + 3 * levels), levels))
+    bids = sorted(random.sample(range(MID_TICK - 3 * levels, MID_TICK), levels), reverse=True)
+    return [(tick, random_size()) for tick in asks], [(tick, random_size()) for tick in bids]
+
+
+def random_own_orders(book: DepthBook) -> OrderBook:
+    # five orders per side on consecutive ticks from the top, sometimes larger than the level they sit on
+    asks = [OrderLevel(id=f'a{i}', price=ticks_to_price(book.best_ask + i), size=Decimal(random.randint(0, 200_000))) for i in range(5)]
+    bids = [OrderLevel(id=f'b{i}', price=ticks_to_price(book.best_bid - i), size=Decimal(random.randint(0, 200_000))) for i in range(5)]
+    return OrderBook(asks=asks, bids=bids)
+
+
+def assert_matches_rescans(book: DepthBook):
+    orderbook = book.to_orderbook()
+    for percent in PERCENTS:
+        assert book.analytics.market_depth(percent) == calculate_orderbook_depth(orderbook=orderbook, percent=percent), percent
+    assert book.analytics.spread == calculate_orderbook_spread(orderbook=orderbook)
+    assert book.analytics.real_fair_price() == calculate_real_fair_price(book.to_orderbook(depth=FAIR_PRICE_LEVELS))
+
+    if book.best_ask is None or book.best_bid is None:
+        return
+
+    own_orders = random_own_orders(book)
+    external = book.without(own_orders)
+    assert external.real_fair_price() == calculate_real_fair_price(subtract_orderbooks(book.to_orderbook(depth=FAIR_PRICE_LEVELS), own_orders))
+    subtracted = subtract_orderbooks(orderbook, own_orders)
+    assert list(external.asks()) == [(price_to_ticks(level.price), size_to_units(level.size)) for level in subtracted.asks]
+    assert list(external.bids()) == [(price_to_ticks(level.price), size_to_units(level.size)) for level in subtracted.bids]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_random_snapshots(seed: int):
+    random.seed(seed)
+    book = DepthBook()
+    for version in range(200):
+        asks, bids = random_snapshot(levels=random.randint(1, 300))
+        # sometimes a side is empty
+        if random.random() < 0.05:
+            asks = []
+        elif random.random() < 0.05:
+            bids = []
+        book.load_snapshot(version, asks, bids)
+        assert_matches_rescans(book)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_random_diffs(seed: int):
+    random.seed(seed)
+    book = DepthBook()
+    book.load_snapshot(0, *random_snapshot(levels=200))
+
+    for version in range(1, 500):
+        asks = [random_level('ask') for _ in range(random.randint(0, 3))]
+        bids = [random_level('bid') for _ in range(random.randint(0, 3))]
+        book.apply_diff(version, version, asks, bids)
+        assert_matches_rescans(book)
+
+
+@pytest.mark.parametrize('percent', [Decimal('1'), Decimal('2'), Decimal('2.5'), Decimal('5')])
+@pytest.mark.parametrize('spread_ticks', [2, 3])
+def test_market_depth_at_window_edges(percent: Decimal, spread_ticks: int):
+    # a level on every tick around the mid, with an even spread the bounds at +-percent of the mid fall exactly on a
+    # tick and the levels on them count, then the levels at the bounds are removed one after the other
+    random.seed(int(percent * 10) + spread_ticks)
+    best_ask = MID_TICK + spread_ticks // 2 + spread_ticks % 2
+    best_bid = best_ask - spread_ticks
+    asks = [(tick, random_size()) for tick in range(best_ask, best_ask + 200)]
+    bids = [(tick, random_size()) for tick in range(best_bid, best_bid - 200, -1)]
+    book = DepthBook()
+    book.load_snapshot(0, asks, bids)
+    assert_matches_rescans(book)
+
+    mid = (ticks_to_price(best_ask) + ticks_to_price(best_bid)) / 2
+    upper, lower = price_to_ticks(mid * (1 + percent / 100)), price_to_ticks(mid * (1 - percent / 100))
+    for version, (ask_tick, bid_tick) in enumerate([(upper, lower), (upper + 1, lower - 1), (upper - 1, lower + 1)], start=1):
+        book.apply_diff(version, version, [(ask_tick, 0)], [(bid_tick, 0)])
+        assert book.analytics.market_depth(percent) == calculate_orderbook_depth(orderbook=book.to_orderbook(), percent=percent)
+
+
+def reference_fair_price(mexc_book: OrderBook, own_orders: OrderBook, kucoin_book: OrderBook, percent: Decimal) -> tuple:
+    # calculate_fair_price as it was before BookAnalytics and ExternalBook, every value rescanned from the books
+    real_fair_price = calculate_real_fair_price(subtract_orderbooks(OrderBook(asks=mexc_book.asks[:FAIR_PRICE_LEVELS], bids=mexc_book.bids[:FAIR_PRICE_LEVELS]), own_orders))
+    real_fair_price = Decimal(real_fair_price).quantize(MEXC_TICK_SIZE)
+
+    if len(mexc_book.asks) == 0 or len(mexc_book.bids) == 0 or len(kucoin_book.asks) == 0:
+        return None, None
+
+    mexc_mid_price = (mexc_book.asks[0].price + mexc_book.bids[0].price) / 2
+    kucoin_mid_price = (kucoin_book.asks[0].price + kucoin_book.bids[0].price) / 2
+    kucoin_liquidity = calculate_orderbook_depth(orderbook=kucoin_book, percent=percent)
+    mexc_liquidity = calculate_orderbook_depth(orderbook=mexc_book, percent=percent)
+
+    fair_price = ((mexc_mid_price * mexc_liquidity + kucoin_mid_price * kucoin_liquidity) / (mexc_liquidity + kucoin_liquidity)).quantize(MEXC_TICK_SIZE, rounding=ROUND_HALF_UP)
+    if fair_price > kucoin_book.asks[0].price:
+        fair_price = kucoin_book.asks[0].price.quantize(MEXC_TICK_SIZE, rounding=ROUND_HALF_DOWN)
+    if fair_price < kucoin_book.bids[0].price:
+        fair_price = kucoin_book.bids[0].price.quantize(MEXC_TICK_SIZE, rounding=ROUND_HALF_UP)
+    return fair_price, real_fair_price
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_market_depth_and_fair_price_of_clients(seed: int):
+    random.seed(seed)
+    database_client = ReplayDatabaseClient()
+    mexc_client = MexcClient(api_key='', api_secret='', database_client=database_client)
+    kucoin_client = KucoinClient(api_key='', api_secret='', api_passphrase='', database_client=database_client)
+
+    mexc_client.orderbook.load_snapshot(0, *random_snapshot(levels=100))
+    for version in range(1, 300):
+        asks = [random_level('ask') for _ in range(random.randint(0, 3))]
+        bids = [random_level('bid') for _ in range(random.randint(0, 3))]
+        mexc_client.orderbook.apply_diff(version, version, asks, bids)
+
+        # KuCoin quotes around the same mid a few ticks apart so the fair price is clamped to its top of book at times
+        offset = random.randint(-3, 3)
+        kucoin_client.orderbook = OrderBook(
+            asks=[OrderLevel(id='', price=ticks_to_price(MID_TICK + offset + 1 + i), size=Decimal(random.randint(1, 10_000_000))) for i in range(50)],
+            bids=[OrderLevel(id='', price=ticks_to_price(MID_TICK + offset - 1 - i), size=Decimal(random.randint(1, 10_000_000))) for i in range(50)]
+        )
+
+        mexc_client.active_orders.clear()
+        if mexc_client.orderbook.best_ask is not None and mexc_client.orderbook.best_bid is not None:
+            for order in random_own_orders(mexc_client.orderbook).asks:
+                mexc_client.active_orders.add(side='sell', order_id=order.id, price=order.price, size=order.size)
+            for order in random_own_orders(mexc_client.orderbook).bids:
+                mexc_client.active_orders.add(side='buy', order_id=order.id, price=order.price, size=order.size)
+
+        mexc_book = mexc_client.orderbook.to_orderbook()
+        for percent in PERCENTS:
+            assert calculate_market_depth(client=mexc_client, percent=percent) == calculate_orderbook_depth(orderbook=mexc_book, percent=percent)
+            assert calculate_market_depth(client=kucoin_client, percent=percent) == calculate_orderbook_depth(orderbook=kucoin_client.orderbook, percent=percent)
+
+        state = mexc_client.get_state()
+        expected = reference_fair_price(mexc_book=mexc_book, own_orders=state.active_orders, kucoin_book=kucoin_client.orderbook, percent=Decimal('2'))
+        assert calculate_fair_price(mexc_client=mexc_client, kucoin_client=kucoin_client, active_asks=state.active_orders.asks, active_bids=state.active_orders.bids, percent=Decimal('2')) == expected, version
@@ -0,0 +1,177 @@
+import asyncio
+import copy
+import random
+import tempfile
+from decimal import Decimal, localcontext
+import pytest
+from benchmarks.fixed_point import make_archive
+from src.crypto.kucoin.client import KucoinClient, KUCOIN_TICK_SIZE
+from src.crypto.market import tracking
+from src.crypto.market.book import ticks_to_price, units_to_size
+from src.crypto.market.calculations import get_quotes, get_quote_ticks, quote_parameters, tick_scale
+from src.crypto.market.tracking import check_market_depth, check_market_depth_fixed, manage_orders, manage_orders_fixed, process_tick
+from src.crypto.mexc.client import MexcClient
+from src.model import EventType, OrderBook, OrderLevel, QueueEvent, QueueTick, Symbol, DEFAULT_SYMBOL
+from src.replay.clients import ReplayDatabaseClient, ReplayMexcClient, SimulatedClock
+from src.replay.engine import ReplayEngine
+
+SEEDS = (1, 2, 3)
+# the tick of the running pair and a coarser one, both whole multiples of the KuCoin tick
+SYMBOLS = (DEFAULT_SYMBOL, Symbol(base=DEFAULT_SYMBOL.base, quote=DEFAULT_SYMBOL.quote, tick_size=Decimal('0.0001')))
+# finer than the KuCoin tick and not evenly divided by it
+FINE_TICK_SYMBOLS = (Symbol(base='FINE', quote='USDT', tick_size=Decimal('0.000000001')), Symbol(base='ODD', quote='USDT', tick_size=Decimal('0.000000015')))
+
+
+@pytest.fixture(autouse=True)
+def precision():
+    # the precision the bot runs with
+    with localcontext() as context:
+        context.prec = 18
+        yield
+
+
+def random_state(rng: random.Random, mexc_clients: list[MexcClient], kucoin_client: KucoinClient, fixed_kucoin_client: KucoinClient, min_levels: int = 0):
+    # the same MEXC book and balance on every client, KuCoin levels within a few MEXC ticks of the MEXC mid, thin MEXC
+    # books leave less than the expected market depth within 2 % of the mid
+    mid = rng.randint(500, 1500)
+    spread = rng.randint(1, 4)
+    max_units = 10 ** rng.randint(10, 14)
+    mexc_asks = [(mid + spread + i, rng.randint(1, max_units)) for i in range(rng.randint(min_levels, 60))]
+    mexc_bids = [(mid - i, rng.randint(1, max_units)) for i in range(rng.randint(min_levels, 60))]
+    balance = {
+        'RMV': {'free': units_to_size(rng.randint(0, 10 ** 14)), 'locked': units_to_size(rng.randint(0, 10 ** 13))},
+        'USDT': {'free': units_to_size(rng.randint(0, 10 ** 11)), 'locked': Decimal('0')}
+    }
+    for mexc_client in mexc_clients:
+        mexc_client.orderbook.load_snapshot(mexc_client.orderbook.version + 1, mexc_asks, mexc_bids)
+        mexc_client.balance = copy.deepcopy(balance)
+
+    scale = tick_scale(mexc_clients[0].symbol)
+    kucoin_mid = mid * scale + rng.randint(-3 * scale, 3 * scale)
+    # one level per tick, a DepthBook keeps only the last of two levels on the same tick where an OrderBook keeps both
+    asks = sorted({kucoin_mid + 50 + i * rng.randint(1, 40): rng.randint(1, 10 ** 13) for i in range(rng.randint(min_levels, 50))}.items())
+    bids = sorted({kucoin_mid - 50 - i * rng.randint(1, 40): rng.randint(1, 10 ** 13) for i in range(rng.randint(min_levels, 50))}.items(), reverse=True)
+    kucoin_client.orderbook = OrderBook(
+        asks=[OrderLevel(id='', price=ticks_to_price(tick, KUCOIN_TICK_SIZE), size=units_to_size(units)) for tick, units in asks],
+        bids=[OrderLevel(id='', price=ticks_to_price(tick, KUCOIN_TICK_SIZE), size=units_to_size(units)) for tick, units in bids]
+    )
+    fixed_kucoin_client.orderbook.load_snapshot(fixed_kucoin_client.orderbook.version + 1, asks, bids)
+
+
+def kucoin_clients(database_client: ReplayDatabaseClient) -> tuple[KucoinClient, KucoinClient]:
+    kucoin_client = KucoinClient(api_key='', api_secret='', api_passphrase='', database_client=database_client)
+    fixed_kucoin_client = KucoinClient(api_key='', api_secret='', api_passphrase='', database_client=database_client, fixed_point=True)
+    return kucoin_client, fixed_kucoin_client
+
+
+@pytest.mark.parametrize('symbol', SYMBOLS, ids=lambda symbol: str(symbol.tick_size))
+@pytest.mark.parametrize('seed', SEEDS)
+def test_quotes_match_decimal(seed: int, symbol: Symbol):
+    rng = random.Random(seed)
+    database_client = ReplayDatabaseClient()
+    mexc_client = MexcClient(api_key='', api_secret='', database_client=database_client, symbol=symbol)
+    kucoin_client, fixed_kucoin_client = kucoin_clients(database_client)
+
+    quoted = 0
+    for i in range(2_000):
+        random_state(rng, [mexc_client], kucoin_client, fixed_kucoin_client)
+        try:
+            ask_price, bid_price = get_quotes(mexc_client=mexc_client, kucoin_client=kucoin_client)
+        except (ArithmeticError, IndexError):
+            # an empty side or no liquidity within 2 % of the mid, the fixed-point version quotes nothing
+            ask_price, bid_price = None, None
+        ask_ticks, bid_ticks = get_quote_ticks(mexc_client=mexc_client, kucoin_client=fixed_kucoin_client)
+
+        if ask_price is None:
+            assert ask_ticks is None and bid_ticks is None, i
+            continue
+        assert (ticks_to_price(ask_ticks, symbol.tick_size), ticks_to_price(bid_ticks, symbol.tick_size)) == (ask_price, bid_price), i
+        quoted += 1
+
+    assert quoted > 1_000
+
+
+async def manage_both(seed: int):
+    # the Decimal and fixed-point versions run on two replay clients that start from the same books, balances and
+    # orders, with the same random order sizes they have to send the same requests and keep the same orders
+    rng = random.Random(seed)
+    database_client = ReplayDatabaseClient()
+    clock = SimulatedClock()
+    mexc_client = ReplayMexcClient(database_client=database_client, add_to_event_queue=None, clock=clock)
+    fixed_mexc_client = ReplayMexcClient(database_client=database_client, add_to_event_queue=None, clock=clock)
+    kucoin_client, fixed_kucoin_client = kucoin_clients(database_client)
+
+    topped_up = 0
+    for i in range(300):
+        random_state(rng, [mexc_client, fixed_mexc_client], kucoin_client, fixed_kucoin_client, min_levels=1)
+        clock.now_ns = i
+
+        random.seed(i)
+        await manage_orders(mexc_client=mexc_client, kucoin_client=kucoin_client, database_client=database_client)
+        random.seed(i)
+        await manage_orders_fixed(mexc_client=fixed_mexc_client, kucoin_client=fixed_kucoin_client, database_client=database_client)
+        assert fixed_mexc_client.sent_orders == mexc_client.sent_orders, i
+
+        sent = len(mexc_client.sent_orders)
+        random.seed(i)
+        depth = await check_market_depth(mexc_client=mexc_client, database_client=database_client, percent=Decimal(2), expected_market_depth=DEFAULT_SYMBOL.expected_market_depth)
+        random.seed(i)
+        fixed_depth = await check_market_depth_fixed(mexc_client=fixed_mexc_client, database_client=database_client, percent=Decimal(2), expected_market_depth=DEFAULT_SYMBOL.expected_market_depth)
+        assert fixed_depth == depth, i
+        assert fixed_mexc_client.sent_orders == mexc_client.sent_orders, i
+        topped_up += len(mexc_client.sent_orders) > sent
+
+        assert fixed_mexc_client.active_orders.snapshot() == mexc_client.active_orders.snapshot(), i
+
+    assert len(mexc_client.sent_orders) > 0 and topped_up > 0
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_manage_orders_and_market_depth_match_decimal(seed: int):
+    asyncio.run(manage_both(seed))
+
+
+async def replay(directory: str, fixed_point: bool) -> list:
+    balance = {'RMV': {'free': Decimal('500000'), 'locked': Decimal('0')}, 'USDT': {'free': Decimal('5000'), 'locked': Decimal('0')}}
+    engine = ReplayEngine(archive_dir=directory, balance=balance, fixed_point=fixed_point, seed=1)
+    try:
+        await engine.run()
+    finally:
+        engine.close()
+    return engine.mexc_client.sent_orders
+
+
+def test_replay_sends_the_same_orders():
+    with tempfile.TemporaryDirectory() as directory:
+        make_archive(directory, minutes=2)
+        sent_orders = asyncio.run(replay(directory, fixed_point=False))
+        assert len(sent_orders) > 0
+        assert asyncio.run(replay(directory, fixed_point=True)) == sent_orders
+
+
+@pytest.mark.parametrize('symbol', FINE_TICK_SYMBOLS, ids=lambda symbol: str(symbol.tick_size))
+def test_fine_tick_falls_back_to_decimal(symbol: Symbol, monkeypatch: pytest.MonkeyPatch):
+    assert tick_scale(symbol) is None
+    with pytest.raises(ValueError):
+        quote_parameters(symbol)
+
+    called = []
+
+    async def record(name: str, **kwargs):
+        called.append(name)
+
+    async def fail(**kwargs):
+        raise AssertionError('fixed point used for a symbol with a fine tick')
+
+    monkeypatch.setattr(tracking, 'manage_orders', lambda **kwargs: record('manage_orders', **kwargs))
+    monkeypatch.setattr(tracking, 'check_market_depth', lambda **kwargs: record('check_market_depth', **kwargs))
+    monkeypatch.setattr(tracking, 'manage_orders_fixed', fail)
+    monkeypatch.setattr(tracking, 'check_market_depth_fixed', fail)
+
+    database_client = ReplayDatabaseClient()
+    mexc_client = MexcClient(api_key='', api_secret='', database_client=database_client, symbol=symbol)
+    fixed_kucoin_client = KucoinClient(api_key='', api_secret='', api_passphrase='', database_client=database_client, fixed_point=True, symbol=symbol)
+    tick = QueueTick(mexc_update=QueueEvent(type=EventType.MEXC_ORDERBOOK_UPDATE, data=None))
+    asyncio.run(process_tick(tick=tick, mexc_client=mexc_client, kucoin_client=fixed_kucoin_client, database_client=database_client, fixed_point=True))
+
+    assert called == ['manage_orders', 'check_market_depth']
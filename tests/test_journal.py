@@ -0,0 +1,93 @@
+import asyncio
+import os
+import tempfile
+import threading
+from src.database.journal import Journal, read_records
+from src.model import FsyncPolicy
+
+
+class HeldFsync:
+    # os.fsync of the interval task waits until it is released, the loop meanwhile appends, rolls and closes the journal
+    def __init__(self):
+        self.fsync = os.fsync
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.returned = threading.Event()
+        self.fail = False
+        self.errors: list[OSError] = []
+
+    def __call__(self, fd: int):
+        if threading.current_thread() is threading.main_thread():
+            return self.fsync(fd)
+
+        self.entered.set()
+        self.released.wait(timeout=10)
+        try:
+            if self.fail:
+                raise OSError(5, 'Input/output error')
+            self.fsync(fd)
+        except OSError as e:
+            self.errors.append(e)
+            raise
+        finally:
+            self.entered.clear()
+            self.released.clear()
+            self.returned.set()
+
+    async def hold(self):
+        assert await asyncio.to_thread(self.entered.wait, 10)
+
+    async def release(self):
+        self.returned.clear()
+        self.released.set()
+        assert await asyncio.to_thread(self.returned.wait, 10)
+        # the task resumes from the thread's result on the next iterations of the loop
+        await asyncio.sleep(0.01)
+
+
+async def sync_while_rolling(directory: str, held: HeldFsync):
+    journal = Journal(directory=directory, fsync_policy=FsyncPolicy.INTERVAL, fsync_interval=0.01)
+    journal.start()
+
+    journal.append('mexc_orderbook', (1,))
+    await held.hold()
+    # appended while the thread syncs, the journal stays dirty
+    journal.append('mexc_orderbook', (2,))
+    await held.release()
+    assert held.errors == [] and journal.dirty
+
+    # the file whose descriptor the thread syncs is closed by roll
+    await held.hold()
+    journal.roll()
+    journal.append('mexc_orderbook', (3,))
+    await held.release()
+    assert held.errors == [] and journal.dirty
+
+    # a failed fsync is logged, the task keeps running and retries
+    held.fail = True
+    await held.hold()
+    await held.release()
+    assert len(held.errors) == 1 and journal.dirty
+    assert not journal.fsync_task.done()
+
+    held.fail = False
+    await held.hold()
+    await held.release()
+    assert len(held.errors) == 1 and not journal.dirty
+
+    # closed while the thread syncs
+    journal.append('mexc_orderbook', (4,))
+    await held.hold()
+    task = journal.fsync_task
+    journal.close()
+    await held.release()
+    assert len(held.errors) == 1 and task.done()
+
+
+def test_fsync_survives_roll_close_and_errors(monkeypatch):
+    held = HeldFsync()
+    monkeypatch.setattr(os, 'fsync', held)
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(sync_while_rolling(directory, held))
+        assert [row for _, row in read_records(directory)] == [[1], [2], [3], [4]]
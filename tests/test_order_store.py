@@ -0,0 +1,60 @@
+import random
+from decimal import Decimal
+import pytest
+from benchmarks.order_store import ListOrders, make_operations, ORDERS_PER_SIDE
+from src.crypto.market import orders
+from src.crypto.market.book import own_depth, ticks_to_price
+from src.crypto.market.orders import ActiveOrderStore
+
+
+@pytest.fixture(params=[2, orders.CHUNK_SIZE], ids=lambda chunk_size: f'chunk{chunk_size}')
+def chunk_size(request, monkeypatch):
+    # tiny chunks split and empty all the time
+    monkeypatch.setattr(orders, 'CHUNK_SIZE', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('orders_per_side', ORDERS_PER_SIDE)
+def test_snapshots_match_sorted_lists(orders_per_side: int, chunk_size: int):
+    # the same orders in the same order after every operation, and the units per tick used by ExternalBook
+    random.seed(orders_per_side)
+    lists = ListOrders()
+    store = ActiveOrderStore()
+
+    for i, operation in enumerate(make_operations(orders_per_side)[:2_000]):
+        if operation[0] == 'add':
+            lists.add(*operation[1:])
+            store.add(side=operation[1], order_id=operation[2], price=operation[3], size=operation[4])
+        elif operation[0] == 'remove':
+            lists.remove(*operation[1:])
+            store.remove(order_id=operation[2])
+        else:
+            lists.resize(*operation[1:])
+            store.resize(order_id=operation[2], size=operation[3])
+
+        snapshot = store.snapshot()
+        assert snapshot == lists.orders, i
+        assert store.ask_side.depth == own_depth(snapshot.asks) and store.bid_side.depth == own_depth(snapshot.bids), i
+        assert len(store.ask_side) == len(snapshot.asks) and len(store.bid_side) == len(snapshot.bids), i
+
+
+def test_remove_every_order(chunk_size: int):
+    # orders on a few ticks removed in random order until both sides are empty, then refilled
+    random.seed(chunk_size)
+    store = ActiveOrderStore()
+    for _ in range(2):
+        ids = []
+        for i in range(300):
+            side = random.choice(('sell', 'buy'))
+            price = ticks_to_price(1_000 + random.randint(1, 5) if side == 'sell' else 1_000 - random.randint(1, 5))
+            assert store.add(side=side, order_id=str(i), price=price, size=Decimal(random.randint(1, 5_000)))
+            ids.append(str(i))
+
+        random.shuffle(ids)
+        for order_id in ids:
+            order = store.get(order_id)
+            assert store.remove(order_id) == order
+
+        assert store.snapshot().asks == [] and store.snapshot().bids == []
+        for side in (store.ask_side, store.bid_side):
+            assert len(side) == 0 and side.maxes == [] and side.key_chunks == [] and side.depth == {}
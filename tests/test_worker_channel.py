@@ -0,0 +1,84 @@
+import asyncio
+import multiprocessing
+from decimal import Decimal
+from src.worker import Channel, ShardDatabaseClient, ROWS_BATCH_BYTES
+
+PAYLOAD_BYTES = 4 * 1024 * 1024
+
+
+async def exchange_large_payloads():
+    # both ends queue messages far larger than the pipe buffer before either of them reads, with a blocking send the
+    # first one would never return since the other end reads on the same loop
+    first, second = (Channel(connection) for connection in multiprocessing.Pipe(duplex=True))
+    first.start()
+    second.start()
+
+    try:
+        payload = 'x' * PAYLOAD_BYTES
+        assert first.send('rows', [payload, 1])
+        assert second.send('health', {'payload': payload})
+        assert first.send('stop')
+        assert first.get_stats()['bytes_buffered'] > 0
+
+        assert await asyncio.wait_for(second.receive(), timeout=10) == ['rows', [payload, 1]]
+        assert await asyncio.wait_for(second.receive(), timeout=10) == ['stop', None]
+        assert await asyncio.wait_for(first.receive(), timeout=10) == ['health', {'payload': payload}]
+
+        await first.drain()
+        assert first.get_stats()['bytes_buffered'] == 0
+        assert second.get_stats()['messages_received'] == 2
+    finally:
+        first.close()
+        second.close()
+
+
+async def receive_after_close():
+    first, second = (Channel(connection) for connection in multiprocessing.Pipe(duplex=True))
+    first.start()
+    second.start()
+
+    first.send('health', {'ticks': 1})
+    await first.drain()
+    first.close()
+
+    assert await asyncio.wait_for(second.receive(), timeout=10) == ['health', {'ticks': 1}]
+    assert await asyncio.wait_for(second.receive(), timeout=10) is None
+    assert not second.send('health', {'ticks': 2})
+    second.close()
+
+
+async def send_rows_in_batches():
+    # rows are flushed once their encoded size reaches ROWS_BATCH_BYTES and arrive as the supervisor reads them
+    worker, supervisor = (Channel(connection) for connection in multiprocessing.Pipe(duplex=True))
+    worker.start()
+    supervisor.start()
+    database_client = ShardDatabaseClient(channel=worker)
+
+    rows = [('mexc_orderbook', ('MEXC', 'RMV-USDT', '2024-01-01 00:00:00', *[Decimal('0.00123'), Decimal(i)] * 10)) for i in range(2000)]
+    for table, row in rows:
+        await database_client.put(table, row)
+    database_client.flush()
+
+    received = []
+    while len(received) < len(rows):
+        kind, payload = await asyncio.wait_for(supervisor.receive(), timeout=10)
+        assert kind == 'rows'
+        received.extend((table, tuple(row)) for table, row in payload)
+
+    assert received == [(table, tuple(str(value) if isinstance(value, Decimal) else value for value in row)) for table, row in rows]
+    assert worker.messages_sent > 1
+    assert worker.bytes_sent / worker.messages_sent < ROWS_BATCH_BYTES + 1024
+    worker.close()
+    supervisor.close()
+
+
+def test_large_payloads_do_not_block_the_sender():
+    asyncio.run(exchange_large_payloads())
+
+
+def test_receive_after_close():
+    asyncio.run(receive_after_close())
+
+
+def test_rows_are_batched_by_size():
+    asyncio.run(send_rows_in_batches())
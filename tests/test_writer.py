@@ -0,0 +1,43 @@
+import asyncio
+from src.database.writer import TableWriter
+from src.model import OverflowPolicy
+
+
+class FailingPool:
+    def acquire(self):
+        raise ConnectionError('database unavailable')
+
+
+async def put_without_pool():
+    # nothing would ever flush the buffer, the oldest rows are dropped instead of waiting
+    writer = TableWriter(table='mexc_orderbook', columns=['price'], max_buffer=3, overflow_policy=OverflowPolicy.BLOCK)
+    for i in range(5):
+        await asyncio.wait_for(writer.put((i,)), timeout=1)
+
+    assert list(writer.buffer) == [(2,), (3,), (4,)]
+    assert writer.get_stats()['dropped'] == 2
+
+
+async def put_until_closed():
+    # with a pool the put waits for a flush, closing the writer releases it
+    writer = TableWriter(table='mexc_orderbook', columns=['price'], max_buffer=3, overflow_policy=OverflowPolicy.BLOCK, flush_interval=0.01)
+    writer.start(pool=FailingPool())
+    for i in range(3):
+        await writer.put((i,))
+
+    put = asyncio.create_task(writer.put((3,)))
+    await asyncio.sleep(0.1)
+    assert not put.done()
+
+    await writer.close()
+    await asyncio.wait_for(put, timeout=1)
+    assert list(writer.buffer) == [(1,), (2,), (3,)]
+    assert writer.get_stats()['failed_flushes'] > 0
+
+
+def test_block_without_pool_drops_oldest():
+    asyncio.run(put_without_pool())
+
+
+def test_close_releases_blocked_put():
+    asyncio.run(put_until_closed())